@@ -1,4 +1,4 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
 from flask_cors import CORS
 from flask_session import Session
 from routes.user_routes import user_bp
@@ -6,25 +6,25 @@ from routes.event_routes import event_bp
 from routes.emergency_routes import emergency_bp
 from routes.family_routes import family_bp
 from routes.chatbot_routes import fitness_bp
+from routes.job_routes import job_bp
 import os
 from dotenv import load_dotenv
-from utils.model_loader import ModelLoader
+from utils import ai_stack
 from utils.db import DatabaseConnection
-import logging
-from config import API_CONFIG, LOGGING, SECURITY_CONFIG
-from services.notification_service import socketio
+from utils.job_queue import JobQueue
+from utils.llm_client import validate_api_key, check_backend_reachable
+from utils.model_manifest import model_dir, verify_manifest
+from utils import request_timing, structured_logging
+from config import API_CONFIG, SECURITY_CONFIG, AI_STACK_SETTINGS, MODEL_SETTINGS
+from services.notification_service import socketio, init_socketio
 from datetime import datetime
 
 # Load environment variables
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(
-    level=LOGGING['level'],
-    format=LOGGING['format'],
-    filename=LOGGING['file']
-)
-logger = logging.getLogger(__name__)
+structured_logging.configure_logging()
+logger = structured_logging.get_logger(__name__)
 
 def create_app():
     app = Flask(__name__)
@@ -44,6 +44,9 @@ def create_app():
     app.config['PERMANENT_SESSION_LIFETIME'] = SECURITY_CONFIG['session_lifetime']
     Session(app)
     
+    # Correlation id per request, echoed in the X-Request-ID response header
+    structured_logging.init_app(app)
+    
     # Initialize database connection
     try:
         db = DatabaseConnection.get_instance()
@@ -52,14 +55,19 @@ def create_app():
         logger.error(f"Failed to initialize database connection: {str(e)}")
         raise
     
-    # Initialize model loader and pre-download models
+    # The AI stack (LangChain, Chroma, torch) is imported on first use so CRUD-only
+    # workers never load it. With AI_PRELOAD=true each worker warms it up in the
+    # background after its first request (usually the /ready probe); nothing blocks startup.
+    if AI_STACK_SETTINGS['preload']:
+        app.before_request(ai_stack.ensure_warmup)
+    
+    # Validate the Groq API key once per process instead of once per trainer
     try:
-        logger.info("Initializing model loader and pre-downloading models...")
-        model_loader = ModelLoader()
-        logger.info("Model initialization complete")
+        validate_api_key()
+        logger.info("Groq API key validated")
     except Exception as e:
-        logger.error(f"Failed to initialize model loader: {str(e)}")
-        # Don't raise here, as model loading is not critical for basic functionality
+        logger.error(f"Failed to validate Groq API key: {str(e)}")
+        # Don't raise here, non-AI endpoints keep working without the key
     
     # Register blueprints
     app.register_blueprint(user_bp)
@@ -67,27 +75,58 @@ def create_app():
     app.register_blueprint(emergency_bp)
     app.register_blueprint(family_bp)
     app.register_blueprint(fitness_bp)
+    app.register_blueprint(job_bp)
+    
+    # Socket.IO pushes background job results (see routes/job_routes.py)
+    init_socketio(app)
     
-    # Health check endpoint
+    # Server-Timing headers and per-endpoint latency histograms; wraps wsgi_app, so after Socket.IO
+    request_timing.init_app(app)
+    
+    # Liveness probe: the process is up and serving; dependencies are checked by /ready
     @app.route('/health', methods=['GET'])
     def health_check():
+        return jsonify({
+            "status": "healthy",
+            "environment": os.getenv('FLASK_ENV', 'development'),
+            "base_url": API_CONFIG['base_url']
+        }), 200
+    
+    # Readiness probe: database reachable, embedding model usable, LLM backend reachable
+    @app.route('/ready', methods=['GET'])
+    def readiness_check():
+        checks = {}
+        ready = True
+        
         try:
-            # Test database connection
-            db = DatabaseConnection.get_instance()
-            db.get_db().command('ping')
-            return jsonify({
-                "status": "healthy",
-                "environment": os.getenv('FLASK_ENV', 'development'),
-                "base_url": API_CONFIG['base_url'],
-                "database": "connected"
-            }), 200
+            DatabaseConnection.get_instance().get_db().command('ping')
+            checks['database'] = 'connected'
         except Exception as e:
-            logger.error(f"Health check failed: {str(e)}")
-            return jsonify({
-                "status": "unhealthy",
-                "error": str(e),
-                "environment": os.getenv('FLASK_ENV', 'development')
-            }), 500
+            logger.error(f"Readiness database check failed: {str(e)}")
+            checks['database'] = f"error: {str(e)}"
+            ready = False
+        
+        if AI_STACK_SETTINGS['preload']:
+            warmup = ai_stack.get_warmup_status()
+            checks['embedding_model'] = warmup['state'] if not warmup['error'] else f"failed: {warmup['error']}"
+            ready = ready and warmup['state'] == 'ready'
+        else:
+            # Loaded on first use; report whether that will need a download
+            cached = verify_manifest(model_dir(), MODEL_SETTINGS['required_files'])
+            checks['embedding_model'] = 'cached' if cached else 'not cached'
+        
+        try:
+            check_backend_reachable()
+            checks['llm'] = 'reachable'
+        except Exception as e:
+            logger.error(f"Readiness LLM check failed: {str(e)}")
+            checks['llm'] = f"error: {str(e)}"
+            ready = False
+        
+        return jsonify({
+            "status": "ready" if ready else "not ready",
+            "checks": checks
+        }), 200 if ready else 503
     
     # API health check endpoint
     @app.route('/api/health', methods=['GET'])
@@ -111,8 +150,23 @@ def create_app():
                 "environment": os.getenv('FLASK_ENV', 'development')
             }), 500
     
+    # Latency histograms of this worker in Prometheus text format (scrape each worker, or sum by pid)
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(request_timing.get_prometheus_text(), mimetype='text/plain; version=0.0.4')
+    
+    # Per-endpoint p50/p95/p99 of total time and of each phase, for this worker
+    @app.route('/api/metrics/latency', methods=['GET'])
+    def latency_metrics():
+        return jsonify({
+            "pid": os.getpid(),
+            "endpoints": request_timing.get_summary()
+        }), 200
+    
     return app
 
 if __name__ == '__main__':
     app = create_app()
+    # Under gunicorn the post_worker_init hook starts the job runners in each worker
+    JobQueue.get_instance().ensure_started()
     app.run(debug=True)
@@ -0,0 +1,19 @@
+import argparse
+from dotenv import load_dotenv
+from utils.archiver import archive_all
+
+load_dotenv()
+
+def main():
+    """Archive cold fitness history to compressed files and delete it from MongoDB"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--dry-run', action='store_true', help='Count documents without writing or deleting')
+    args = parser.parse_args()
+
+    print("\n=== Archiving cold history ===\n")
+    results = archive_all(dry_run=args.dry_run)
+    for name, stats in results.items():
+        print(f"{name}: {stats['archived']} archived, {stats['deleted']} deleted in {stats['batches']} batches")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Embedding throughput and memory: sentence-transformers (torch) vs ONNX Runtime.
+
+Each backend runs in its own interpreter so peak RSS is measured in isolation:
+
+    python benchmarks/bench_embeddings.py --texts 512 --threads 8
+
+Reports load time, bulk throughput (one call with all texts), concurrent
+throughput (many threads embedding one text each, which the ONNX engine
+batches), peak RSS, and the cosine similarity of each backend's vectors to
+the torch ones.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+PROBE = """
+import json, resource, sys, threading, time
+import numpy as np
+sys.path.insert(0, {root!r})
+backend, texts_count, threads, out_path = {backend!r}, {texts}, {threads}, {out!r}
+texts = [f"Day {{i % 4 + 1}}: {{i % 5 + 2}} sets of squats, push-ups and a {{i % 6 + 1}}0 second plank" * (1 + i % 3)
+         for i in range(texts_count)]
+
+started = time.perf_counter()
+if backend == 'torch':
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from utils.model_manifest import ensure_model_dir
+    model = HuggingFaceEmbeddings(model_name=str(ensure_model_dir()), model_kwargs={{'device': 'cpu'}},
+                                  encode_kwargs={{'normalize_embeddings': True}})
+    encode = lambda batch: np.asarray(model.embed_documents(batch), dtype=np.float32)
+else:
+    from utils.embedding_engine import EmbeddingEngine
+    engine = EmbeddingEngine(quantize=backend == 'onnx-int8')
+    encode = engine.encode
+encode(['warm up'])
+load_seconds = time.perf_counter() - started
+
+started = time.perf_counter()
+vectors = encode(texts)
+bulk = texts_count / (time.perf_counter() - started)
+
+def worker(offset):
+    for i in range(offset, texts_count, threads):
+        encode([texts[i]])
+workers = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+started = time.perf_counter()
+for w in workers:
+    w.start()
+for w in workers:
+    w.join()
+concurrent = texts_count / (time.perf_counter() - started)
+
+np.save(out_path, vectors)
+print(json.dumps({{'load_seconds': load_seconds, 'bulk_per_second': bulk, 'concurrent_per_second': concurrent,
+                  'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+"""
+
+
+def run_backend(root, backend, texts, threads, out_path):
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE.format(root=root, backend=backend, texts=texts, threads=threads, out=out_path)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return {'error': (result.stderr.strip().splitlines() or ['failed'])[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--texts', type=int, default=512)
+    parser.add_argument('--threads', type=int, default=8, help='concurrent callers')
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    tmp_dir = tempfile.mkdtemp(prefix='bench_embeddings_')
+    results = {}
+    for backend in args.backends.split(','):
+        out_path = os.path.join(tmp_dir, f"{backend}.npy")
+        results[backend] = run_backend(root, backend, args.texts, args.threads, out_path)
+        results[backend]['vectors'] = out_path
+
+    reference = np.load(results['torch']['vectors']) if 'error' not in results.get('torch', {'error': 1}) else None
+    print(f"{'backend':<11}{'load s':>8}{'bulk/s':>9}{'conc/s':>9}{'RSS MB':>8}{'cos vs torch':>14}")
+    for backend, stats in results.items():
+        if 'error' in stats:
+            print(f"{backend:<11} failed: {stats['error']}")
+            continue
+        agreement = ''
+        if reference is not None:
+            agreement = f"{float(np.min(np.sum(np.load(stats['vectors']) * reference, axis=1))):.4f} min"
+        print(f"{backend:<11}{stats['load_seconds']:>8.2f}{stats['bulk_per_second']:>9.0f}"
+              f"{stats['concurrent_per_second']:>9.0f}{stats['rss_mb']:>8.0f}{agreement:>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Measure VectorMemory search latency as a user's index grows.
+
+Uses random embeddings so the run needs no model download:
+
+    python benchmarks/bench_vector_memory.py --sizes 100 1000 5000 --dim 384
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.vector_memory import VectorMemory  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    def embed(texts):
+        return rng.standard_normal((len(texts), args.dim)).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        for size in args.sizes:
+            memory = VectorMemory(base_dir=base_dir, embed_fn=embed, max_entries=size)
+            user_key = f"bench-{size}"
+            memory.add_many(user_key, [f"turn {i}" for i in range(size)])
+
+            timings = []
+            for i in range(args.queries):
+                started = time.perf_counter()
+                memory.search(user_key, f"query {i}", k=args.k)
+                timings.append(time.perf_counter() - started)
+
+            timings = np.array(timings) * 1000
+            print(f"entries={size:>6}  p50={np.percentile(timings, 50):.3f}ms  "
+                  f"p95={np.percentile(timings, 95):.3f}ms  max={timings.max():.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Import-time budget check for the web app.
+
+Imports app.py in a fresh interpreter and fails (exit 1) if it takes longer
+than --max-seconds, grows RSS past --max-rss-mb, or loads any of the heavy
+AI modules, which must only be imported on first use through utils.ai_stack:
+
+    python benchmarks/check_import_budget.py --max-seconds 3 --max-rss-mb 150
+
+--create-app also runs create_app() (needs MongoDB) so startup hooks are covered.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ('torch', 'transformers', 'sentence_transformers', 'langchain', 'langchain_community',
+                 'chromadb', 'huggingface_hub', 'models.fitness_trainer', 'utils.model_loader')
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+if {create_app}:
+    app.create_app()
+elapsed = time.perf_counter() - started
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{
+    'seconds': elapsed,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': len(sys.modules),
+    'heavy': heavy
+}}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-seconds', type=float, default=3.0)
+    parser.add_argument('--max-rss-mb', type=float, default=150.0)
+    parser.add_argument('--create-app', action='store_true')
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, 'AI_PRELOAD': 'false'}
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE.format(create_app=args.create_app, heavy=HEAVY_MODULES)],
+        cwd=root, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        sys.exit(result.returncode)
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+
+    print(f"import app: {stats['seconds']:.2f}s, max RSS {stats['rss_mb']:.0f} MB, {stats['modules']} modules")
+    failures = []
+    if stats['seconds'] > args.max_seconds:
+        failures.append(f"import took {stats['seconds']:.2f}s (budget {args.max_seconds}s)")
+    if stats['rss_mb'] > args.max_rss_mb:
+        failures.append(f"RSS {stats['rss_mb']:.0f} MB (budget {args.max_rss_mb:.0f} MB)")
+    if stats['heavy']:
+        failures.append(f"heavy modules imported eagerly: {', '.join(stats['heavy'])}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Concurrent load test for the chat and workout endpoints.
+
+Start the server with the fake backend so no network model is involved:
+
+    LLM_BACKEND=fake FAKE_LLM_LATENCY_MS=800 gunicorn -c gunicorn.conf.py app:app
+    python benchmarks/load_test.py --url http://localhost:5000 --users 16 --duration 60
+
+Each request's X-LLM-Time-Ms header is subtracted from its wall time to
+report our own overhead separately from the (simulated) model's.
+"""
+import argparse
+import threading
+import time
+import uuid
+
+import requests
+
+PROFILE = {
+    'name': 'Load Test', 'age': 30, 'weight': 75, 'height': 180,
+    'fitness_goal': 'muscle gain', 'experience': 'intermediate',
+    'equipment': 'dumbbells', 'limitations': ''
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # endpoint -> list of (wall_ms, llm_ms)
+        self.errors = {}
+
+    def add(self, endpoint, wall_ms, llm_ms):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((wall_ms, llm_ms))
+
+    def error(self, endpoint, status):
+        with self.lock:
+            self.errors.setdefault(endpoint, {}).setdefault(status, 0)
+            self.errors[endpoint][status] += 1
+
+
+def timed(results, endpoint, call):
+    started = time.perf_counter()
+    try:
+        response = call()
+    except requests.RequestException as e:
+        results.error(endpoint, type(e).__name__)
+        return None
+    wall_ms = (time.perf_counter() - started) * 1000
+    if response.status_code >= 400:
+        results.error(endpoint, response.status_code)
+        return response
+    results.add(endpoint, wall_ms, float(response.headers.get('X-LLM-Time-Ms', 0)))
+    return response
+
+
+def user_loop(base_url, deadline, results, chat_ratio):
+    http = requests.Session()
+    http.post(f"{base_url}/api/fitness/session/start", timeout=30)
+    http.post(f"{base_url}/api/fitness/profile", json=PROFILE, timeout=30)
+    turn = 0
+    while time.time() < deadline:
+        turn += 1
+        if turn % chat_ratio:
+            timed(results, 'chat', lambda: http.post(
+                f"{base_url}/api/fitness/chat", json={'message': f"How should I train today? ({turn})"}, timeout=120))
+        else:
+            timed(results, 'generate_workout', lambda: http.post(
+                f"{base_url}/api/fitness/generate_workout",
+                json={**PROFILE, 'user_id': f"loadtest-{uuid.uuid4().hex[:8]}", 'cache': False}, timeout=180))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--duration', type=int, default=30, help='seconds')
+    parser.add_argument('--chat-ratio', type=int, default=4, help='chat turns per workout request')
+    args = parser.parse_args()
+
+    backend = requests.get(f"{args.url}/api/fitness/llm/metrics", timeout=10).json()['metrics']['backend']
+    if backend != 'fake':
+        print(f"Warning: server is using the '{backend}' backend, not LLM_BACKEND=fake")
+
+    results = Results()
+    deadline = time.time() + args.duration
+    threads = [threading.Thread(target=user_loop, args=(args.url, deadline, results, args.chat_ratio))
+               for _ in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{'endpoint':<18}{'n':>6}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'llm p50':>10}"
+          f"{'ovh p50':>10}{'ovh p95':>10}")
+    for endpoint, samples in sorted(results.samples.items()):
+        wall = [w for w, _ in samples]
+        llm = [m for _, m in samples]
+        overhead = [w - m for w, m in samples]
+        print(f"{endpoint:<18}{len(samples):>6}{len(samples) / args.duration:>8.1f}"
+              f"{percentile(wall, 50):>10.0f}{percentile(wall, 95):>10.0f}{percentile(llm, 50):>10.0f}"
+              f"{percentile(overhead, 50):>10.0f}{percentile(overhead, 95):>10.0f}")
+    for endpoint, errors in sorted(results.errors.items()):
+        print(f"errors {endpoint}: {errors}")
+
+
+if __name__ == '__main__':
+    main()
@@ -29,7 +29,14 @@ COLLECTIONS = {
     'sos_alerts': 'sos_alerts',
     'fitness_data': 'fitness_data',
     'notifications': 'notifications',
-    'chat_history': 'chat_history'
+    'chat_history': 'chat_history',
+    'exercise_index': 'exercise_index',
+    'location_history': 'location_history',
+    'llm_cache': 'llm_cache',
+    'jobs': 'jobs',
+    'inflight_requests': 'inflight_requests',
+    'saved_sessions': 'saved_sessions',
+    'saved_session_chunks': 'saved_session_chunks'
 }
 
 # API Configuration
@@ -88,7 +95,9 @@ SOS_SETTINGS = {
 FITNESS_SETTINGS = {
     'workout_types': ['running', 'walking', 'cycling', 'swimming', 'gym'],
     'max_history_days': 365,
-    'goal_types': ['steps', 'distance', 'calories', 'duration']
+    'goal_types': ['steps', 'distance', 'calories', 'duration'],
+    'recent_exercise_days': 14,  # Window for "avoid repeating recent exercises"
+    'progression_exercises': 3  # Number of recent exercises to report progress on
 }
 
 # Cache Settings
@@ -100,11 +109,244 @@ CACHE_SETTINGS = {
     'ttl': 3600  # 1 hour
 }
 
+# LLM Client Settings
+LLM_SETTINGS = {
+    'backend': os.getenv('LLM_BACKEND', 'groq').lower(),  # groq or fake
+    'model': os.getenv('GROQ_MODEL', 'llama3-70b-8192'),
+    'timeout': 60,  # seconds per request
+    'max_connections': 8,  # Matches 2 workers x 4 threads
+    'max_keepalive_connections': 4,
+    'keepalive_expiry': 30,  # seconds
+    'json_plans': os.getenv('LLM_JSON_PLANS', 'True').lower() == 'true',  # Request plans as schema-shaped JSON
+    'ready_check_interval': 30  # Seconds a successful /ready reachability check is reused
+}
+
+# LLM Concurrency and Retry Settings
+LLM_LIMIT_SETTINGS = {
+    'max_concurrent': int(os.getenv('LLM_MAX_CONCURRENT', 4)),  # In-flight LLM calls per process
+    'rate_per_second': float(os.getenv('LLM_RATE_PER_SECOND', 2)),  # Token bucket refill rate per process
+    'burst': 4,  # Token bucket size
+    'cluster_rate_per_second': float(os.getenv('LLM_CLUSTER_RATE_PER_SECOND', 0)),  # Redis-backed; 0 disables
+    'queue_timeout': 15,  # Seconds a call may wait for a slot before failing
+    'max_retries': 3,  # Retries after a 429
+    'backoff_base': 0.5,  # Seconds, doubled per retry when the provider sends no hint
+    'backoff_max': 10,
+    'retry_budget': 30  # Seconds of total waiting across retries before giving up
+}
+
+# Fake LLM Backend Settings (LLM_BACKEND=fake, for load tests without the network)
+FAKE_LLM_SETTINGS = {
+    'latency_ms': float(os.getenv('FAKE_LLM_LATENCY_MS', 800)),  # Median time to first token
+    'latency_distribution': os.getenv('FAKE_LLM_LATENCY_DIST', 'lognormal'),  # fixed, uniform, lognormal, exponential
+    'token_ms': float(os.getenv('FAKE_LLM_TOKEN_MS', 20)),  # Per streamed word
+    'rate_limit_rate': float(os.getenv('FAKE_LLM_429_RATE', 0)),  # Share of calls rejected with 429
+    'seed': None
+}
+
+# Trainer Session Store Settings
+SESSION_STORE_SETTINGS = {
+    'max_entries': int(os.getenv('SESSION_STORE_MAX_ENTRIES', 200)),  # Trainers kept per worker
+    'max_bytes': int(os.getenv('SESSION_STORE_MAX_BYTES', 32 * 1024 * 1024)),  # Approximate memory cap
+    'idle_ttl': 1800,  # Seconds before an idle session is spilled to chat_history
+    'spill_ttl_days': 30  # Spilled sessions are deleted after this long without use
+}
+
+# Saved Session Settings
+# Sessions saved from the trainer live in saved_sessions (metadata) and
+# saved_session_chunks (compressed batches of messages, streamed on load).
+SAVED_SESSION_SETTINGS = {
+    'chunk_messages': 200,  # Messages per compressed chunk
+    'list_limit': 20  # Most recent saved sessions offered by choose_session_to_load
+}
+
+# LLM Response Cache Settings
+LLM_CACHE_SETTINGS = {
+    'enabled': os.getenv('LLM_CACHE_ENABLED', 'True').lower() == 'true',
+    'ttl': 7 * 24 * 3600,  # seconds
+    'max_local_entries': 500,  # In-process LRU entries per worker
+    'max_response_bytes': 32 * 1024
+}
+
+# Chat Memory Settings
+CHAT_MEMORY_SETTINGS = {
+    'backend': os.getenv('CHAT_MEMORY_BACKEND', 'mongo'),  # 'mongo' or 'local'
+    'max_messages': 50  # Latest messages kept per conversation document
+}
+
+# Vector Memory Settings
+VECTOR_MEMORY_SETTINGS = {
+    'enabled': os.getenv('VECTOR_MEMORY_ENABLED', 'True').lower() == 'true',
+    'index_dir': os.getenv('VECTOR_MEMORY_DIR'),  # Defaults to <tmp>/fitness_vector_memory
+    'batch_size': 4,  # Turns buffered before embedding in one batch
+    'top_k': 3,  # Relevant past turns added to the prompt
+    'recent_messages': 4,  # Latest buffer messages always included
+    'max_entries_per_user': 2000,
+    # Index files untouched this long are deleted, like spilled sessions in chat_history
+    'max_age_days': int(os.getenv('VECTOR_MEMORY_MAX_AGE_DAYS', 30)),
+    'sweep_interval': 3600  # Seconds between age sweeps in each process
+}
+
+# Request Timing Settings
+# utils/request_timing.py times session, mongo, llm, embed, serialize and notify phases of
+# each request, returns them in a Server-Timing header and keeps per-endpoint histograms
+# (GET /metrics for Prometheus, GET /api/metrics/latency for p50/p95/p99).
+REQUEST_TIMING_SETTINGS = {
+    'enabled': os.getenv('REQUEST_TIMING', 'True').lower() == 'true',
+    'server_timing_header': os.getenv('SERVER_TIMING_HEADER', 'True').lower() == 'true',
+    # Histogram bucket upper bounds in seconds
+    'buckets': [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+}
+
+# Embedding Service Settings
+# gunicorn starts one embedding sidecar per host (utils/embedding_service.py) that owns the
+# model; workers send encode requests over a Unix socket instead of loading their own copy.
+EMBEDDING_SERVICE_SETTINGS = {
+    'enabled': os.getenv('EMBEDDING_SERVICE', 'True').lower() == 'true',
+    'socket_path': os.getenv('EMBEDDING_SOCKET', '/tmp/fitness_embeddings.sock'),
+    'timeout': 30,  # Seconds per encode request
+    'connect_timeout': 120,  # Seconds a worker waits, once, for a starting sidecar to load the model
+    'retry_delay': 1,  # Seconds before retrying an unreachable sidecar; doubles on each failure
+    'max_retry_delay': 30,  # Cap on that retry delay
+    'startup_timeout': 60,  # Seconds after boot before the gunicorn master logs a sidecar that is not ready
+    'fallback_local': True,  # Embed in-process when the sidecar is unreachable
+    'restart_delay': 5  # Seconds between sidecar liveness checks in the gunicorn master
+}
+
+# Background Job Settings
+# Jobs live in the jobs collection; each worker process runs a bounded pool of
+# runner threads that claim queued jobs (or jobs whose lease expired because
+# the worker running them was recycled).
+JOB_SETTINGS = {
+    'workers': int(os.getenv('JOB_WORKERS', 2)),  # Runner threads per process
+    'max_queued': 100,  # Submissions are rejected beyond this many queued jobs
+    'lease_seconds': 300,  # A running job not finished within this is retried
+    'max_attempts': 2,
+    'poll_interval': 5,  # Seconds between checks for jobs from other workers
+    'ttl_days': 1  # Finished jobs are removed after this long
+}
+
+# Single-flight Settings
+# Identical concurrent plan requests share one completion; with cluster enabled a lease
+# document in inflight_requests coordinates workers.
+SINGLE_FLIGHT_SETTINGS = {
+    'cluster': os.getenv('SINGLE_FLIGHT_CLUSTER', 'True').lower() == 'true',
+    'lease_seconds': 180,  # Matches the gunicorn request timeout
+    'poll_interval': 0.25,  # Seconds between lease checks while another worker runs the call
+    'share_window': 30  # Seconds a finished result is reused for late duplicates
+}
+
+# Socket.IO message queue (e.g. redis://localhost:6379/0) so any worker can push to any client
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+
+# Conversation Summary Settings
+# Once a conversation reaches trigger_messages, all but the latest keep_recent_messages
+# are folded into a running summary by a background worker.
+SUMMARY_SETTINGS = {
+    'enabled': os.getenv('CONVERSATION_SUMMARY_ENABLED', 'True').lower() == 'true',
+    'trigger_messages': 24,  # Keep below CHAT_MEMORY_SETTINGS['max_messages'] so nothing is dropped unsummarized
+    'keep_recent_messages': 8,
+    'max_summary_tokens': 300,
+    'workers': 1  # Background summarizer threads per process
+}
+
+# Prompt Settings
+PROMPT_SETTINGS = {
+    'max_prompt_tokens': int(os.getenv('PROMPT_MAX_TOKENS', 3000)),  # System prompt + user message
+    'tokenizer': 'cl100k_base'  # tiktoken encoding used to count tokens locally
+}
+
+# AI Stack Settings
+# models.fitness_trainer and utils.model_loader (LangChain, Chroma, torch) load on first use
+AI_STACK_SETTINGS = {
+    # Warm the stack and embedding model up in a background thread in each worker;
+    # /ready then waits for it
+    'preload': os.getenv('AI_PRELOAD', 'False').lower() == 'true'
+}
+
+# Model Settings
+# The embedding model is kept in <cache_dir>/<org>--<name> with a manifest.json of content
+# hashes; a complete, verified copy is used without touching the network.
+MODEL_SETTINGS = {
+    'embedding_model': 'sentence-transformers/all-MiniLM-L6-v2',
+    'cache_dir': os.getenv('MODEL_CACHE_DIR', os.path.join('~', '.cache', 'fitness_models')),
+    'offline': os.getenv('MODEL_OFFLINE', 'False').lower() == 'true',  # Fail instead of downloading
+    'files': [
+        'config.json',
+        'tokenizer.json',
+        'tokenizer_config.json',
+        'special_tokens_map.json',
+        'vocab.txt',
+        'modules.json',
+        'sentence_bert_config.json',
+        '1_Pooling/config.json',
+        'model.safetensors',  # Only download the main model file
+        'onnx/model.onnx'  # Used by the ONNX Runtime engine (utils/embedding_engine.py)
+    ],
+    'required_files': ['config.json', 'tokenizer.json', 'model.safetensors']
+}
+
+# Embedding Engine Settings
+# 'onnx' runs the model on ONNX Runtime (falls back to 'torch', sentence-transformers via
+# LangChain, when onnxruntime or tokenizers are not installed)
+EMBEDDING_SETTINGS = {
+    'backend': os.getenv('EMBEDDING_BACKEND', 'onnx').lower(),
+    'quantize': os.getenv('EMBEDDING_QUANTIZE', 'True').lower() == 'true',  # Dynamic int8 weights
+    'threads': int(os.getenv('EMBEDDING_THREADS', 1)),  # ONNX Runtime intra-op threads per process
+    'max_batch': 32,  # Texts encoded per model call
+    'max_wait_ms': 5,  # How long a call waits for concurrent requests to batch with
+    'max_length': 256  # Tokens per text (the model's training length)
+}
+
+# Embedding Cache Settings
+# Vectors are cached on disk by hash of model + text (utils/embedding_cache.py) and
+# memory-mapped by every worker, so repeated texts are not re-embedded across restarts.
+EMBEDDING_CACHE_SETTINGS = {
+    'enabled': os.getenv('EMBEDDING_CACHE', 'True').lower() == 'true',
+    'directory': os.getenv('EMBEDDING_CACHE_DIR'),  # Defaults to <MODEL_CACHE_DIR>/embedding_cache
+    'max_entries': int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 100000)),
+    'compact_to': 0.75  # Fraction of max_entries (newest first) kept when compacting
+}
+
+# Plan Template Settings
+# /generate_workout answers from local templates (models/plan_templates.py) by default;
+# requests with {"mode": "llm"} or PLAN_TEMPLATES_ENABLED=false use the LLM inline.
+PLAN_TEMPLATE_SETTINGS = {
+    'enabled': os.getenv('PLAN_TEMPLATES_ENABLED', 'True').lower() == 'true',
+    'personalize': os.getenv('PLAN_PERSONALIZE', 'True').lower() == 'true'  # Queue an LLM rewrite of the template plan
+}
+
+# Retention Settings
+# location_history and exercise_index expire through TTL indexes (see setup_mongodb.py);
+# fitness_data is archived to compressed, date-partitioned files before deletion.
+RETENTION_SETTINGS = {
+    'archive_dir': os.getenv('ARCHIVE_DIR', 'archive'),
+    'batch_size': 500,  # Documents archived and deleted per batch
+    'batch_pause': 0.2,  # Seconds to sleep between batches to keep load low
+    'archived_collections': {
+        'fitness_data': {'date_field': 'created_at', 'max_history_days': FITNESS_SETTINGS['max_history_days']}
+    }
+}
+
+# Leaderboard Settings
+LEADERBOARD_SETTINGS = {
+    'backend': os.getenv('LEADERBOARD_BACKEND', 'redis'),  # 'redis' or 'local'
+    'metrics': ['calories', 'duration', 'workouts'],
+    'default_limit': 10,
+    'weeks_to_keep': 2,  # Current week plus the previous one
+    'seed_timeout': 60  # Seconds a board build may hold its reservation before another read retries
+}
+
 # Logging Configuration
 LOGGING = {
     'level': os.getenv('LOG_LEVEL', 'INFO'),
-    'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    'file': os.getenv('LOG_FILE', 'app.log')
+    'format': '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s',
+    'file': os.getenv('LOG_FILE', 'app.log'),
+    'json': os.getenv('LOG_JSON', 'False').lower() == 'true',  # One JSON object per line
+    # Per-logger overrides, e.g. LOG_LEVELS="routes.chatbot_routes=DEBUG,utils.memory_manager=WARNING"
+    'levels': {name.strip(): level.strip().upper() for name, level in
+               (item.split('=', 1) for item in os.getenv('LOG_LEVELS', '').split(',') if '=' in item)},
+    'debug_sample_rate': float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1.0)),  # Share of requests keeping DEBUG events
+    'request_id_header': 'X-Request-ID'
 }
 
 # Database Configuration
@@ -1,6 +1,7 @@
 import multiprocessing
 import os
 import sys
+import threading
 
 # Server socket
 bind = "0.0.0.0:" + os.getenv("PORT", "5000")
@@ -17,6 +18,8 @@ keepalive = 5
 accesslog = '-'
 errorlog = '-'
 loglevel = 'info'
+# Access lines carry the correlation id the app returns in X-Request-ID
+access_log_format = '%(h)s "%(r)s" %(s)s %(b)s %(M)sms "%(a)s" request_id=%({x-request-id}o)s'
 
 # Process naming
 proc_name = 'fitness_api'
@@ -33,16 +36,45 @@ tmp_upload_dir = None
 keyfile = None
 certfile = None
 
+# Embedding sidecar owned by the master (see utils/embedding_service.py)
+embedding_sidecar = None
+
 # Server hooks
 def on_starting(server):
-    """Log when server starts"""
+    """Log when server starts and start the shared embedding service"""
+    global embedding_sidecar
     server.log.info("Starting fitness API server")
+    from config import EMBEDDING_SERVICE_SETTINGS
+    if EMBEDDING_SERVICE_SETTINGS['enabled']:
+        from utils.embedding_service import EmbeddingSidecar
+        embedding_sidecar = EmbeddingSidecar()
+        embedding_sidecar.start()
+        server.log.info(f"Embedding service starting on {embedding_sidecar.socket_path}")
+        # Surface a sidecar that cannot start without holding up the boot (workers
+        # wait for it on their own first connect)
+        threading.Thread(target=_log_embedding_readiness, args=(server,),
+                         name='embedding-readiness', daemon=True).start()
+
+def _log_embedding_readiness(server):
+    from config import EMBEDDING_SERVICE_SETTINGS
+    if embedding_sidecar.wait_ready(EMBEDDING_SERVICE_SETTINGS['startup_timeout']):
+        server.log.info("Embedding service ready")
+    else:
+        server.log.error(f"Embedding service not ready after {EMBEDDING_SERVICE_SETTINGS['startup_timeout']}s; "
+                         f"workers will embed in-process until it is")
 
 def on_exit(server):
-    """Log when server exits"""
+    """Log when server exits and stop the embedding service"""
     server.log.info("Stopping fitness API server")
+    if embedding_sidecar is not None:
+        embedding_sidecar.stop()
 
 # Worker hooks
+def post_worker_init(worker):
+    """Start background job runners in every worker, so jobs left by recycled workers are recovered"""
+    from utils.job_queue import JobQueue
+    JobQueue.get_instance().ensure_started()
+
 def worker_int(worker):
     """Log when worker receives SIGINT"""
     worker.log.info("Worker received SIGINT")
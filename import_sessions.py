@@ -0,0 +1,24 @@
+import argparse
+import glob
+from dotenv import load_dotenv
+from models.saved_session import SavedSession
+
+load_dotenv()
+
+def main():
+    """Move legacy fitness_session_*.json files into the saved session archive in MongoDB"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('files', nargs='*', help='Session files (default: fitness_session_*.json)')
+    parser.add_argument('--owner', help='owner_key to record (session or user id)')
+    args = parser.parse_args()
+
+    print("\n=== Importing saved sessions ===\n")
+    for filename in args.files or sorted(glob.glob("fitness_session_*.json")):
+        try:
+            session_id = SavedSession.import_file(filename, owner_key=args.owner)
+            print(f"{filename}: imported as {session_id}")
+        except Exception as e:
+            print(f"{filename}: failed ({str(e)})")
+
+if __name__ == "__main__":
+    main()
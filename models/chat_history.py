@@ -0,0 +1,40 @@
+from datetime import datetime
+from utils.db import DatabaseConnection
+
+class ChatHistory:
+    """Trainer sessions spilled out of the in-process session store"""
+
+    @classmethod
+    def save_session(cls, session_id, snapshot):
+        db = DatabaseConnection.get_instance()
+        if not snapshot.get('user_profile'):
+            # A trainer that never got a profile must not erase the stored one
+            snapshot = {key: value for key, value in snapshot.items() if key != 'user_profile'}
+        return db.get_chat_history_collection().update_one(
+            {"_id": str(session_id)},
+            {"$set": {**snapshot, "spilled_at": datetime.utcnow(), "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    @classmethod
+    def save_profile(cls, session_id, user_profile):
+        """Store the profile as soon as it is set, so any worker can rehydrate the session"""
+        if not user_profile:
+            return None
+        db = DatabaseConnection.get_instance()
+        return db.get_chat_history_collection().update_one(
+            {"_id": str(session_id)},
+            {"$set": {"user_profile": user_profile, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    @classmethod
+    def load_session(cls, session_id):
+        db = DatabaseConnection.get_instance()
+        return db.get_chat_history_collection().find_one({"_id": str(session_id)})
+
+    @classmethod
+    def delete_session(cls, session_id):
+        db = DatabaseConnection.get_instance()
+        result = db.get_chat_history_collection().delete_one({"_id": str(session_id)})
+        return result.deleted_count > 0
@@ -0,0 +1,167 @@
+from datetime import datetime, timedelta
+import re
+from typing import Dict, Any, List, Optional
+from utils.db import DatabaseConnection
+from config import FITNESS_SETTINGS
+
+_BULLET_RE = re.compile(r'^[\s•*\-–\d.)]+')
+_SETS_REPS_RE = re.compile(
+    r'(\d+)\s*(?:sets?)?\s*(?:x|×|of)\s*(\d+)(?:\s*[-–]\s*(\d+))?\s*(reps?|seconds?|secs?|minutes?|mins?)?',
+    re.IGNORECASE
+)
+_DURATION_RE = re.compile(r'(\d+)\s*(seconds?|secs?|minutes?|mins?)', re.IGNORECASE)
+_NAME_SPLIT_RE = re.compile(r'\s*(?::|\s[-–]\s|\(|\d)')
+_NON_WORD_RE = re.compile(r'[^a-z0-9 ]+')
+
+_ALIASES = {
+    'pushup': 'push up',
+    'press up': 'push up',
+    'pullup': 'pull up',
+    'situp': 'sit up',
+    'warmup': 'warm up',
+    'cooldown': 'cool down',
+}
+_WARMUP_NAMES = ('warm up', 'cool down', 'stretch', 'stretching')
+
+
+def canonical_exercise_name(name: str) -> str:
+    """Normalize an exercise name: 'Dumbbell Rows' / 'dumbbell-row' -> 'dumbbell row'"""
+    name = _NON_WORD_RE.sub(' ', name.lower().replace('-', ' '))
+    words = name.split()
+    if words and len(words[-1]) > 2 and words[-1].endswith('s') and not words[-1].endswith('ss'):
+        words[-1] = words[-1][:-1]
+    name = ' '.join(words)
+    return _ALIASES.get(name.replace(' ', ''), _ALIASES.get(name, name))
+
+
+def _to_seconds(value: int, unit: str) -> int:
+    return value * 60 if unit.lower().startswith('min') else value
+
+
+def parse_exercise(text: str) -> Optional[Dict[str, Any]]:
+    """Turn a free-text plan line into an exercise record.
+
+    'Squats: 3 sets x 12-15 reps' -> {'exercise': 'squat', 'sets': 3, 'reps': 12, 'reps_max': 15, ...}
+    """
+    line = _BULLET_RE.sub('', text).strip()
+    name = _NAME_SPLIT_RE.split(line, maxsplit=1)[0].strip()
+    exercise = canonical_exercise_name(name)
+    if not exercise:
+        return None
+
+    record = {
+        'exercise': exercise,
+        'name': name,
+        'sets': None,
+        'reps': None,
+        'reps_max': None,
+        'duration_seconds': None,
+        'kind': 'warmup' if exercise.startswith(_WARMUP_NAMES) else 'main',
+    }
+
+    match = _SETS_REPS_RE.search(line)
+    if match:
+        record['sets'] = int(match.group(1))
+        unit = match.group(4) or 'reps'
+        low = int(match.group(2))
+        high = int(match.group(3)) if match.group(3) else low
+        if unit.lower().startswith('rep'):
+            record['reps'], record['reps_max'] = low, high
+        else:
+            record['duration_seconds'] = _to_seconds(high, unit)
+    else:
+        duration = _DURATION_RE.search(line)
+        if duration:
+            record['duration_seconds'] = _to_seconds(int(duration.group(1)), duration.group(2))
+
+    return record
+
+
+def normalize_plan(workout_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Attach structured exercise records to every day of a parsed plan (in place)"""
+    for day in workout_data.get('plan', {}).get('details', {}).get('days', []):
+        records = [parse_exercise(e) for e in day.get('exercises', [])]
+        day['records'] = [r for r in records if r]
+    return workout_data
+
+
+class ExerciseIndex:
+    """Inverted index from canonical exercise name to (user, date) in exercise_index"""
+
+    @classmethod
+    def index_workout(cls, user_id, workout_id, workout_data, date=None):
+        db = DatabaseConnection.get_instance()
+        date = date or datetime.utcnow()
+        docs = []
+        for day_number, day in enumerate(workout_data.get('plan', {}).get('details', {}).get('days', []), 1):
+            for record in day.get('records', []):
+                docs.append({
+                    **record,
+                    'user_id': str(user_id),
+                    'workout_id': workout_id,
+                    'day': day_number,
+                    'date': date,
+                })
+        if docs:
+            db.get_exercise_index_collection().insert_many(docs, ordered=False)
+        return len(docs)
+
+    @classmethod
+    def replace_workout(cls, user_id, workout_id, workout_data, date=None):
+        """Re-index a workout whose plan was rewritten"""
+        db = DatabaseConnection.get_instance()
+        db.get_exercise_index_collection().delete_many({'workout_id': workout_id})
+        return cls.index_workout(user_id, workout_id, workout_data, date)
+
+    @classmethod
+    def recent_exercises(cls, user_id, days=None) -> List[str]:
+        """Distinct main exercises the user was given within the recent window, most recently prescribed first"""
+        db = DatabaseConnection.get_instance()
+        days = days or FITNESS_SETTINGS['recent_exercise_days']
+        return [doc['_id'] for doc in db.get_exercise_index_collection().aggregate([
+            {'$match': {
+                'user_id': str(user_id),
+                'kind': 'main',
+                'date': {'$gte': datetime.utcnow() - timedelta(days=days)}
+            }},
+            {'$group': {'_id': '$exercise', 'last': {'$max': '$date'}}},
+            {'$sort': {'last': -1, '_id': 1}}
+        ])]
+
+    @classmethod
+    def exercise_history(cls, user_id, exercise, limit=5) -> List[Dict[str, Any]]:
+        """Most recent prescriptions of one exercise for a user, newest first"""
+        db = DatabaseConnection.get_instance()
+        return list(db.get_exercise_index_collection().find(
+            {'exercise': canonical_exercise_name(exercise), 'user_id': str(user_id)},
+            {'_id': 0, 'sets': 1, 'reps': 1, 'reps_max': 1, 'duration_seconds': 1, 'date': 1}
+        ).sort('date', -1).limit(limit))
+
+    @classmethod
+    def users_for_exercise(cls, exercise, since=None) -> List[str]:
+        db = DatabaseConnection.get_instance()
+        query = {'exercise': canonical_exercise_name(exercise)}
+        if since:
+            query['date'] = {'$gte': since}
+        return db.get_exercise_index_collection().distinct('user_id', query)
+
+    @classmethod
+    def progression_notes(cls, user_id, exercises, limit=None) -> Dict[str, str]:
+        """Exercise -> line describing its latest prescription, for prompts.
+
+        exercises is expected newest first (see recent_exercises), so the notes
+        cover the most recently prescribed ones.
+        """
+        limit = limit or FITNESS_SETTINGS['progression_exercises']
+        notes = {}
+        for exercise in exercises[:limit]:
+            history = cls.exercise_history(user_id, exercise, limit=1)
+            if not history:
+                continue
+            last = history[0]
+            if last.get('sets') and last.get('reps'):
+                reps = last['reps'] if last['reps'] == last.get('reps_max') else f"{last['reps']}-{last['reps_max']}"
+                notes[exercise] = f"{exercise}: last prescribed {last['sets']} x {reps} reps"
+            elif last.get('duration_seconds'):
+                notes[exercise] = f"{exercise}: last prescribed {last['duration_seconds']} seconds"
+        return notes
@@ -1,6 +1,9 @@
 from datetime import datetime
 from bson import ObjectId
 from utils.db import DatabaseConnection
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 class Family:
     @classmethod
@@ -24,7 +27,7 @@ class Family:
     def find_by_member(cls, user_id):
         """Find all families where the user is a member"""
         db = DatabaseConnection.get_instance()
-        print(f"[DEBUG] Searching for user_id: {user_id}")
+        logger.debug("Searching families for user %s", user_id)
         families = list(db.get_families_collection().find({
             "members": {
                 "$elemMatch": {
@@ -32,7 +35,7 @@ class Family:
                 }
             }
         }))
-        print(f"[DEBUG] Found families: {families}")
+        logger.debug("Found %d families for user %s", len(families), user_id)
         return families
 
     @classmethod
@@ -1,44 +1,41 @@
-import os
-from typing import Dict, Any, List, Optional
-from groq import Groq
+from typing import Callable, Dict, Any, List, Optional
 import json
 from datetime import datetime
-import re
-import gc
 
 # LangChain imports
-from langchain.memory import ConversationSummaryBufferMemory, VectorStoreRetrieverMemory
 from langchain.schema.messages import HumanMessage, AIMessage
-from langchain.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.llms.base import LLM
 from langchain.callbacks.manager import CallbackManagerForLLMRun
-from langchain.schema import BaseRetriever, Document
 from pydantic import Field
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
-from langchain.memory import ConversationBufferMemory
+from models.chat_history import ChatHistory
+from models.saved_session import SavedSession
+from utils.structured_logging import get_logger
 from utils.memory_manager import FitnessMemoryManager
+from utils.llm_backend import get_backend, LLMUnavailableError
+from utils.llm_cache import LLMResponseCache, make_cache_key, CACHE_PROFILE_FIELDS
+from utils.prompt_builder import PromptBuilder, count_tokens, render_plan_system_prompt
+from config import LLM_SETTINGS
 
-# Custom Groq LLM wrapper for LangChain - FIXED VERSION
-class GroqLLM(LLM):
-    """Custom LangChain LLM wrapper for Groq - Fixed to work with Pydantic validation"""
+logger = get_logger(__name__)
+
+# Bump when render_plan_system_prompt changes in a way that should invalidate cached plans
+PLAN_PROMPT_VERSION = "3"
+
+# LangChain wrapper over the configured LLM backend (Groq or the local fake)
+class BackendLLM(LLM):
+    """Custom LangChain LLM wrapper around utils.llm_backend.LLMBackend"""
 
     # Define fields properly for Pydantic validation
-    groq_client: Any = Field(default=None, exclude=True)
-    model_name: str = Field(default="llama3-70b-8192")
+    backend: Any = Field(default=None, exclude=True)
 
-    def __init__(self, groq_client, model_name="llama3-70b-8192", **kwargs):
+    def __init__(self, backend=None, **kwargs):
         super().__init__(**kwargs)
-        # Use object.__setattr__ to bypass Pydantic validation for the client
-        object.__setattr__(self, 'groq_client', groq_client)
-        object.__setattr__(self, 'model_name', model_name)
+        # Use object.__setattr__ to bypass Pydantic validation for the backend
+        object.__setattr__(self, 'backend', backend or get_backend())
 
     @property
     def _llm_type(self) -> str:
-        return "groq"
+        return self.backend.name
 
     def _call(
         self,
@@ -48,158 +45,179 @@ class GroqLLM(LLM):
         **kwargs: Any
     ) -> str:
         try:
-            response = self.groq_client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model_name,
+            return self.backend.complete(
+                [{"role": "user", "content": prompt}],
                 temperature=kwargs.get('temperature', 0.7),
                 max_tokens=kwargs.get('max_tokens', 1500),
             )
-            return response.choices[0].message.content
         except Exception as e:
             return f"Error: {str(e)}"
 
 class FitnessAITrainer:
-    _instance = None
-    _profile = None
-
-    def __new__(cls, *args, **kwargs):
-        if cls._instance is None:
-            cls._instance = super(FitnessAITrainer, cls).__new__(cls)
-        return cls._instance
-
-    def __init__(self, api_key):
-        """Initialize the Groq client with API key and LangChain memory"""
-        if not hasattr(self, 'initialized'):
-            print("\n=== Initializing FitnessAITrainer ===")
-            # Force garbage collection before initialization
-            gc.collect()
-            
-            # Validate API key
-            if not api_key or not isinstance(api_key, str) or len(api_key.strip()) == 0:
-                print("Invalid API key provided")
-                raise ValueError("Invalid API key provided")
-            
-            try:
-                print("Initializing Groq client...")
-                # Initialize Groq client with API key
-                self.client = Groq(api_key=api_key.strip())
-                
-                print("Testing API key with simple request...")
-                # Test the API key with a simple request
-                self.client.chat.completions.create(
-                    messages=[{"role": "user", "content": "test"}],
-                    model="llama3-70b-8192",
-                    max_tokens=5
-                )
-                print("API key test successful")
-                
-                # If we get here, the API key is valid
-                print("Setting up trainer instance...")
-                self.user_profile = FitnessAITrainer._profile or {}
-                self.memory_manager = None
-                self.session_start_time = datetime.now()
-                self.loaded_from_save = False
-                self.initialized = True
-                print(f"Trainer initialized successfully with profile: {self.user_profile}")
-                
-            except Exception as e:
-                error_msg = str(e)
-                print(f"Error during initialization: {error_msg}")
-                if "invalid_api_key" in error_msg.lower():
-                    raise ValueError("Invalid Groq API key. Please check your API key in the .env file.")
-                elif "authentication" in error_msg.lower():
-                    raise ValueError("Authentication failed. Please check your API key in the .env file.")
-                else:
-                    raise ValueError(f"Failed to initialize Groq client: {error_msg}")
-
-    def find_saved_sessions(self) -> List[str]:
-        """Find all saved session files"""
-        import glob
-        return glob.glob("fitness_session_*.json")
-
-    def load_session_data(self, filename: str) -> bool:
-        """Load session data from file"""
+    """Per-user trainer state: profile, memory and session timing.
+
+    Trainers are cheap to create; they all talk to the process-wide LLM
+    backend from utils.llm_backend (Groq, or the local fake for load tests).
+    """
+
+    def __init__(self, api_key=None, backend=None, memory_key=None):
+        """Set up trainer state on top of the shared LLM backend.
+
+        memory_key (session or user id) keys the conversation stored in chat_history.
+        """
+        logger.debug("Initializing FitnessAITrainer")
+        try:
+            self.backend = backend or get_backend(api_key)
+        except Exception as e:
+            logger.error("Error during initialization: %s", e)
+            raise ValueError(f"Failed to initialize LLM backend: {str(e)}")
+
+        self.user_profile = {}
+        self.memory_key = memory_key
+        self.memory_manager = None
+        self.prompt_builder = PromptBuilder()
+        self.session_start_time = datetime.now()
+        self.loaded_from_save = False
+        self.initialized = True
+
+    def create_memory_manager(self) -> FitnessMemoryManager:
+        """(Re)attach a memory manager for the current profile and memory key"""
+        self.memory_manager = FitnessMemoryManager(self.backend, self.user_profile, memory_key=self.memory_key)
+        return self.memory_manager
+
+    def _persist_profile(self):
+        """Write the profile to this session's chat_history document (sessions with a memory key only)"""
+        if not self.memory_key:
+            return
+        try:
+            ChatHistory.save_profile(self.memory_key, self.user_profile)
+        except Exception as e:
+            logger.warning("Could not persist profile for %s: %s", self.memory_key, e)
+
+    def approx_size(self) -> int:
+        """Rough in-memory footprint in bytes, used to bound the session store"""
+        size = len(json.dumps(self.user_profile, default=str))
+        if self.memory_manager:
+            size += self.memory_manager.approx_size()
+        return size
+
+    def restore_memories(self, memories: Dict[str, Any]) -> int:
+        """Replace the conversation with exported messages, in a single write.
+
+        conversation_messages may be any iterable, e.g. a stream from SavedSession.load_messages().
+        """
+        self.create_memory_manager()
+        count = 0
+        messages = []
+        for msg_data in memories.get('conversation_messages', []):
+            count += 1
+            if msg_data['type'] == 'HumanMessage':
+                messages.append(HumanMessage(content=msg_data['content']))
+            elif msg_data['type'] == 'AIMessage':
+                messages.append(AIMessage(content=msg_data['content']))
+        chat_memory = self.memory_manager.conversation_memory.chat_memory
+        chat_memory.clear()
+        if messages:
+            chat_memory.add_messages(messages)
+        if memories.get('summary'):
+            self.memory_manager.set_summary(memories['summary'])
+        return count
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        """Serializable trainer state for spilling an idle session to MongoDB.
+
+        Persistent conversations already live in the chat_history document,
+        so only in-process ones are exported along with the profile.
+        """
+        snapshot = {
+            'user_profile': self.user_profile,
+            'session_start_time': self.session_start_time.isoformat(),
+        }
+        if self.memory_manager and not self.memory_manager.persistent:
+            snapshot['memories'] = self.memory_manager.export_memories()
+        return snapshot
+
+    @classmethod
+    def from_snapshot(cls, data: Dict[str, Any], backend=None, memory_key=None) -> 'FitnessAITrainer':
+        """Rebuild a trainer from to_snapshot() output"""
+        trainer = cls(backend=backend, memory_key=memory_key)
+        trainer.user_profile = data.get('user_profile', {})
+        if data.get('memories'):
+            trainer.restore_memories(data['memories'])
+        else:
+            trainer.create_memory_manager()
+        if data.get('session_start_time'):
+            trainer.session_start_time = datetime.fromisoformat(data['session_start_time'])
+        trainer.loaded_from_save = True
+        return trainer
+
+    def find_saved_sessions(self, owner_key: str = None) -> List[Dict[str, Any]]:
+        """Metadata of the most recent saved sessions, newest first"""
+        return SavedSession.list_sessions(owner_key=owner_key)
+
+    def load_session_data(self, session_id: str) -> bool:
+        """Load a saved session, streaming its messages from the archive"""
         try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
+            data = SavedSession.get_session(session_id)
+            if data is None:
+                logger.warning("Saved session %s not found", session_id)
+                return False
 
             # Load user profile
             self.user_profile = data.get('user_profile', {})
 
-            # Initialize memory manager with loaded profile
-            self.memory_manager = FitnessMemoryManager(self.client, self.user_profile)
-
             # Load memories back into LangChain components
-            memories = data.get('memories', {})
-
-            # Restore conversation messages
-            conversation_messages = memories.get('conversation_messages', [])
-            for msg_data in conversation_messages:
-                if msg_data['type'] == 'HumanMessage':
-                    self.memory_manager.conversation_memory.chat_memory.add_user_message(msg_data['content'])
-                elif msg_data['type'] == 'AIMessage':
-                    self.memory_manager.conversation_memory.chat_memory.add_ai_message(msg_data['content'])
+            restored_messages = self.restore_memories({
+                'conversation_messages': SavedSession.load_messages(session_id),
+                'summary': data.get('summary')
+            })
 
             # Restore vector memories
-            vector_memories = memories.get('vector_memories', [])
+            vector_memories = data.get('vector_memories') or []
             if vector_memories:
                 texts = [mem['content'] for mem in vector_memories]
                 metadatas = [mem['metadata'] for mem in vector_memories]
-                self.memory_manager.vector_store.add_texts(texts=texts, metadatas=metadatas)
+                if self.memory_manager.memory_retriever is not None:
+                    self.memory_manager.memory_retriever.add_many(self.memory_key, texts, metadatas)
 
             self.loaded_from_save = True
-            print(f"✅ Session loaded successfully!")
-            print(f"📊 Restored {len(conversation_messages)} conversation messages")
-            print(f"🧠 Restored {len(vector_memories)} important memories")
+            logger.info("Loaded saved session %s", session_id,
+                        messages=restored_messages, vector_memories=len(vector_memories))
 
             return True
 
         except Exception as e:
-            print(f"❌ Error loading session data: {str(e)}")
+            logger.error("Error loading session data: %s", e)
             return False
 
     def choose_session_to_load(self) -> bool:
         """Let user choose which saved session to load"""
-        saved_files = self.find_saved_sessions()
+        try:
+            saved_sessions = self.find_saved_sessions()
+        except Exception as e:
+            print(f"❌ Could not list saved sessions: {str(e)}")
+            saved_sessions = []
 
-        if not saved_files:
+        if not saved_sessions:
             print("No saved sessions found. Starting fresh session.")
             return False
 
-        print(f"\n📁 Found {len(saved_files)} saved session(s):")
+        print(f"\n📁 Found {len(saved_sessions)} saved session(s):")
         print("0. Start new session")
 
-        # Sort files by modification time (newest first)
-        saved_files.sort(key=os.path.getmtime, reverse=True)
-
-        for i, filename in enumerate(saved_files, 1):
-            # Extract info from filename
-            try:
-                with open(filename, 'r') as f:
-                    data = json.load(f)
-                user_name = data.get('user_profile', {}).get('name', 'Unknown')
-                session_date = data.get('session_start_time', 'Unknown')
-                if session_date != 'Unknown':
-                    session_date = datetime.fromisoformat(session_date).strftime('%Y-%m-%d %H:%M')
-
-                # Get memory stats
-                memories = data.get('memories', {})
-                msg_count = len(memories.get('conversation_messages', []))
-                vector_count = len(memories.get('vector_memories', []))
-
-                print(f"{i}. {user_name} - {session_date} ({msg_count} messages, {vector_count} memories)")
-            except:
-                print(f"{i}. {filename}")
+        # Already sorted newest first
+        for i, meta in enumerate(saved_sessions, 1):
+            print(f"{i}. {SavedSession.describe(meta)}")
 
         try:
-            choice = input(f"\nChoose session to load (0-{len(saved_files)}): ").strip()
+            choice = input(f"\nChoose session to load (0-{len(saved_sessions)}): ").strip()
 
             if choice == '0' or choice == '':
                 return False
 
             choice_num = int(choice)
-            if 1 <= choice_num <= len(saved_files):
-                return self.load_session_data(saved_files[choice_num - 1])
+            if 1 <= choice_num <= len(saved_sessions):
+                return self.load_session_data(str(saved_sessions[choice_num - 1]['_id']))
             else:
                 print("Invalid choice. Starting new session.")
                 return False
@@ -221,39 +239,30 @@ class FitnessAITrainer:
 
     def create_new_profile(self, data):
         """Collect user fitness information"""
-        print("Let's set up your fitness profile first.\n")
-        print(f"Debug - Received profile data: {data}")
+        logger.debug("Creating profile", fields=sorted(data) if isinstance(data, dict) else None)
 
         try:
-            # Store the profile data in both instance and class
             self.user_profile = data.copy()
-            FitnessAITrainer._profile = data.copy()
             
             # Calculate BMI
             height_m = self.user_profile['height'] / 100
             bmi = self.user_profile['weight'] / (height_m ** 2)
             self.user_profile['bmi'] = round(bmi, 1)
-            FitnessAITrainer._profile['bmi'] = round(bmi, 1)
-
-            print(f"\nDebug - Stored Profile: {self.user_profile}")
 
             # Initialize memory manager with user profile
-            self.memory_manager = FitnessMemoryManager(self.client, self.user_profile)
+            self.create_memory_manager()
+            self._persist_profile()
 
-            print(f"\n✅ Profile created successfully!")
-            self.display_profile()
+            logger.debug("Profile created", bmi=self.user_profile['bmi'])
             return True
 
         except ValueError as e:
-            print(f"❌ Invalid input: {str(e)}")
+            logger.error("Invalid input: %s", e)
             return False
         except KeyboardInterrupt:
-            print("\n👋 Goodbye!")
             return False
         except Exception as e:
-            print(f"❌ Error setting up profile: {str(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error setting up profile: %s", e)
             return False
 
     def display_profile(self):
@@ -271,152 +280,206 @@ class FitnessAITrainer:
             print(f"⚠️  Limitations: {self.user_profile['limitations']}")
         print("="*50 + "\n")
 
-    def create_system_prompt(self, context: str = ""):
-        """Create a personalized system prompt with memory context"""
-        bmi_category = ""
-        if self.user_profile['bmi'] < 18.5:
-            bmi_category = "underweight"
-        elif self.user_profile['bmi'] < 25:
-            bmi_category = "normal weight"
-        elif self.user_profile['bmi'] < 30:
-            bmi_category = "overweight"
-        else:
-            bmi_category = "obese"
+    def create_system_prompt(self, context: Optional[Dict[str, List[str]]] = None, reserved_tokens: int = 0):
+        """Create a personalized system prompt with memory context, within the prompt token budget.
 
+        context holds 'recent' and 'relevant' lists from FitnessMemoryManager.get_context_sections.
+        """
         session_duration = datetime.now() - self.session_start_time
         memory_summary = self.memory_manager.get_memory_summary() if self.memory_manager else {}
 
-        system_prompt = f"""You are an expert AI fitness trainer and nutritionist with advanced memory capabilities powered by LangChain.
-
-CLIENT PROFILE:
-Name: {self.user_profile['name']}
-Age: {self.user_profile['age']} years old
-Weight: {self.user_profile['weight']} kg
-Height: {self.user_profile['height']} cm
-BMI: {self.user_profile['bmi']} ({bmi_category})
-Primary Goal: {self.user_profile['fitness_goal']}
-Experience Level: {self.user_profile['experience']}
-Available Equipment: {self.user_profile['equipment']}
-Physical Limitations: {self.user_profile['limitations'] if self.user_profile['limitations'] else 'None reported'}
-
-SESSION INFO:
+        session_info = f"""SESSION INFO:
 Duration: {session_duration.seconds // 60} minutes
-Memory Status: {memory_summary.get('total_conversation_messages', 0)} conversation messages, {memory_summary.get('stored_important_memories', 0)} important memories stored
-
-{context}
-
-GUIDELINES:
-1. Use the memory context to maintain continuity and build on previous conversations
-2. Reference relevant past conversations when they apply to current discussion
-3. Track progress and adapt recommendations based on historical context
-4. Build progressively on workout plans and advice from memory
-5. Remember preferences, struggles, and successes from past sessions
-6. Maintain consistency with previous recommendations
-7. Acknowledge improvements and changes mentioned in memory context
-8. Always recommend consulting healthcare professionals for medical concerns
-
-Remember: You have access to both recent conversation history and semantically relevant past conversations through advanced vector-based memory retrieval."""
-
+Memory Status: {memory_summary.get('total_conversation_messages', 0)} conversation messages, {memory_summary.get('stored_important_memories', 0)} important memories stored"""
+
+        context = context or {}
+        system_prompt = self.prompt_builder.build(
+            self.user_profile,
+            session_info,
+            summary=context.get('summary'),
+            recent=context.get('recent'),
+            relevant=context.get('relevant'),
+            reserved_tokens=reserved_tokens
+        )
+        logger.debug("Prompt stats: %s", self.prompt_builder.last_stats)
         return system_prompt
 
-    def get_ai_response(self, user_message):
-        """Get response from Groq AI using LangChain memory"""
+    def _prepare_messages(self, user_message):
+        """Validate the profile and build the system + user messages for a chat turn"""
+        logger.debug("Getting AI Response")
+        
+        # Verify user profile exists and has required fields
+        if not self.user_profile or not isinstance(self.user_profile, dict):
+            logger.error("User profile is not a dictionary or is None")
+            raise ValueError("User profile not properly initialized")
+        
+        required_fields = ['name', 'age', 'weight', 'height', 'fitness_goal', 'experience', 'equipment', 'limitations']
+        missing_fields = [field for field in required_fields if field not in self.user_profile]
+        if missing_fields:
+            logger.error("Missing fields in profile: %s", missing_fields)
+            raise ValueError(f"Missing required profile fields: {', '.join(missing_fields)}")
+        
+        # Check if memory manager exists and is properly initialized
+        if not hasattr(self, 'memory_manager') or self.memory_manager is None:
+            logger.debug("Initializing memory manager...")
+            self.create_memory_manager()
+            logger.debug("Memory manager initialized")
+        
+        # Get relevant context from memory
+        logger.debug("Getting relevant context from memory...")
+        context = self.memory_manager.get_context_sections(user_message)
+        logger.debug("Context retrieved successfully")
+
+        # Create system prompt with context, leaving room for the user message
+        logger.debug("Creating system prompt...")
+        system_prompt = self.create_system_prompt(context, reserved_tokens=count_tokens(user_message))
+        logger.debug("System prompt created")
+
+        # Prepare messages for API call
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+
+    def get_ai_response(self, user_message, raise_unavailable: bool = False, **params):
+        """Get response from the LLM backend using LangChain memory.
+
+        Failures are returned as text; with raise_unavailable, LLMUnavailableError
+        (rate limited or LLM queue deadline exceeded) is raised to the caller instead.
+        Extra params (e.g. response_format) are passed to the backend.
+        """
         try:
-            print("\n=== Getting AI Response ===")
-            # Debug logging
-            print(f"User Profile: {self.user_profile}")
-            print(f"Class Profile: {FitnessAITrainer._profile}")
-            
-            # Try to recover profile from class variable if instance profile is empty
-            if not self.user_profile and FitnessAITrainer._profile:
-                print("Recovering profile from class variable...")
-                self.user_profile = FitnessAITrainer._profile.copy()
-            
-            # Verify user profile exists and has required fields
-            if not self.user_profile or not isinstance(self.user_profile, dict):
-                print("Error: User profile is not a dictionary or is None")
-                raise ValueError("User profile not properly initialized")
-            
-            required_fields = ['name', 'age', 'weight', 'height', 'fitness_goal', 'experience', 'equipment', 'limitations']
-            missing_fields = [field for field in required_fields if field not in self.user_profile]
-            if missing_fields:
-                print(f"Error: Missing fields in profile: {missing_fields}")
-                raise ValueError(f"Missing required profile fields: {', '.join(missing_fields)}")
-            
-            # Check if memory manager exists and is properly initialized
-            if not hasattr(self, 'memory_manager') or self.memory_manager is None:
-                print("Initializing memory manager...")
-                self.memory_manager = FitnessMemoryManager(self.client, self.user_profile)
-                print("Memory manager initialized")
-            
-            # Get relevant context from memory
-            print("Getting relevant context from memory...")
-            context = self.memory_manager.get_relevant_context(user_message)
-            print("Context retrieved successfully")
+            messages = self._prepare_messages(user_message)
 
-            # Create system prompt with context
-            print("Creating system prompt...")
-            system_prompt = self.create_system_prompt(context)
-            print("System prompt created")
-
-            # Prepare messages for API call
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ]
-
-            # Get response from Groq
-            print("Sending request to Groq...")
-            response = self.client.chat.completions.create(
-                messages=messages,
-                model="llama3-70b-8192",
-                temperature=0.7,
-                max_tokens=1500,
-                top_p=1,
-                stream=False
-            )
-            print("Response received from Groq")
-
-            ai_response = response.choices[0].message.content
+            # Get response from the LLM backend
+            logger.debug("Sending request to %s backend...", self.backend.name)
+            ai_response = self.backend.complete(messages, **{'temperature': 0.7, 'max_tokens': 1500, 'top_p': 1, **params})
+            logger.debug("Response received from LLM backend")
 
             # Add conversation turn to memory
-            print("Adding conversation to memory...")
+            logger.debug("Adding conversation to memory...")
             self.memory_manager.add_conversation_turn(user_message, ai_response)
-            print("Conversation added to memory")
+            logger.debug("Conversation added to memory")
 
             return ai_response
 
         except ValueError as ve:
-            print(f"Profile validation error: {str(ve)}")
+            logger.error("Profile validation error: %s", ve)
             return f"❌ Error: {str(ve)}. Please ensure your profile is properly set up."
+        except LLMUnavailableError as ue:
+            logger.warning("LLM unavailable: %s", ue)
+            if raise_unavailable:
+                raise
+            return "❌ The AI trainer is busy right now. Please try again in a moment."
         except Exception as e:
-            print(f"Error in get_ai_response: {str(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error in get_ai_response: %s", e)
             return f"❌ Error getting AI response: {str(e)}"
 
-    def save_session_data(self):
-        """Save session data including LangChain memories"""
+    def get_plan_response(self, prompt: str, use_cache: bool = True, json_mode: bool = False,
+                          parse: Callable[[str], Any] = None):
+        """Get a plan-generation response, served from the LLM response cache when possible.
+
+        Cacheable plans are generated by _complete_plan from the goal,
+        experience, equipment, limitations and the prompt alone, which is
+        exactly what the cache key covers, so users who match on those and
+        send the same request share one completion. Without the cache the
+        plan goes through get_ai_response with the full profile and memory.
+        json_mode asks the model for a JSON object; the prompt must describe
+        the expected shape. With parse, its result is returned instead of the
+        text, and a response it rejects (by raising) is not cached.
+        """
+        cache = LLMResponseCache.get_instance()
+        use_cache = use_cache and cache.enabled
+        if use_cache:
+            key = make_cache_key(LLM_SETTINGS['model'], PLAN_PROMPT_VERSION, self.user_profile, prompt)
+            cached = cache.get(key)
+            if cached is not None:
+                logger.debug("Plan response served from cache")
+                if self.memory_manager is None:
+                    self.create_memory_manager()
+                self.memory_manager.add_conversation_turn(prompt, cached)
+                return parse(cached) if parse else cached
+
+        params = {'response_format': {'type': 'json_object'}} if json_mode else {}
+        if use_cache:
+            response = self._complete_plan(prompt, **params)
+        else:
+            response = self.get_ai_response(prompt, raise_unavailable=True, **params)
+        result = parse(response) if parse else response
+        # Other failures are reported as text; never cache those
+        if use_cache and not response.startswith("❌"):
+            cache.set(key, response, {'model': LLM_SETTINGS['model'], 'template_version': PLAN_PROMPT_VERSION})
+        return result
+
+    def _complete_plan(self, prompt: str, **params) -> str:
+        """Plan completion from render_plan_system_prompt, with no chat context or summary.
+
+        Errors are reported like get_ai_response (LLMUnavailableError is raised);
+        the turn is still added to this trainer's memory.
+        """
         try:
-            filename = f"fitness_session_{self.user_profile['name']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+            missing_fields = [field for field in CACHE_PROFILE_FIELDS if field not in (self.user_profile or {})]
+            if missing_fields:
+                raise ValueError(f"Missing required profile fields: {', '.join(missing_fields)}")
+            messages = [
+                {"role": "system", "content": render_plan_system_prompt(self.user_profile)},
+                {"role": "user", "content": prompt}
+            ]
+            logger.debug("Sending plan request to %s backend...", self.backend.name)
+            ai_response = self.backend.complete(messages, **{'temperature': 0.7, 'max_tokens': 1500, 'top_p': 1, **params})
+        except ValueError as ve:
+            logger.error("Profile validation error: %s", ve)
+            return f"❌ Error: {str(ve)}. Please ensure your profile is properly set up."
+        except LLMUnavailableError as ue:
+            logger.warning("LLM unavailable: %s", ue)
+            raise
+        except Exception as e:
+            logger.exception("Error in _complete_plan: %s", e)
+            return f"❌ Error getting AI response: {str(e)}"
+
+        if self.memory_manager is None:
+            self.create_memory_manager()
+        self.memory_manager.add_conversation_turn(prompt, ai_response)
+        return ai_response
 
+    def stream_ai_response(self, user_message):
+        """Yield response text chunks from the LLM backend as they are generated.
+
+        The full response is written to memory once the stream completes; a
+        stream that fails or is abandoned by the client leaves memory untouched.
+        Errors are raised to the caller, which decides how to report them.
+        """
+        messages = self._prepare_messages(user_message)
+
+        logger.debug("Sending streaming request to %s backend...", self.backend.name)
+        parts = []
+        for delta in self.backend.stream(messages, temperature=0.7, max_tokens=1500, top_p=1):
+            parts.append(delta)
+            yield delta
+
+        ai_response = "".join(parts)
+        logger.debug("Stream completed, adding conversation to memory...")
+        self.memory_manager.add_conversation_turn(user_message, ai_response)
+
+    def save_session_data(self) -> Optional[str]:
+        """Save session data including LangChain memories to the saved session archive"""
+        try:
             # Export memories from LangChain components
             exported_memories = self.memory_manager.export_memories() if self.memory_manager else {}
 
-            data = {
-                'user_profile': self.user_profile,
-                'memories': exported_memories,
-                'session_start_time': self.session_start_time.isoformat(),
-                'session_end_time': datetime.now().isoformat(),
-            }
-
-            with open(filename, 'w') as f:
-                json.dump(data, f, indent=2)
+            session_id = SavedSession.save(
+                self.user_profile,
+                exported_memories,
+                self.session_start_time,
+                owner_key=self.memory_key
+            )
 
-            print(f"💾 Session data saved to: {filename}")
+            logger.info("Saved session as %s", session_id)
+            return session_id
 
         except Exception as e:
-            print(f"❌ Error saving session data: {str(e)}")
+            logger.error("Error saving session data: %s", e)
+            return None
 
     def show_memory_stats(self):
         """Display current memory statistics"""
@@ -514,16 +577,14 @@ Remember: You have access to both recent conversation history and semantically r
     def update_profile(self, new_data: Dict[str, Any]) -> bool:
         """Update user profile with new data"""
         try:
-            print("\n=== Updating Profile ===")
-            print(f"Current profile: {self.user_profile}")
-            print(f"New data: {new_data}")
+            logger.debug("Updating profile", fields=sorted(new_data) if isinstance(new_data, dict) else None)
             
             if not isinstance(new_data, dict):
-                print("Invalid data type for profile update")
+                logger.warning("Invalid data type for profile update")
                 return False
                 
             if not self.user_profile:
-                print("No existing profile to update")
+                logger.warning("No existing profile to update")
                 return False
             
             # Create a copy of current profile for safe update
@@ -541,27 +602,25 @@ Remember: You have access to both recent conversation history and semantically r
                 height = updated_profile.get('height', 0) / 100  # convert to meters
                 if weight and height:
                     updated_profile['bmi'] = round(weight / (height * height), 1)
-                    print(f"BMI recalculated: {updated_profile['bmi']}")
+                    logger.debug("BMI recalculated: %s", updated_profile['bmi'])
             
-            # Update both instance and class profile
             self.user_profile = updated_profile
-            FitnessAITrainer.user_profile = updated_profile
+            self.prompt_builder.invalidate_profile()
+            self._persist_profile()
             
             # Reinitialize memory manager with updated profile
             if hasattr(self, 'memory_manager'):
                 try:
-                    self.memory_manager = FitnessMemoryManager(self.client, self.user_profile)
-                    print("Memory manager reinitialized with updated profile")
+                    self.create_memory_manager()
+                    logger.debug("Memory manager reinitialized with updated profile")
                 except Exception as e:
-                    print(f"Warning: Failed to reinitialize memory manager: {str(e)}")
+                    logger.warning("Failed to reinitialize memory manager: %s", e)
                     # Don't fail the update if memory manager reinitialization fails
             
-            print("Profile updated successfully")
+            logger.debug("Profile updated successfully")
             return True
             
         except Exception as e:
-            print(f"Error updating profile: {str(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error updating profile: %s", e)
             return False
 
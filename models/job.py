@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from utils.db import DatabaseConnection
+from config import JOB_SETTINGS
+
+class Job:
+    """Background jobs (queued -> running -> succeeded/failed) shared by all workers"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    @classmethod
+    def _collection(cls):
+        return DatabaseConnection.get_instance().get_jobs_collection()
+
+    @classmethod
+    def create_job(cls, kind, payload, owner_id=None, request_id=None):
+        now = datetime.utcnow()
+        result = cls._collection().insert_one({
+            "kind": kind,
+            "payload": payload,
+            "owner_id": str(owner_id) if owner_id is not None else None,
+            "request_id": request_id,
+            "status": cls.QUEUED,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now
+        })
+        return str(result.inserted_id)
+
+    @classmethod
+    def get_job(cls, job_id):
+        try:
+            return cls._collection().find_one({"_id": ObjectId(job_id)})
+        except InvalidId:
+            return None
+
+    @classmethod
+    def count_queued(cls):
+        return cls._collection().count_documents({"status": cls.QUEUED})
+
+    @classmethod
+    def claim_next(cls, worker_id, kinds):
+        """Atomically take the oldest queued job, or a running job whose lease expired"""
+        now = datetime.utcnow()
+        return cls._collection().find_one_and_update(
+            {
+                "kind": {"$in": list(kinds)},
+                "attempts": {"$lt": JOB_SETTINGS['max_attempts']},
+                "$or": [
+                    {"status": cls.QUEUED},
+                    {"status": cls.RUNNING, "lease_until": {"$lt": now}}
+                ]
+            },
+            {
+                "$set": {
+                    "status": cls.RUNNING,
+                    "worker_id": worker_id,
+                    "started_at": now,
+                    "lease_until": now + timedelta(seconds=JOB_SETTINGS['lease_seconds']),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    @classmethod
+    def complete_job(cls, job_id, worker_id, result):
+        """Record a result; ignored if the lease was lost to another worker"""
+        now = datetime.utcnow()
+        return cls._collection().find_one_and_update(
+            {"_id": ObjectId(job_id), "worker_id": worker_id, "status": cls.RUNNING},
+            {"$set": {"status": cls.SUCCEEDED, "result": result, "finished_at": now, "updated_at": now},
+             "$unset": {"lease_until": ""}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @classmethod
+    def fail_job(cls, job_id, worker_id, error, retry=False):
+        now = datetime.utcnow()
+        update = {"status": cls.QUEUED, "error": error, "updated_at": now} if retry else \
+            {"status": cls.FAILED, "error": error, "finished_at": now, "updated_at": now}
+        return cls._collection().find_one_and_update(
+            {"_id": ObjectId(job_id), "worker_id": worker_id, "status": cls.RUNNING},
+            {"$set": update, "$unset": {"lease_until": ""}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @classmethod
+    def fail_exhausted(cls):
+        """Mark jobs whose lease expired on their last attempt as failed"""
+        now = datetime.utcnow()
+        return cls._collection().update_many(
+            {"status": cls.RUNNING, "lease_until": {"$lt": now}, "attempts": {"$gte": JOB_SETTINGS['max_attempts']}},
+            {"$set": {"status": cls.FAILED, "error": "Job timed out", "finished_at": now, "updated_at": now},
+             "$unset": {"lease_until": ""}}
+        )
+
+    @staticmethod
+    def to_public(job):
+        """Client-facing view of a job document"""
+        public = {
+            "job_id": str(job["_id"]),
+            "kind": job["kind"],
+            "status": job["status"],
+            "attempts": job.get("attempts", 0),
+            "created_at": job["created_at"].isoformat(),
+        }
+        if job.get("finished_at"):
+            public["finished_at"] = job["finished_at"].isoformat()
+        if job["status"] == Job.SUCCEEDED:
+            public["result"] = job.get("result")
+        elif job["status"] == Job.FAILED:
+            public["error"] = job.get("error")
+        return public
@@ -0,0 +1,239 @@
+from functools import lru_cache
+import re
+from typing import Dict, Any, FrozenSet, Iterable, List, Optional, Tuple
+from models.exercise import canonical_exercise_name
+
+# Experience levels, in order
+LEVELS = ('beginner', 'intermediate', 'advanced')
+
+# (name, movement pattern, equipment needed (None = bodyweight), minimum level, joints it loads)
+EXERCISE_CATALOG = (
+    ('Bodyweight squats', 'squat', None, 0, {'knee'}),
+    ('Goblet squats', 'squat', 'dumbbells', 0, {'knee'}),
+    ('Band squats', 'squat', 'bands', 0, {'knee'}),
+    ('Barbell back squats', 'squat', 'barbell', 1, {'knee', 'back'}),
+    ('Leg press', 'squat', 'machines', 0, {'knee'}),
+    ('Wall sits', 'squat', None, 0, {'knee'}),
+    ('Glute bridges', 'hinge', None, 0, set()),
+    ('Dumbbell Romanian deadlifts', 'hinge', 'dumbbells', 0, {'back'}),
+    ('Kettlebell swings', 'hinge', 'kettlebell', 1, {'back'}),
+    ('Band good mornings', 'hinge', 'bands', 0, {'back'}),
+    ('Barbell deadlifts', 'hinge', 'barbell', 1, {'back'}),
+    ('Single-leg glute bridges', 'hinge', None, 1, set()),
+    ('Reverse lunges', 'lunge', None, 0, {'knee'}),
+    ('Dumbbell walking lunges', 'lunge', 'dumbbells', 1, {'knee'}),
+    ('Step-ups', 'lunge', None, 0, {'knee'}),
+    ('Bulgarian split squats', 'lunge', None, 2, {'knee'}),
+    ('Incline push-ups', 'push', None, 0, {'wrist'}),
+    ('Push-ups', 'push', None, 1, {'wrist', 'shoulder'}),
+    ('Dumbbell bench press', 'push', 'dumbbells', 0, {'shoulder'}),
+    ('Band chest press', 'push', 'bands', 0, set()),
+    ('Barbell bench press', 'push', 'barbell', 1, {'shoulder'}),
+    ('Machine chest press', 'push', 'machines', 0, set()),
+    ('Decline push-ups', 'push', None, 2, {'wrist', 'shoulder'}),
+    ('Dumbbell shoulder press', 'overhead', 'dumbbells', 0, {'shoulder'}),
+    ('Band overhead press', 'overhead', 'bands', 0, {'shoulder'}),
+    ('Pike push-ups', 'overhead', None, 1, {'shoulder', 'wrist'}),
+    ('Barbell overhead press', 'overhead', 'barbell', 2, {'shoulder', 'back'}),
+    ('Dumbbell lateral raises', 'overhead', 'dumbbells', 0, set()),
+    ('Dumbbell rows', 'pull', 'dumbbells', 0, set()),
+    ('Band rows', 'pull', 'bands', 0, set()),
+    ('Inverted rows', 'pull', None, 1, set()),
+    ('Barbell rows', 'pull', 'barbell', 1, {'back'}),
+    ('Lat pulldown', 'pull', 'machines', 0, set()),
+    ('Pull-ups', 'pull', 'pull-up bar', 2, {'shoulder'}),
+    ('Band pull-aparts', 'pull', 'bands', 0, set()),
+    ('Superman holds', 'pull', None, 0, {'back'}),
+    ('Plank', 'core', None, 0, {'wrist'}),
+    ('Dead bugs', 'core', None, 0, set()),
+    ('Bird dogs', 'core', None, 0, set()),
+    ('Side plank', 'core', None, 1, {'shoulder'}),
+    ('Bicycle crunches', 'core', None, 1, {'back'}),
+    ('Hanging knee raises', 'core', 'pull-up bar', 2, set()),
+    ('Marching in place', 'cardio', None, 0, set()),
+    ('Jumping jacks', 'cardio', None, 0, {'knee'}),
+    ('Mountain climbers', 'cardio', None, 1, {'wrist'}),
+    ('High knees', 'cardio', None, 1, {'knee'}),
+    ('Burpees', 'cardio', None, 2, {'knee', 'wrist', 'back'}),
+    ('Stationary bike intervals', 'cardio', 'machines', 0, set()),
+    ('Shadow boxing', 'cardio', None, 0, set()),
+)
+
+# Patterns done for time rather than reps
+_TIMED_PATTERNS = ('core', 'cardio')
+_TIMED_EXERCISES = ('Plank', 'Side plank', 'Wall sits', 'Superman holds', 'Marching in place',
+                    'Stationary bike intervals', 'Shadow boxing')
+
+# goal -> list of (day title, movement patterns in order)
+GOAL_TEMPLATES = {
+    'weight loss': [
+        ('Full Body Circuit', ['squat', 'push', 'hinge', 'cardio', 'core']),
+        ('Cardio & Core', ['cardio', 'lunge', 'cardio', 'core', 'core']),
+        ('Full Body Conditioning', ['lunge', 'pull', 'overhead', 'cardio', 'core']),
+        ('Metabolic Finisher', ['cardio', 'squat', 'push', 'cardio', 'core']),
+    ],
+    'muscle gain': [
+        ('Upper Body Push', ['push', 'overhead', 'push', 'overhead', 'core']),
+        ('Lower Body', ['squat', 'hinge', 'lunge', 'hinge', 'core']),
+        ('Upper Body Pull', ['pull', 'pull', 'pull', 'core', 'core']),
+        ('Full Body', ['squat', 'push', 'pull', 'lunge', 'core']),
+    ],
+    'strength': [
+        ('Lower Body Strength', ['squat', 'hinge', 'lunge', 'core']),
+        ('Upper Body Strength', ['push', 'pull', 'overhead', 'pull']),
+        ('Full Body Strength', ['hinge', 'squat', 'push', 'core']),
+        ('Upper Body Volume', ['overhead', 'pull', 'push', 'core']),
+    ],
+    'endurance': [
+        ('Aerobic Base', ['cardio', 'cardio', 'lunge', 'core']),
+        ('Muscular Endurance', ['squat', 'push', 'pull', 'core', 'cardio']),
+        ('Intervals & Core', ['cardio', 'cardio', 'core', 'core']),
+        ('Full Body Endurance', ['lunge', 'hinge', 'push', 'cardio', 'core']),
+    ],
+    'general fitness': [
+        ('Full Body A', ['squat', 'push', 'pull', 'core']),
+        ('Cardio & Mobility', ['cardio', 'lunge', 'hinge', 'core']),
+        ('Full Body B', ['hinge', 'overhead', 'pull', 'cardio', 'core']),
+        ('Full Body C', ['lunge', 'push', 'pull', 'core']),
+    ],
+}
+
+# goal -> (sets, reps low, reps high, seconds for timed exercises)
+GOAL_SCHEMES = {
+    'weight loss': (3, 12, 15, 40),
+    'muscle gain': (3, 8, 12, 30),
+    'strength': (4, 4, 6, 30),
+    'endurance': (3, 15, 20, 60),
+    'general fitness': (3, 10, 12, 30),
+}
+
+# level -> (days per week, max exercises per day, extra sets)
+LEVEL_VOLUME = {0: (3, 4, -1), 1: (3, 5, 0), 2: (4, 5, 1)}
+
+_GOAL_KEYWORDS = (
+    ('weight loss', ('weight loss', 'lose weight', 'fat', 'lean', 'tone', 'slim')),
+    ('muscle gain', ('muscle', 'gain', 'bulk', 'hypertrophy', 'mass', 'size')),
+    ('strength', ('strength', 'strong', 'power', 'powerlifting')),
+    ('endurance', ('endurance', 'stamina', 'cardio', 'run', 'marathon', 'conditioning')),
+)
+
+_EQUIPMENT_KEYWORDS = (
+    ('dumbbells', ('dumbbell',)),
+    ('bands', ('band', 'resistance')),
+    ('barbell', ('barbell',)),
+    ('kettlebell', ('kettlebell',)),
+    ('machines', ('gym', 'machine', 'cable')),
+    ('pull-up bar', ('pull-up bar', 'pull up bar', 'pullup bar', 'chin-up bar')),
+)
+
+_LIMITATION_KEYWORDS = (
+    ('knee', ('knee', 'acl', 'meniscus')),
+    ('back', ('back', 'spine', 'disc', 'sciatica')),
+    ('shoulder', ('shoulder', 'rotator')),
+    ('wrist', ('wrist', 'carpal')),
+)
+
+_NO_LIMITATIONS_RE = re.compile(r'^\s*(none|no|n/?a|nothing|-)?\s*$', re.IGNORECASE)
+
+
+def _matches(text: str, keywords: Iterable[Tuple[str, Tuple[str, ...]]]) -> List[str]:
+    text = str(text or '').lower()
+    return [key for key, words in keywords if any(word in text for word in words)]
+
+
+def classify_goal(fitness_goal: str) -> str:
+    matches = _matches(fitness_goal, _GOAL_KEYWORDS)
+    return matches[0] if matches else 'general fitness'
+
+
+def classify_level(experience: str) -> int:
+    experience = str(experience or '').lower()
+    if 'advanced' in experience or 'expert' in experience:
+        return 2
+    if 'intermediate' in experience:
+        return 1
+    return 0
+
+
+def classify_equipment(equipment: Any) -> FrozenSet[str]:
+    if isinstance(equipment, (list, tuple)):
+        equipment = ', '.join(str(item) for item in equipment)
+    available = set(_matches(equipment, _EQUIPMENT_KEYWORDS))
+    if 'machines' in available:
+        # A gym has the free weights too
+        available.update(('dumbbells', 'barbell', 'bands'))
+    return frozenset(available)
+
+
+def classify_limitations(limitations: Any) -> FrozenSet[str]:
+    if not limitations or _NO_LIMITATIONS_RE.match(str(limitations)):
+        return frozenset()
+    return frozenset(_matches(limitations, _LIMITATION_KEYWORDS))
+
+
+def template_key(profile: Dict[str, Any]) -> Tuple[str, int, FrozenSet[str], FrozenSet[str]]:
+    """The (goal, level, equipment, limitations) combination a profile maps to"""
+    return (
+        classify_goal(profile.get('fitness_goal')),
+        classify_level(profile.get('experience')),
+        classify_equipment(profile.get('equipment')),
+        classify_limitations(profile.get('limitations')),
+    )
+
+
+def _candidates(pattern: str, level: int, equipment: FrozenSet[str], avoid: FrozenSet[str]) -> List[str]:
+    return [name for name, ex_pattern, needs, min_level, loads in EXERCISE_CATALOG
+            if ex_pattern == pattern and min_level <= level
+            and (needs is None or needs in equipment) and not (loads & avoid)]
+
+
+def _prescription(name: str, pattern: str, goal: str, level: int) -> str:
+    sets, low, high, seconds = GOAL_SCHEMES[goal]
+    sets = max(2, sets + LEVEL_VOLUME[level][2])
+    if pattern in _TIMED_PATTERNS or name in _TIMED_EXERCISES:
+        return f"{name}: {sets} sets x {seconds + 10 * level} seconds"
+    return f"{name}: {sets} sets x {low}-{high} reps"
+
+
+@lru_cache(maxsize=512)
+def _build_days(goal: str, level: int, equipment: FrozenSet[str], avoid: FrozenSet[str],
+                recent: FrozenSet[str]) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    day_count, per_day, _ = LEVEL_VOLUME[level]
+    used = set()
+    days = []
+    for day_number, (title, patterns) in enumerate(GOAL_TEMPLATES[goal][:day_count], 1):
+        exercises = ["Warm-up: 5 minutes light cardio and dynamic stretches"]
+        for slot, pattern in enumerate(patterns[:per_day]):
+            options = _candidates(pattern, level, equipment, avoid)
+            if not options:
+                continue
+            # Prefer exercises not used this week or in the user's recent plans; rotate by day for variety
+            options = options[day_number + slot:] + options[:day_number + slot]
+            fresh = [o for o in options if o not in used and canonical_exercise_name(o) not in recent]
+            unused = [o for o in options if o not in used]
+            choice = (fresh or unused or options)[0]
+            used.add(choice)
+            exercises.append(_prescription(choice, pattern, goal, level))
+        exercises.append("Cool-down: 5 minutes stretching")
+        days.append((f"DAY {day_number} - {title}", tuple(exercises)))
+    return tuple(days)
+
+
+def generate_template_plan(profile: Dict[str, Any], intensity: str = 'moderate', workout_type: str = 'general',
+                           duration: int = 30, recent_exercises: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Rule-based plan in the same {"plan": {...}} shape the LLM parser produces"""
+    goal, level, equipment, avoid = template_key(profile)
+    recent = frozenset(canonical_exercise_name(e) for e in (recent_exercises or []))
+    days = _build_days(goal, level, equipment, avoid, recent)
+    return {
+        "plan": {
+            "title": f"{intensity.title()} {workout_type.title()} Workout Plan",
+            "duration": f"{duration} minutes",
+            "intensity": intensity,
+            "source": "template",
+            "template": f"{goal}/{LEVELS[level]}",
+            "details": {
+                "days": [{"title": title, "exercises": list(exercises)} for title, exercises in days]
+            }
+        }
+    }
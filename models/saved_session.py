@@ -0,0 +1,132 @@
+from datetime import datetime
+import json
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+from bson import Binary, ObjectId
+from config import SAVED_SESSION_SETTINGS
+from utils.db import DatabaseConnection
+
+try:
+    import zstandard
+except ImportError:  # Fall back to zlib when zstandard is not installed
+    zstandard = None
+
+
+def _compress(payload: bytes) -> Dict[str, Any]:
+    if zstandard:
+        return {'codec': 'zstd', 'data': Binary(zstandard.ZstdCompressor(level=10).compress(payload))}
+    return {'codec': 'zlib', 'data': Binary(zlib.compress(payload, 6))}
+
+
+def _decompress(doc: Dict[str, Any]) -> bytes:
+    if doc['codec'] == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Saved session was compressed with zstd but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(doc['data'])
+    return zlib.decompress(doc['data'])
+
+
+class SavedSession:
+    """Trainer sessions saved on request, replacing fitness_session_*.json files.
+
+    saved_sessions holds one small metadata document per save (owner, user
+    name, dates, message counts, profile and summary), so listing is a single
+    indexed query. The conversation goes to saved_session_chunks as
+    compressed JSON-lines batches that load_messages() streams back in order.
+    """
+
+    @classmethod
+    def save(cls, user_profile: Dict[str, Any], memories: Dict[str, Any], session_start_time: datetime,
+             owner_key: str = None, saved_at: datetime = None) -> str:
+        db = DatabaseConnection.get_instance()
+        session_id = ObjectId()
+        messages = memories.get('conversation_messages', [])
+        vector_memories = memories.get('vector_memories', [])
+        chunk_size = SAVED_SESSION_SETTINGS['chunk_messages']
+
+        chunks, raw_bytes, stored_bytes = [], 0, 0
+        for seq, start in enumerate(range(0, len(messages), chunk_size)):
+            batch = messages[start:start + chunk_size]
+            payload = ''.join(json.dumps(m) + '\n' for m in batch).encode('utf-8')
+            compressed = _compress(payload)
+            raw_bytes += len(payload)
+            stored_bytes += len(compressed['data'])
+            chunks.append({'session_id': session_id, 'seq': seq, 'count': len(batch), **compressed})
+        # Chunks first: a session is only listed once all of its messages are stored
+        if chunks:
+            db.get_saved_session_chunks_collection().insert_many(chunks, ordered=True)
+
+        db.get_saved_sessions_collection().insert_one({
+            "_id": session_id,
+            "owner_key": str(owner_key) if owner_key else None,
+            "user_name": user_profile.get('name', 'Unknown'),
+            "user_profile": user_profile,
+            "summary": memories.get('summary', ''),
+            "vector_memories": _compress(json.dumps(vector_memories).encode('utf-8')),
+            "message_count": len(messages),
+            "vector_memory_count": len(vector_memories),
+            "chunk_count": len(chunks),
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "session_start_time": session_start_time,
+            "saved_at": saved_at or datetime.utcnow()
+        })
+        return str(session_id)
+
+    @classmethod
+    def list_sessions(cls, owner_key: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        """Newest saved sessions first, metadata only"""
+        db = DatabaseConnection.get_instance()
+        query = {"owner_key": str(owner_key)} if owner_key else {}
+        projection = {"user_profile": 0, "summary": 0, "vector_memories": 0}
+        cursor = db.get_saved_sessions_collection().find(query, projection).sort("saved_at", -1)
+        return list(cursor.limit(limit or SAVED_SESSION_SETTINGS['list_limit']))
+
+    @classmethod
+    def get_session(cls, session_id) -> Optional[Dict[str, Any]]:
+        """Metadata, profile, summary and vector memories of one saved session"""
+        db = DatabaseConnection.get_instance()
+        doc = db.get_saved_sessions_collection().find_one({"_id": ObjectId(session_id)})
+        if doc and doc.get('vector_memories'):
+            doc['vector_memories'] = json.loads(_decompress(doc['vector_memories']))
+        return doc
+
+    @classmethod
+    def load_messages(cls, session_id) -> Iterator[Dict[str, Any]]:
+        """Yield the saved conversation in order, decompressing one chunk at a time"""
+        db = DatabaseConnection.get_instance()
+        cursor = db.get_saved_session_chunks_collection().find(
+            {"session_id": ObjectId(session_id)}
+        ).sort("seq", 1).batch_size(4)
+        for chunk in cursor:
+            for line in _decompress(chunk).splitlines():
+                yield json.loads(line)
+
+    @classmethod
+    def delete_session(cls, session_id) -> bool:
+        db = DatabaseConnection.get_instance()
+        result = db.get_saved_sessions_collection().delete_one({"_id": ObjectId(session_id)})
+        db.get_saved_session_chunks_collection().delete_many({"session_id": ObjectId(session_id)})
+        return result.deleted_count > 0
+
+    @classmethod
+    def import_file(cls, filename: str, owner_key: str = None) -> str:
+        """Store a legacy fitness_session_*.json file in the archive"""
+        with open(filename, 'r') as f:
+            data = json.load(f)
+        start = data.get('session_start_time')
+        end = data.get('session_end_time')
+        return cls.save(
+            data.get('user_profile', {}),
+            data.get('memories', {}),
+            datetime.fromisoformat(start) if start else datetime.utcnow(),
+            owner_key=owner_key,
+            saved_at=datetime.fromisoformat(end) if end else None
+        )
+
+    @staticmethod
+    def describe(meta: Dict[str, Any]) -> str:
+        start = meta.get('session_start_time')
+        date = start.strftime('%Y-%m-%d %H:%M') if isinstance(start, datetime) else 'Unknown'
+        return (f"{meta.get('user_name', 'Unknown')} - {date} "
+                f"({meta.get('message_count', 0)} messages, {meta.get('vector_memory_count', 0)} memories)")
@@ -1,13 +1,22 @@
 from datetime import datetime
 from bson import ObjectId
 from utils.db import DatabaseConnection
+from utils.leaderboard import FamilyLeaderboard
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 class Workout:
     @classmethod
     def create_workout(cls, workout_data):
         db = DatabaseConnection.get_instance()
         workout_data['created_at'] = datetime.utcnow()
-        return db.get_fitness_data_collection().insert_one(workout_data)
+        result = db.get_fitness_data_collection().insert_one(workout_data)
+        try:
+            FamilyLeaderboard.get_instance().record_workout(workout_data)
+        except Exception as e:
+            logger.warning("Failed to update family leaderboard: %s", e)
+        return result
 
     @classmethod
     def get_workout(cls, workout_id):
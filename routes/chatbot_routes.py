@@ -1,78 +1,104 @@
-import traceback
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
 from datetime import datetime
 import json
 import os
-from typing import Dict, Any
-from models.fitness_trainer import FitnessAITrainer, FitnessMemoryManager  # Import your FitnessAITrainer class
+from typing import Dict, Any, Optional, TYPE_CHECKING
+from utils import ai_stack, request_timing
 from models.workout import Workout
-import re
+from models.exercise import ExerciseIndex, normalize_plan
+from models.plan_templates import generate_template_plan
+from models.chat_history import ChatHistory
+from utils.trainer_registry import TrainerRegistry
+from config import SESSION_STORE_SETTINGS, PLAN_TEMPLATE_SETTINGS, LLM_SETTINGS, VECTOR_MEMORY_SETTINGS
+from utils.llm_cache import LLMResponseCache
+from utils.conversation_summarizer import ConversationSummarizer
+from utils.job_queue import JobQueue, JobQueueFull
+from utils.llm_backend import get_backend, reset_request_llm_seconds, get_request_llm_seconds, LLMUnavailableError
+from utils.single_flight import SingleFlight
+from utils.workout_parser import parse_workout_plan, get_parse_metrics, PlanParseError, JSON_PLAN_INSTRUCTIONS
+import hashlib
+from bson import ObjectId
+from utils.structured_logging import get_logger
+
+if TYPE_CHECKING:
+    # The trainer pulls in LangChain, Chroma and torch; it is imported on first use through ai_stack
+    from models.fitness_trainer import FitnessAITrainer
+
+logger = get_logger(__name__)
 
 fitness_bp = Blueprint('fitness', __name__,url_prefix='/api/fitness')
 
-# Store active trainers in memory (in production, use Redis or database)
-active_trainers = {}
-trainer = None
+@fitness_bp.before_request
+def _start_llm_timer():
+    reset_request_llm_seconds()
+
+@fitness_bp.after_request
+def _report_llm_time(response):
+    # Time spent waiting on the model, so load tests can separate it from our own overhead.
+    # Streamed replies are still running here; their model time shows in /llm/metrics only.
+    response.headers['X-LLM-Time-Ms'] = f"{get_request_llm_seconds() * 1000:.1f}"
+    return response
+
+def _spill_trainer(session_id: str, trainer: 'FitnessAITrainer'):
+    """Persist an evicted trainer so the session can be rehydrated later"""
+    ChatHistory.save_session(session_id, trainer.to_snapshot())
+
+def _load_trainer(session_id: str):
+    """Rehydrate a spilled trainer from chat_history, if there is one"""
+    with request_timing.phase('session'):
+        try:
+            snapshot = ChatHistory.load_session(session_id)
+        except Exception as e:
+            logger.warning("Could not load spilled session %s: %s", session_id, e)
+            return None
+        if not snapshot:
+            return None
+        logger.debug("Rehydrating spilled session %s", session_id)
+        return ai_stack.trainer_from_snapshot(snapshot, memory_key=session_id)
+
+# Per-user trainer state, bounded by count, approximate bytes and idle time;
+# all trainers share one Groq client
+active_trainers = TrainerRegistry(
+    max_entries=SESSION_STORE_SETTINGS['max_entries'],
+    max_bytes=SESSION_STORE_SETTINGS['max_bytes'],
+    idle_ttl=SESSION_STORE_SETTINGS['idle_ttl'],
+    size_of=lambda trainer: trainer.approx_size(),
+    spill=_spill_trainer,
+    load=_load_trainer
+)
+
+def _llm_unavailable_response(error: Exception):
+    """503 with a Retry-After hint when the LLM is rate limited or its queue is full"""
+    response = jsonify({
+        'success': False,
+        'error': 'The AI trainer is busy right now. Please try again shortly.',
+        'detail': str(error)
+    })
+    response.headers['Retry-After'] = str(max(1, round(getattr(error, 'retry_after', None) or 5)))
+    return response, 503
 
-def get_or_create_trainer(session_id: str) -> FitnessAITrainer:
+def get_or_create_trainer(session_id: str) -> 'FitnessAITrainer':
     """Get existing trainer or create new one for session"""
     try:
-        print(f"\n=== Getting/Creating Trainer for Session {session_id} ===")
+        logger.debug("Getting/Creating Trainer for Session %s", session_id)
         
-        # Check if we have a valid API key
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            print("GROQ_API_KEY not found in environment variables")
-            raise ValueError("GROQ_API_KEY not found in environment variables")
-        
-        # Check if trainer exists for this session
-        if session_id in active_trainers:
-            trainer = active_trainers[session_id]
-            print(f"Found existing trainer for session {session_id}")
-            
-            # Verify trainer is still valid
-            if not hasattr(trainer, 'initialized') or not trainer.initialized:
-                print("Existing trainer not properly initialized, creating new instance")
-                del active_trainers[session_id]
-            elif not hasattr(trainer, 'memory_manager') or not trainer.memory_manager:
-                print("Existing trainer missing memory manager, creating new instance")
-                del active_trainers[session_id]
-            elif not trainer.memory_manager.is_initialized():
-                print("Existing trainer's memory manager not initialized, creating new instance")
-                del active_trainers[session_id]
+        # Drop trainers that are no longer usable
+        trainer = active_trainers.get(session_id)
+        if trainer is not None:
+            if not getattr(trainer, 'initialized', False):
+                logger.warning("Existing trainer not properly initialized, creating new instance")
+                active_trainers.remove(session_id)
+            elif not trainer.memory_manager or not trainer.memory_manager.is_initialized():
+                logger.warning("Existing trainer's memory manager not initialized, creating new instance")
+                active_trainers.remove(session_id)
             else:
-                print("Existing trainer is valid")
                 return trainer
         
-        # Create new trainer instance
-        print(f"Creating new trainer instance for session {session_id}")
-        trainer = FitnessAITrainer(api_key=api_key)
-        
-        # Verify trainer was created successfully
-        if not hasattr(trainer, 'initialized') or not trainer.initialized:
-            print("Failed to initialize trainer")
-            raise ValueError("Failed to initialize trainer")
-        
-        # Initialize memory manager if needed
-        if not hasattr(trainer, 'memory_manager') or not trainer.memory_manager:
-            print("Initializing memory manager...")
-            trainer.memory_manager = FitnessMemoryManager(trainer.client, trainer.user_profile)
-            print("Memory manager initialized")
-        
-        # Verify memory manager initialization
-        if not trainer.memory_manager.is_initialized():
-            print("Failed to initialize memory manager")
-            raise ValueError("Failed to initialize memory manager")
-        
-        # Store trainer in active trainers
-        active_trainers[session_id] = trainer
-        print("Trainer instance created and stored successfully")
-        
-        return trainer
+        logger.debug("Creating new trainer instance for session %s", session_id)
+        return active_trainers.get_or_create(session_id, lambda: ai_stack.create_trainer(session_id))
         
     except Exception as e:
-        print(f"Error in get_or_create_trainer: {str(e)}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error in get_or_create_trainer: %s", e)
         raise
 
 @fitness_bp.route('/session/start', methods=['POST'])
@@ -82,7 +108,7 @@ def start_session():
         # Check for GROQ_API_KEY
         groq_api_key = os.getenv("GROQ_API_KEY")
         if not groq_api_key:
-            print("Error: GROQ_API_KEY not found in environment variables")
+            logger.error("GROQ_API_KEY not found in environment variables")
             return jsonify({
                 'success': False,
                 'error': 'GROQ_API_KEY not configured. Please check your .env file.'
@@ -95,9 +121,9 @@ def start_session():
         # Initialize trainer
         try:
             trainer = get_or_create_trainer(session['fitness_session_id'])
-            print(f"Trainer initialized successfully for session {session['fitness_session_id']}")
+            logger.debug("Trainer initialized successfully for session %s", session['fitness_session_id'])
         except Exception as trainer_error:
-            print(f"Error initializing trainer: {str(trainer_error)}")
+            logger.error("Error initializing trainer: %s", trainer_error)
             return jsonify({
                 'success': False,
                 'error': f'Failed to initialize trainer: {str(trainer_error)}'
@@ -110,9 +136,7 @@ def start_session():
         })
     
     except Exception as e:
-        print(f"Error in start_session: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error in start_session: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -120,58 +144,55 @@ def start_session():
 
 @fitness_bp.route('/profile', methods=['GET', 'POST', 'PUT'])
 def create_profile():
-    global trainer
     try:
-        print("\n=== Profile Endpoint Called ===")
-        print(f"Method: {request.method}")
-        print(f"Headers: {dict(request.headers)}")
+        logger.debug("Profile endpoint called", method=request.method)
+        
+        # Profiles belong to the caller's session trainer
+        if 'fitness_session_id' not in session:
+            session['fitness_session_id'] = str(datetime.now().timestamp())
+        session_id = session['fitness_session_id']
+        trainer = active_trainers.get(session_id)
         
         if request.method == 'POST':
-            print("\nProcessing POST request")
             data = request.get_json()
-            print(f"Request data: {data}")
             
             if not data:
-                print("No data received")
+                logger.debug("No data received")
                 return jsonify({
                     "status": "error",
                     "message": "No data provided"
                 }), 400
                 
             if not trainer:
-                print("Creating new trainer instance")
-                trainer = FitnessAITrainer(os.getenv('GROQ_API_KEY'))
+                logger.debug("Creating new trainer instance")
+                trainer = get_or_create_trainer(session_id)
             
-            print("Creating profile...")
             trainer.create_new_profile(data)
+            active_trainers.touch(session_id)
             
             if not trainer.user_profile:
-                print("Profile creation failed")
+                logger.error("Profile creation failed")
                 return jsonify({
                     "status": "error",
                     "message": "Profile creation failed"
                 }), 500
                 
-            print(f"Profile created: {trainer.user_profile}")
+            logger.info("Profile created for session %s", session_id)
             
             response_data = {
                 "status": "success",
                 "message": "Profile created successfully",
                 "profile": trainer.user_profile
             }
-            print(f"Sending response: {response_data}")
             
             response = jsonify(response_data)
             response.headers['Content-Type'] = 'application/json'
             response.headers['Access-Control-Allow-Origin'] = '*'
             response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, OPTIONS'
             response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
-            
-            print("Response headers set")
             return response
             
         elif request.method == 'PUT':
-            print("\nProcessing PUT request")
             if not trainer:
                 return jsonify({
                     "success": False,
@@ -179,7 +200,6 @@ def create_profile():
                 }), 400
                 
             data = request.get_json()
-            print(f"Update data received: {data}")
             
             if not data:
                 return jsonify({
@@ -191,13 +211,13 @@ def create_profile():
                 # Update profile using the update_profile method
                 success = trainer.update_profile(data)
                 if not success:
-                    print("Profile update failed")
+                    logger.error("Profile update failed")
                     return jsonify({
                         "success": False,
                         "error": "Failed to update profile"
                     }), 500
                 
-                print("Profile updated successfully")
+                logger.info("Profile updated for session %s", session_id)
                 response = jsonify({
                     "success": True,
                     "message": "Profile updated successfully",
@@ -208,31 +228,26 @@ def create_profile():
                 return response
                 
             except Exception as e:
-                print(f"Error updating profile: {str(e)}")
-                import traceback
-                print(f"Traceback: {traceback.format_exc()}")
+                logger.exception("Error updating profile: %s", e)
                 return jsonify({
                     "success": False,
                     "error": f"Failed to update profile: {str(e)}"
                 }), 500
             
         elif request.method == 'GET':
-            print("\nProcessing GET request")
             if trainer and trainer.user_profile:
-                print(f"Returning profile: {trainer.user_profile}")
                 response = jsonify(trainer.user_profile)
                 response.headers['Content-Type'] = 'application/json'
                 response.headers['Access-Control-Allow-Origin'] = '*'
                 return response
                 
-            print("No profile found")
+            logger.debug("No profile found")
             return jsonify({
                 "status": "error",
                 "message": "No profile exists"
             }), 404
             
         elif request.method == 'OPTIONS':
-            print("\nProcessing OPTIONS request")
             response = jsonify({"status": "ok"})
             response.headers['Access-Control-Allow-Origin'] = '*'
             response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, OPTIONS'
@@ -240,9 +255,7 @@ def create_profile():
             return response
             
     except Exception as e:
-        print(f"\nError occurred: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error in profile endpoint: %s", e)
         return jsonify({
             "status": "error",
             "message": str(e)
@@ -252,11 +265,11 @@ def create_profile():
 def profile_status():
     """Check the status of the current profile and memory manager"""
     try:
-        print("\n=== Profile Status Check ===")
+        logger.debug("Profile Status Check")
         
         # Check if we have a valid session
         if not session.get('fitness_session_id'):
-            print("No active session found")
+            logger.debug("No active session found")
             return jsonify({
                 'status': 'error',
                 'message': 'No active session found',
@@ -274,9 +287,9 @@ def profile_status():
         # Get the trainer instance
         try:
             trainer = get_or_create_trainer(session['fitness_session_id'])
-            print(f"Trainer instance retrieved for session {session['fitness_session_id']}")
+            logger.debug("Trainer instance retrieved for session %s", session['fitness_session_id'])
         except Exception as e:
-            print(f"Error getting trainer instance: {str(e)}")
+            logger.error("Error getting trainer instance: %s", e)
             return jsonify({
                 'status': 'error',
                 'message': f'Failed to get trainer instance: {str(e)}',
@@ -294,7 +307,7 @@ def profile_status():
 
         # Check if we have a valid API key
         if not os.getenv('GROQ_API_KEY'):
-            print("GROQ_API_KEY not found in environment")
+            logger.warning("GROQ_API_KEY not found in environment")
             return jsonify({
                 'status': 'error',
                 'message': 'GROQ_API_KEY not found in environment variables',
@@ -304,7 +317,7 @@ def profile_status():
                     'debug_info': {
                         'session_id': session.get('fitness_session_id'),
                         'has_memory_manager': hasattr(trainer, 'memory_manager'),
-                        'has_client': hasattr(trainer, 'client'),
+                        'has_client': hasattr(trainer, 'backend'),
                         'api_key_set': False
                     }
                 }
@@ -312,7 +325,7 @@ def profile_status():
 
         # Check trainer initialization
         if not hasattr(trainer, 'initialized') or not trainer.initialized:
-            print("Trainer not fully initialized")
+            logger.warning("Trainer not fully initialized")
             return jsonify({
                 'status': 'initializing',
                 'message': 'AI trainer is still initializing',
@@ -322,7 +335,7 @@ def profile_status():
                     'debug_info': {
                         'session_id': session.get('fitness_session_id'),
                         'has_memory_manager': hasattr(trainer, 'memory_manager'),
-                        'has_client': hasattr(trainer, 'client'),
+                        'has_client': hasattr(trainer, 'backend'),
                         'api_key_set': True,
                         'trainer_initialized': False
                     }
@@ -331,7 +344,7 @@ def profile_status():
 
         # Verify memory manager initialization
         if not hasattr(trainer, 'memory_manager') or not trainer.memory_manager:
-            print("Memory manager not created")
+            logger.warning("Memory manager not created")
             return jsonify({
                 'status': 'error',
                 'message': 'Memory manager not created',
@@ -341,7 +354,7 @@ def profile_status():
                     'debug_info': {
                         'session_id': session.get('fitness_session_id'),
                         'has_memory_manager': False,
-                        'has_client': hasattr(trainer, 'client'),
+                        'has_client': hasattr(trainer, 'backend'),
                         'api_key_set': True,
                         'trainer_initialized': True
                     }
@@ -349,7 +362,7 @@ def profile_status():
             }), 500
 
         if not trainer.memory_manager.is_initialized():
-            print("Memory manager not initialized")
+            logger.warning("Memory manager not initialized")
             return jsonify({
                 'status': 'error',
                 'message': 'Memory manager not properly initialized',
@@ -359,7 +372,7 @@ def profile_status():
                     'debug_info': {
                         'session_id': session.get('fitness_session_id'),
                         'has_memory_manager': True,
-                        'has_client': hasattr(trainer, 'client'),
+                        'has_client': hasattr(trainer, 'backend'),
                         'api_key_set': True,
                         'trainer_initialized': True,
                         'memory_manager_initialized': False
@@ -368,8 +381,8 @@ def profile_status():
             }), 500
 
         # Verify client is properly initialized
-        if not hasattr(trainer, 'client') or not trainer.client:
-            print("Client not properly initialized")
+        if not getattr(trainer, 'backend', None):
+            logger.warning("Client not properly initialized")
             return jsonify({
                 'status': 'error',
                 'message': 'AI client not properly initialized',
@@ -388,7 +401,7 @@ def profile_status():
             }), 500
 
         # All checks passed
-        print("Profile and memory manager are properly initialized")
+        logger.debug("Profile and memory manager are properly initialized")
         response_data = {
             'status': 'success',
             'message': 'Profile and memory manager are properly initialized',
@@ -405,12 +418,11 @@ def profile_status():
                 }
             }
         }
-        print(f"Status response: {response_data}")
         return jsonify(response_data), 200
 
     except ValueError as e:
         error_msg = str(e)
-        print(f"ValueError in profile status check: {error_msg}")
+        logger.error("ValueError in profile status check: %s", error_msg)
         if "invalid_api_key" in error_msg.lower() or "authentication" in error_msg.lower():
             return jsonify({
                 'status': 'error',
@@ -430,8 +442,7 @@ def profile_status():
         raise
 
     except Exception as e:
-        print(f"Error in profile status check: {str(e)}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error in profile status check: %s", e)
         return jsonify({
             'status': 'error',
             'message': f'Error checking profile status: {str(e)}',
@@ -453,11 +464,11 @@ def profile_status():
 def chat():
     """Handle chat with fitness AI"""
     try:
-        print("\n=== Chat Request ===")
+        logger.debug("Chat Request")
         
         # Check for active session
         if 'fitness_session_id' not in session:
-            print("No active session found")
+            logger.debug("No active session found")
             return jsonify({
                 'success': False,
                 'error': 'No active session'
@@ -466,7 +477,7 @@ def chat():
         # Get request data
         data = request.json
         if not data:
-            print("No request data provided")
+            logger.debug("No request data provided")
             return jsonify({
                 'success': False,
                 'error': 'No request data provided'
@@ -474,7 +485,7 @@ def chat():
             
         message = data.get('message', '').strip()
         if not message:
-            print("Empty message received")
+            logger.debug("Empty message received")
             return jsonify({
                 'success': False,
                 'error': 'Message cannot be empty'
@@ -483,9 +494,9 @@ def chat():
         # Get trainer instance
         try:
             trainer = get_or_create_trainer(session['fitness_session_id'])
-            print(f"Trainer instance retrieved for session {session['fitness_session_id']}")
+            logger.debug("Trainer instance retrieved for session %s", session['fitness_session_id'])
         except Exception as e:
-            print(f"Error getting trainer instance: {str(e)}")
+            logger.error("Error getting trainer instance: %s", e)
             return jsonify({
                 'success': False,
                 'error': f'Failed to get trainer instance: {str(e)}'
@@ -493,7 +504,7 @@ def chat():
         
         # Check trainer initialization
         if not hasattr(trainer, 'initialized') or not trainer.initialized:
-            print("Trainer not fully initialized")
+            logger.warning("Trainer not fully initialized")
             return jsonify({
                 'success': False,
                 'error': 'AI trainer is still initializing',
@@ -502,13 +513,13 @@ def chat():
         
         # Check memory manager
         if not hasattr(trainer, 'memory_manager') or not trainer.memory_manager:
-            print("Memory manager not created")
+            logger.warning("Memory manager not created")
             try:
-                print("Attempting to initialize memory manager...")
-                trainer.memory_manager = FitnessMemoryManager(trainer.client, trainer.user_profile)
-                print("Memory manager initialized successfully")
+                logger.debug("Attempting to initialize memory manager...")
+                trainer.create_memory_manager()
+                logger.debug("Memory manager initialized successfully")
             except Exception as e:
-                print(f"Failed to initialize memory manager: {str(e)}")
+                logger.error("Failed to initialize memory manager: %s", e)
                 return jsonify({
                     'success': False,
                     'error': 'Failed to initialize memory manager',
@@ -517,17 +528,22 @@ def chat():
         
         # Verify memory manager initialization
         if not trainer.memory_manager.is_initialized():
-            print("Memory manager not properly initialized")
+            logger.warning("Memory manager not properly initialized")
             return jsonify({
                 'success': False,
                 'error': 'Memory manager not properly initialized'
             }), 500
         
+        # Stream tokens as Server-Sent Events when requested
+        if data.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+            return _stream_chat_response(trainer, message, session['fitness_session_id'])
+        
         # Get AI response
         try:
-            print("Getting AI response...")
-            response = trainer.get_ai_response(message)
-            print("AI response received successfully")
+            logger.debug("Getting AI response...")
+            response = trainer.get_ai_response(message, raise_unavailable=True)
+            active_trainers.touch(session['fitness_session_id'])
+            logger.debug("AI response received successfully")
             
             return jsonify({
                 'success': True,
@@ -535,22 +551,48 @@ def chat():
                 'timestamp': datetime.now().isoformat()
             })
             
+        except LLMUnavailableError as e:
+            return _llm_unavailable_response(e)
         except Exception as e:
-            print(f"Error getting AI response: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error getting AI response: %s", e)
             return jsonify({
                 'success': False,
                 'error': f'Failed to get AI response: {str(e)}'
             }), 500
         
     except Exception as e:
-        print(f"Unexpected error in chat endpoint: {str(e)}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Unexpected error in chat endpoint: %s", e)
         return jsonify({
             'success': False,
             'error': f'Unexpected error: {str(e)}'
         }), 500
 
+def _sse_event(data: Dict[str, Any], event: str = None) -> str:
+    """Format one Server-Sent Event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def _stream_chat_response(trainer: 'FitnessAITrainer', message: str, session_id: str) -> Response:
+    """Relay the trainer's token stream to the client as Server-Sent Events"""
+    def generate():
+        try:
+            for token in trainer.stream_ai_response(message):
+                yield _sse_event({'token': token})
+            active_trainers.touch(session_id)
+            yield _sse_event({'success': True, 'timestamp': datetime.now().isoformat()}, event='done')
+        except Exception as e:
+            logger.exception("Error streaming AI response: %s", e)
+            yield _sse_event({'success': False, 'error': f'Failed to get AI response: {str(e)}'}, event='error')
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
+        }
+    )
+
 @fitness_bp.route('/workout', methods=['POST'])
 @fitness_bp.route('/workout/generate', methods=['POST'])
 def generate_workout():
@@ -582,7 +624,8 @@ def generate_workout():
         
         Provide warmup, main exercises, and cooldown."""
         
-        response = trainer.get_ai_response(prompt)
+        response = trainer.get_plan_response(prompt, use_cache=_use_response_cache(data))
+        active_trainers.touch(session['fitness_session_id'])
         
         # After generating the workout
         trainer.memory_manager.add_message(
@@ -604,10 +647,10 @@ def generate_workout():
             }
         })
         
+    except LLMUnavailableError as e:
+        return _llm_unavailable_response(e)
     except Exception as e:
-        print(f"Error generating workout: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error generating workout: %s", e)
         return jsonify({
             'success': False,
             'error': f'Failed to generate workout: {str(e)}'
@@ -617,7 +660,7 @@ def generate_workout():
 def end_session():
     """End current session"""
     try:
-        print("\n=== Ending Session ===")
+        logger.debug("Ending Session")
         if 'fitness_session_id' not in session:
             return jsonify({
                 'success': False,
@@ -625,37 +668,51 @@ def end_session():
             }), 400
             
         session_id = session['fitness_session_id']
-        print(f"Ending session: {session_id}")
+        logger.debug("Ending session: %s", session_id)
         
-        if session_id in active_trainers:
-            trainer = active_trainers[session_id]
+        trainer = active_trainers.get(session_id)
+        if trainer is not None:
             # Save session data if requested
             should_save = False
             try:
                 if request.is_json and request.json:
                     should_save = request.json.get('save', False)
             except Exception as e:
-                print(f"Warning: Could not parse request JSON: {str(e)}")
+                logger.warning("Could not parse request JSON: %s", e)
             
             if should_save:
                 try:
                     trainer.save_session_data()
-                    print("Session data saved successfully")
+                    logger.debug("Session data saved successfully")
                 except Exception as e:
-                    print(f"Warning: Failed to save session data: {str(e)}")
+                    logger.warning("Failed to save session data: %s", e)
             
             # Clean up trainer instance
             try:
                 if hasattr(trainer, 'memory_manager'):
                     trainer.memory_manager.clear_session_memory()
-                del active_trainers[session_id]
-                print("Trainer instance cleaned up")
+                active_trainers.remove(session_id)
+                logger.debug("Trainer instance cleaned up")
             except Exception as e:
-                print(f"Warning: Error during trainer cleanup: {str(e)}")
+                logger.warning("Error during trainer cleanup: %s", e)
+        
+        # Ended sessions must not be rehydrated from the spill tier
+        try:
+            ChatHistory.delete_session(session_id)
+        except Exception as e:
+            logger.warning("Could not delete spilled session: %s", e)
         
+        if VECTOR_MEMORY_SETTINGS['enabled']:
+            try:
+                # Imported here so workers that never chat do not load numpy
+                from utils.vector_memory import VectorMemory
+                VectorMemory.get_instance().delete(session_id)
+            except Exception as e:
+                logger.warning("Could not delete vector memory index: %s", e)
+
         # Clear session
         session.pop('fitness_session_id', None)
-        print("Session cleared")
+        logger.debug("Session cleared")
         
         return jsonify({
             'success': True,
@@ -663,9 +720,7 @@ def end_session():
         })
         
     except Exception as e:
-        print(f"Error ending session: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error ending session: %s", e)
         return jsonify({
             'success': False,
             'error': f'Failed to end session: {str(e)}'
@@ -695,24 +750,61 @@ def session_status():
             'error': str(e)
         }), 500
 
+@fitness_bp.route('/session/metrics', methods=['GET'])
+def session_metrics():
+    """Trainer session store size and eviction counters for this worker"""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'metrics': active_trainers.get_metrics(),
+        'summarizer': ConversationSummarizer.get_instance().get_metrics()
+    })
+
+def _use_response_cache(data: Dict[str, Any]) -> bool:
+    """Callers opt out with {"cache": false} or a Cache-Control: no-cache header"""
+    if data.get('cache') is False:
+        return False
+    return 'no-cache' not in request.headers.get('Cache-Control', '')
+
+@fitness_bp.route('/llm/metrics', methods=['GET'])
+def llm_metrics():
+    """Calls, errors, 429s and time spent in the LLM backend for this worker"""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'metrics': get_backend().get_metrics(),
+        'single_flight': SingleFlight.get_instance().get_metrics(),
+        'plan_parse': get_parse_metrics()
+    })
+
+@fitness_bp.route('/cache/metrics', methods=['GET'])
+def cache_metrics():
+    """LLM response cache hit rate and counters for this worker"""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'metrics': LLMResponseCache.get_instance().get_metrics()
+    })
+
 # Add a simple status check endpoint
 @fitness_bp.route('/status', methods=['GET'])
 def status():
     """Simple status check endpoint"""
     return jsonify({
         'success': True,
-        'message': 'Fitness API is running'
+        'message': 'Fitness API is running',
+        'ai_stack': ai_stack.get_status()
     })
 
 def summarize_workout(workout_data):
-    # Simple summary: day titles and first exercise of each day
+    # Summary: day titles with every main exercise of each day
     days = workout_data.get('plan', {}).get('details', {}).get('days', [])
     summary_lines = []
     for day in days:
         title = day.get('title', '')
-        exercises = day.get('exercises', [])
-        if exercises:
-            summary_lines.append(f"{title}: {exercises[0]}")
+        names = [r['exercise'] for r in day.get('records', []) if r.get('kind') == 'main']
+        if names:
+            summary_lines.append(f"{title}: {', '.join(names)}")
         else:
             summary_lines.append(title)
     return " | ".join(summary_lines)
@@ -721,7 +813,7 @@ def summarize_workout(workout_data):
 def analyze_profile():
     """Analyze user profile and return AI response using memory based on user_id. Also save and retrieve workouts from fitness_data."""
     try:
-        print("\n=== Profile Analysis Endpoint Called ===")
+        logger.debug("Profile Analysis Endpoint Called")
         data = request.get_json()
         
         if not data:
@@ -747,171 +839,252 @@ def analyze_profile():
                 "error": "GROQ_API_KEY not configured"
             }), 500
         
-        # Use user_id as session_id for memory
-        user_id = str(data['user_id'])
-        trainer = get_or_create_trainer(user_id)
-        
-        # Create or update profile in memory
-        trainer.create_new_profile(data)
+        use_cache = _use_response_cache(data)
         
-        if not trainer.user_profile:
+        # Async mode: queue the generation and return a job id right away
+        if data.get('async') or 'respond-async' in request.headers.get('Prefer', ''):
+            try:
+                job_id = JobQueue.get_instance().submit(
+                    'workout_plan', {'data': data, 'use_cache': use_cache}, owner_id=data['user_id']
+                )
+            except JobQueueFull as e:
+                return jsonify({
+                    "success": False,
+                    "error": str(e)
+                }), 503
             return jsonify({
-                "success": False,
-                "error": "Failed to create profile"
-            }), 500
-        
-        # Retrieve previous workouts for the user
-        previous_workouts = Workout.get_user_workouts(user_id)
-        for w in previous_workouts:
-            w['_id'] = str(w['_id'])
-        # Get last 3 summaries
-        summaries = [w.get('summary', '') for w in previous_workouts if w.get('summary')]
-        recent_summaries = summaries[:3]
-        print(f"[DEBUG] Recent workout summaries to include in prompt: {recent_summaries}")
-        
-        # Generate workout using AI and parse response
-        workout_type = "general"
-        duration = 30
-        intensity = "moderate"
-        prompt = f"""Create a {intensity} {workout_type} workout plan for {duration} minutes.\n\nUser profile:\n- Goal: {trainer.user_profile['fitness_goal']}\n- Experience: {trainer.user_profile['experience']}\n- Equipment: {trainer.user_profile['equipment']}\n- Limitations: {trainer.user_profile['limitations']}\n"""
-        if recent_summaries:
-            prompt += "\nHere are summaries of my recent workouts:\n"
-            for i, s in enumerate(recent_summaries, 1):
-                prompt += f"Workout {i}: {s}\n"
-            prompt += "Please avoid repeating the same exercises and make the new plan progressive.\n"
-            print("[DEBUG] Summaries were included in the prompt.")
-        else:
-            print("[DEBUG] No summaries included in the prompt.")
-        prompt += """\nPlease provide a structured workout plan with the following format:\n\nPLAN TITLE: [Workout Plan Title]\nDURATION: [Duration in minutes]\nINTENSITY: [Intensity level]\n\nDAY 1 - [Day Title]:\n• [Exercise 1 with sets and reps]\n• [Exercise 2 with sets and reps]\n• [Exercise 3 with sets and reps]\n• [Exercise 4 with sets and reps]\n• [Exercise 5 with sets and reps]\n\nDAY 2 - [Day Title]:\n• [Exercise 1 with sets and reps]\n• [Exercise 2 with sets and reps]\n• [Exercise 3 with sets and reps]\n• [Exercise 4 with sets and reps]\n\nDAY 3 - [Day Title]:\n• [Exercise 1 with sets and reps]\n• [Exercise 2 with sets and reps]\n• [Exercise 3 with sets and reps]\n• [Exercise 4 with sets and reps]\n\nInclude warm-up and cool-down exercises for each day. Provide 3-4 days of workouts based on the user's fitness goal and experience level."""
-        print(f"[DEBUG] Final prompt sent to AI:\n{prompt}")
-        workout_response = trainer.get_ai_response(prompt)
-        print(workout_response)
-        workout_data = _parse_ai_workout_response(workout_response, intensity, workout_type, duration)
-        
-        # Calculate BMI
-        height_m = data['height'] / 100
-        bmi = data['weight'] / (height_m * height_m)
-        
-        # Save the generated workout in fitness_data with summary
-        summary = summarize_workout(workout_data)
-        Workout.create_workout({
-            "user_id": user_id,
-            "profile": trainer.user_profile,
-            "workout": workout_data,
-            "summary": summary,
-            "created_at": datetime.utcnow()
-        })
+                "success": True,
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/api/jobs/{job_id}"
+            }), 202
         
-        return jsonify({
-            "success": True,
-            "profile": trainer.user_profile,
-            "bmi": round(bmi, 2),
-            "workout": workout_data,
-            "parameters": {
-                'type': workout_type,
-                'duration': duration,
-                'intensity': intensity
-            },
-            "message": "Profile analyzed and workout plan generated successfully (with memory)"
-        }), 200
+        return jsonify(_generate_profile_workout(data, use_cache)), 200
         
+    except LLMUnavailableError as e:
+        return _llm_unavailable_response(e)
     except Exception as e:
-        print(f"Error in analyze_profile: {str(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error in analyze_profile: %s", e)
         return jsonify({
             "success": False,
             "error": str(e)
         }), 500
 
-def _parse_ai_workout_response(ai_response: str, intensity: str, workout_type: str, duration: int) -> dict:
-    """Parse AI workout response and convert to structured format (robust for markdown and flexible AI output)"""
+def _profile_from_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """The profile FitnessAITrainer.create_new_profile builds, without creating a trainer"""
     try:
-        lines = ai_response.split('\n')
-        days = []
-        current_day = None
-        current_exercises = []
-
-        for line in lines:
-            line = line.strip()
-            # Remove markdown bold and bullets
-            line = re.sub(r'^\*+\s*', '', line)
-            line = re.sub(r'\*+$', '', line)
-            line = line.strip()
-
-            # Match day headers like "DAY 1 - Upper Body", with or without bold, with or without colon
-            day_match = re.match(r'(DAY\s*\d+\s*-\s*.+)', line, re.IGNORECASE)
-            if day_match:
-                # Save previous day if exists
-                if current_day and current_exercises:
-                    days.append({
-                        "title": current_day,
-                        "exercises": current_exercises
-                    })
-                current_day = day_match.group(1)
-                current_exercises = []
-                continue
-
-            # If line is not empty and not a day header, treat as exercise
-            if line and current_day:
-                current_exercises.append(line)
-
-        # Add the last day
-        if current_day and current_exercises:
-            days.append({
-                "title": current_day,
-                "exercises": current_exercises
-            })
+        profile = dict(data)
+        height_m = profile['height'] / 100
+        profile['bmi'] = round(profile['weight'] / (height_m ** 2), 1)
+    except (KeyError, TypeError, ZeroDivisionError) as e:
+        raise ValueError(f"Failed to create profile: {str(e)}")
+    return profile
 
-        # If no days were parsed, create a default structure
-        if not days:
-            days = [
-                {
-                    "title": "Day 1 - Full Body Workout",
-                    "exercises": [
-                        "Warm-up: 5 minutes light cardio",
-                        "Squats: 3 sets x 12-15 reps",
-                        "Push-ups: 3 sets x 10-12 reps",
-                        "Dumbbell rows: 3 sets x 12 reps per arm",
-                        "Plank: 3 sets x 30 seconds",
-                        "Cool-down: 5 minutes stretching"
-                    ]
-                }
-            ]
-
-        return {
-            "plan": {
-                "title": f"{intensity.title()} {workout_type.title()} Workout Plan",
-                "duration": f"{duration} minutes",
-                "intensity": intensity,
-                "details": {
-                    "days": days
-                }
-            }
-        }
+def _generate_profile_workout(data: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+    """Generate, parse and store a workout plan for a profile; runs inline or as a background job"""
+    user_id = str(data['user_id'])
+    workout_type = "general"
+    duration = 30
+    intensity = "moderate"
+    # Common profiles get an instant template plan; the LLM only personalizes it in the background
+    mode = 'template' if PLAN_TEMPLATE_SETTINGS['enabled'] and data.get('mode') != 'llm' else 'llm'
+    
+    if mode == 'template':
+        # A template only needs the profile; the trainer (and the AI stack import on a cold
+        # worker) is left to the personalize_workout job
+        trainer = None
+        profile = _profile_from_data(data)
+    else:
+        # Use user_id as session_id for memory
+        trainer = get_or_create_trainer(user_id)
+        trainer.create_new_profile(data)
+        if not trainer.user_profile:
+            raise ValueError("Failed to create profile")
+        profile = trainer.user_profile
+    
+    # Double taps and client retries share one plan and one fitness_data document
+    return SingleFlight.get_instance().do(
+        _workout_flight_key(user_id, profile, mode, intensity, workout_type, duration),
+        lambda: _plan_profile_workout(trainer, profile, data, mode, use_cache, intensity, workout_type, duration)
+    )
+
+# Profile fields that make a repeated plan request a different request
+_FLIGHT_PROFILE_FIELDS = ('name', 'age', 'weight', 'height', 'fitness_goal', 'experience', 'equipment', 'limitations')
+
+def _workout_flight_key(user_id: str, profile: Dict[str, Any], mode: str, intensity: str,
+                        workout_type: str, duration: int) -> str:
+    """Single-flight key from the request alone.
+
+    Recent exercises are left out: they change once the first call stores its
+    plan, and a later duplicate must still map to the same key.
+    """
+    payload = {
+        'mode': mode,
+        'intensity': intensity,
+        'type': workout_type,
+        'duration': duration,
+        'profile': {field: ' '.join(str(profile.get(field, '')).lower().split()) for field in _FLIGHT_PROFILE_FIELDS}
+    }
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"generate_workout:{mode}:{user_id}:{digest}"
 
+def _plan_profile_workout(trainer: Optional['FitnessAITrainer'], profile: Dict[str, Any], data: Dict[str, Any],
+                          mode: str, use_cache: bool, intensity: str, workout_type: str,
+                          duration: int) -> Dict[str, Any]:
+    """Plan around the user's recent exercises and store it (the single-flight leader's work).
+
+    trainer is None in template mode.
+    """
+    user_id = str(data['user_id'])
+    
+    # Look up recently prescribed exercises in the exercise index
+    recent_exercises = ExerciseIndex.recent_exercises(user_id)
+    logger.debug("Recent exercises for user %s", user_id, count=len(recent_exercises))
+    
+    if mode == 'template':
+        workout_data = normalize_plan(generate_template_plan(
+            profile, intensity, workout_type, duration, recent_exercises
+        ))
+        return _store_template_workout(profile, data, workout_data, recent_exercises, intensity, workout_type, duration)
+    
+    prompt = _build_workout_prompt(profile, user_id, recent_exercises, intensity, workout_type, duration)
+    return _complete_profile_workout(trainer, data, prompt, use_cache, intensity, workout_type, duration)
+
+def _build_workout_prompt(profile: Dict[str, Any], user_id: str, recent_exercises, intensity: str,
+                          workout_type: str, duration: int, base_plan: Dict[str, Any] = None) -> str:
+    """Plan-generation prompt; with base_plan the model is asked to adapt that plan instead of starting over"""
+    progression_notes = ExerciseIndex.progression_notes(user_id, recent_exercises)
+    prompt = f"""Create a {intensity} {workout_type} workout plan for {duration} minutes.\n\nUser profile:\n- Goal: {profile['fitness_goal']}\n- Experience: {profile['experience']}\n- Equipment: {profile['equipment']}\n- Limitations: {profile['limitations']}\n"""
+    # Each recent exercise gets one instruction: progress the latest ones, avoid repeating the rest
+    avoid = sorted(e for e in recent_exercises if e not in progression_notes)
+    if avoid:
+        prompt += f"\nExercises from my recent workouts (avoid repeating these): {', '.join(avoid)}\n"
+    if progression_notes:
+        prompt += "\nIf you include these exercises, make them progressive compared to my latest prescriptions:\n"
+        prompt += "".join(f"- {note}\n" for note in progression_notes.values())
+    if base_plan:
+        prompt += "\nStart from this plan and only change what my profile calls for (exercise swaps, sets, reps, notes):\n"
+        for day in base_plan['plan']['details']['days']:
+            prompt += f"{day['title']}:\n" + "".join(f"• {exercise}\n" for exercise in day['exercises'])
+    if LLM_SETTINGS['json_plans']:
+        prompt += JSON_PLAN_INSTRUCTIONS
+    else:
+        prompt += """\nPlease provide a structured workout plan with the following format:\n\nPLAN TITLE: [Workout Plan Title]\nDURATION: [Duration in minutes]\nINTENSITY: [Intensity level]\n\nDAY 1 - [Day Title]:\n• [Exercise 1 with sets and reps]\n• [Exercise 2 with sets and reps]\n• [Exercise 3 with sets and reps]\n• [Exercise 4 with sets and reps]\n• [Exercise 5 with sets and reps]\n\nDAY 2 - [Day Title]:\n• [Exercise 1 with sets and reps]\n• [Exercise 2 with sets and reps]\n• [Exercise 3 with sets and reps]\n• [Exercise 4 with sets and reps]\n\nDAY 3 - [Day Title]:\n• [Exercise 1 with sets and reps]\n• [Exercise 2 with sets and reps]\n• [Exercise 3 with sets and reps]\n• [Exercise 4 with sets and reps]\n\nInclude warm-up and cool-down exercises for each day. Provide 3-4 days of workouts based on the user's fitness goal and experience level."""
+    logger.debug("Built workout prompt", chars=len(prompt))
+    return prompt
+
+def _store_profile_workout(profile: Dict[str, Any], data: Dict[str, Any], workout_data: Dict[str, Any],
+                           intensity: str, workout_type: str, duration: int):
+    """Save a parsed plan in fitness_data and the exercise index; returns the response body and workout id"""
+    user_id = str(data['user_id'])
+    
+    # Calculate BMI
+    height_m = data['height'] / 100
+    bmi = data['weight'] / (height_m * height_m)
+    
+    # Save the generated workout in fitness_data with summary
+    summary = summarize_workout(workout_data)
+    created_at = datetime.utcnow()
+    result = Workout.create_workout({
+        "user_id": user_id,
+        "profile": profile,
+        "workout": workout_data,
+        "summary": summary,
+        "created_at": created_at
+    })
+    try:
+        ExerciseIndex.index_workout(user_id, result.inserted_id, workout_data, created_at)
     except Exception as e:
-        print(f"Error parsing AI response: {str(e)}")
-        # Return default structure if parsing fails
-        return {
-            "plan": {
-                "title": f"{intensity.title()} {workout_type.title()} Workout Plan",
-                "duration": f"{duration} minutes",
-                "intensity": intensity,
-                "details": {
-                    "days": [
-                        {
-                            "title": "Day 1 - Full Body Workout",
-                            "exercises": [
-                                "Warm-up: 5 minutes light cardio",
-                                "Squats: 3 sets x 12-15 reps",
-                                "Push-ups: 3 sets x 10-12 reps",
-                                "Dumbbell rows: 3 sets x 12 reps per arm",
-                                "Plank: 3 sets x 30 seconds",
-                                "Cool-down: 5 minutes stretching"
-                            ]
-                        }
-                    ]
-                }
-            }
-        }
+        logger.warning("Failed to index workout exercises: %s", e)
+    
+    return {
+        "success": True,
+        "profile": profile,
+        "bmi": round(bmi, 2),
+        "workout": workout_data,
+        "workout_id": str(result.inserted_id),
+        "parameters": {
+            'type': workout_type,
+            'duration': duration,
+            'intensity': intensity
+        },
+        "message": "Profile analyzed and workout plan generated successfully (with memory)"
+    }
+
+def _complete_profile_workout(trainer: 'FitnessAITrainer', data: Dict[str, Any], prompt: str, use_cache: bool,
+                              intensity: str, workout_type: str, duration: int) -> Dict[str, Any]:
+    """Run the plan completion, then parse and store it"""
+    user_id = str(data['user_id'])
+    source = "llm"
+    try:
+        workout_data = trainer.get_plan_response(
+            prompt, use_cache=use_cache, json_mode=LLM_SETTINGS['json_plans'],
+            parse=lambda text: parse_workout_plan(text, intensity, workout_type, duration)
+        )
+    except PlanParseError as e:
+        logger.warning("%s, falling back to the template plan", e)
+        workout_data = generate_template_plan(trainer.user_profile, intensity, workout_type, duration)
+        source = "template"
+    active_trainers.touch(user_id)
+    response = _store_profile_workout(trainer.user_profile, data, normalize_plan(workout_data), intensity, workout_type, duration)
+    response["source"] = source
+    return response
+
+def _store_template_workout(profile: Dict[str, Any], data: Dict[str, Any], workout_data: Dict[str, Any],
+                            recent_exercises, intensity: str, workout_type: str, duration: int) -> Dict[str, Any]:
+    """Store a template plan and queue its LLM personalization when enabled"""
+    user_id = str(data['user_id'])
+    response = _store_profile_workout(profile, data, workout_data, intensity, workout_type, duration)
+    response["source"] = "template"
+    response["personalization_job_id"] = None
+    if not PLAN_TEMPLATE_SETTINGS['personalize']:
+        return response
+    
+    prompt = _build_workout_prompt(profile, user_id, recent_exercises, intensity, workout_type, duration,
+                                   base_plan=workout_data)
+    try:
+        response["personalization_job_id"] = JobQueue.get_instance().submit('personalize_workout', {
+            'user_id': user_id,
+            'data': data,
+            'workout_id': response["workout_id"],
+            'prompt': prompt,
+            'intensity': intensity,
+            'workout_type': workout_type,
+            'duration': duration
+        }, owner_id=user_id)
+    except JobQueueFull as e:
+        # The template plan stands on its own; personalization is best effort
+        logger.debug("Skipping workout personalization: %s", e)
+    return response
+
+def _personalize_workout(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Background job: rewrite a stored template plan with the LLM's personalized version"""
+    user_id = payload['user_id']
+    trainer = get_or_create_trainer(user_id)
+    # The job may run on a worker that never saw this user, like the workout_plan job
+    trainer.create_new_profile(payload['data'])
+    try:
+        workout_data = normalize_plan(trainer.get_plan_response(
+            payload['prompt'], json_mode=LLM_SETTINGS['json_plans'],
+            parse=lambda text: parse_workout_plan(text, payload['intensity'], payload['workout_type'], payload['duration'])
+        ))
+    except PlanParseError as e:
+        logger.warning("Personalization of workout %s failed, keeping the template: %s", payload['workout_id'], e)
+        return {'workout_id': payload['workout_id'], 'personalized': False}
+    
+    workout_data['plan']['source'] = 'personalized'
+    workout_id = ObjectId(payload['workout_id'])
+    Workout.update_workout(workout_id, {
+        "workout": workout_data,
+        "summary": summarize_workout(workout_data)
+    })
+    try:
+        ExerciseIndex.replace_workout(user_id, workout_id, workout_data)
+    except Exception as e:
+        logger.warning("Failed to re-index personalized workout: %s", e)
+    return {'workout_id': payload['workout_id'], 'personalized': True, 'workout': workout_data}
+
+JobQueue.get_instance().register(
+    'workout_plan', lambda payload: _generate_profile_workout(payload['data'], payload.get('use_cache', True))
+)
+JobQueue.get_instance().register('personalize_workout', _personalize_workout)
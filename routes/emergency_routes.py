@@ -3,6 +3,7 @@ from models.emergency import Emergency
 from models.family import Family
 from models.user import User
 from bson import json_util, ObjectId
+from utils import request_timing
 import json
 import firebase_admin
 from firebase_admin import credentials, messaging
@@ -39,7 +40,8 @@ def send_family_notification(family_id, title, body, data=None):
         topic=topic,
         data=data or {}
     )
-    response = messaging.send(message)
+    with request_timing.phase('notify'):
+        response = messaging.send(message)
     return response
 
 @emergency_bp.route('/', methods=['POST'])
@@ -1,10 +1,14 @@
 from flask import Blueprint, request, jsonify
 from models.family import Family
 from models.user import User
+from utils.leaderboard import FamilyLeaderboard
+from utils.structured_logging import get_logger
 from bson import json_util, ObjectId
 import json
 from datetime import datetime
 
+logger = get_logger(__name__)
+
 family_bp = Blueprint('family', __name__, url_prefix='/api/families')
 
 @family_bp.route('/', methods=['POST'])
@@ -25,9 +29,9 @@ def create_family():
             }]
         }
         
-        print(f"[DEBUG] Creating family with data: {family_data}")
+        logger.debug("Creating family %s", family_data['name'], creator_id=family_data['creator_id'])
         result = Family.create_family(family_data)
-        print(f"[DEBUG] Family created with ID: {result.inserted_id}")
+        logger.info("Family created with ID %s", result.inserted_id)
         
         return jsonify({
             "success": True,
@@ -36,7 +40,7 @@ def create_family():
         }), 201
         
     except Exception as e:
-        print(f"[DEBUG] Error creating family: {str(e)}")
+        logger.error("Error creating family: %s", e)
         return jsonify({
             "success": False,
             "error": str(e)
@@ -73,15 +77,41 @@ def update_settings(family_id):
     Family.update_settings(family_id, data['settings'])
     return jsonify({"message": "Settings updated successfully"}), 200
 
+@family_bp.route('/<family_id>/leaderboard', methods=['GET'])
+def get_leaderboard(family_id):
+    """Get this week's family leaderboard for a metric, plus the caller's rank"""
+    try:
+        metric = request.args.get('metric', 'calories')
+        limit = request.args.get('limit', type=int)
+        user_id = request.args.get('user_id')
+
+        leaderboard = FamilyLeaderboard.get_instance().get_leaderboard(
+            family_id, metric=metric, limit=limit, user_id=user_id
+        )
+        return jsonify({
+            'success': True,
+            'leaderboard': leaderboard
+        }), 200
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @family_bp.route('/user/<user_id>/members', methods=['GET'])
 def get_user_family_members(user_id):
     """Get all members of the family that the user belongs to"""
     try:
-        print(f"[DEBUG] Getting family members for user_id: {user_id}")
+        logger.debug("Getting family members for user %s", user_id)
         
         # First find the family the user belongs to
         families = Family.find_by_member(user_id)
-        print(f"[DEBUG] Found families: {families}")
         
         if not families:
             return jsonify({
@@ -91,16 +121,13 @@ def get_user_family_members(user_id):
             
         # Get the first family (assuming user belongs to one family)
         family = families[0]
-        print(f"[DEBUG] Selected family: {family}")
-        print(f"[DEBUG] Family members: {family.get('members', [])}")
+        logger.debug("Selected family %s", family['_id'], members=len(family.get('members', [])))
         
         # Get all members' details
         members = []
         for member in family.get('members', []):
-            print(f"[DEBUG] Processing member: {member}")
             member_id = member['user_id']
             user = User.find_by_id(member_id)
-            print(f"[DEBUG] Found user details: {user}")
             if user:
                 members.append({
                     'user_id': str(user['_id']),
@@ -111,7 +138,6 @@ def get_user_family_members(user_id):
                     'joined_at': member['joined_at']
                 })
         
-        print(f"[DEBUG] Final members list: {members}")
         return jsonify({
             'success': True,
             'family_id': str(family['_id']),
@@ -120,10 +146,7 @@ def get_user_family_members(user_id):
         }), 200
         
     except Exception as e:
-        print(f"[DEBUG] Error occurred: {str(e)}")
-        print(f"[DEBUG] Error type: {type(e)}")
-        import traceback
-        print(f"[DEBUG] Traceback: {traceback.format_exc()}")
+        logger.exception("Error getting family members for user %s: %s", user_id, e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -0,0 +1,42 @@
+from flask import Blueprint, jsonify
+from flask_socketio import join_room, emit
+from models.job import Job
+from services.notification_service import socketio
+from utils.job_queue import JobQueue
+
+job_bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+def _job_room(job_id):
+    return f"job:{job_id}"
+
+def _push_job_update(job):
+    """Push a finished job to Socket.IO clients subscribed to it"""
+    socketio.emit('job_update', Job.to_public(job), to=_job_room(job['_id']))
+
+JobQueue.get_instance().add_listener(_push_job_update)
+
+@job_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll the status (and result, once finished) of a background job"""
+    # Make sure this worker runs jobs even if it has not submitted any yet
+    JobQueue.get_instance().ensure_started()
+    job = Job.get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': Job.to_public(job)}), 200
+
+@job_bp.route('/metrics', methods=['GET'])
+def job_metrics():
+    return jsonify({'success': True, 'metrics': JobQueue.get_instance().get_metrics()}), 200
+
+@socketio.on('subscribe_job')
+def subscribe_job(data):
+    """Join a job's room; if the job already finished, its final state is sent right away"""
+    job_id = str((data or {}).get('job_id', ''))
+    job = Job.get_job(job_id)
+    if not job:
+        emit('job_update', {'job_id': job_id, 'status': 'not_found'})
+        return
+    join_room(_job_room(job_id))
+    if job['status'] in (Job.SUCCEEDED, Job.FAILED):
+        emit('job_update', Job.to_public(job))
@@ -5,6 +5,9 @@ from bson import json_util
 import json
 from datetime import datetime
 from bson import ObjectId
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 user_bp = Blueprint('users', __name__, url_prefix='/api/users')
 
@@ -22,20 +25,19 @@ def get_all_users():
 @user_bp.route('/<user_id>', methods=['GET'])
 def get_user(user_id):
     try:
-        print(f"Looking up user with ID: {user_id}")
+        logger.debug("Looking up user %s", user_id)
         user = User.find_by_id(user_id)
         
         if user:
-            print(f"Found user: {user}")
             return json.loads(json_util.dumps(user)), 200
         else:
-            print(f"No user found with ID: {user_id}")
+            logger.info("No user found with ID %s", user_id)
             return jsonify({
                 'error': 'User not found',
                 'user_id': user_id
             }), 404
     except Exception as e:
-        print(f"Error getting user: {str(e)}")
+        logger.error("Error getting user %s: %s", user_id, e)
         return jsonify({
             'error': str(e),
             'user_id': user_id
@@ -71,7 +73,7 @@ def create_user():
             }), 500
             
     except Exception as e:
-        print(f"Error creating user: {str(e)}")
+        logger.error("Error creating user: %s", e)
         return jsonify({
             'error': str(e)
         }), 500
@@ -79,7 +81,7 @@ def create_user():
 @user_bp.route('/<user_id>', methods=['DELETE'])
 def delete_user(user_id):
     try:
-        print(f"Attempting to delete user with ID: {user_id}")
+        logger.info("Deleting user %s", user_id)
         
         # First check if user exists
         user = User.find_by_id(user_id)
@@ -105,7 +107,7 @@ def delete_user(user_id):
             }), 500
             
     except Exception as e:
-        print(f"Error deleting user: {str(e)}")
+        logger.error("Error deleting user %s: %s", user_id, e)
         return jsonify({
             'error': str(e),
             'user_id': user_id
@@ -4,13 +4,16 @@ import requests  # For push notifications
 import os
 from dotenv import load_dotenv
 from flask_socketio import SocketIO, emit
+from config import SOCKETIO_MESSAGE_QUEUE
+from utils import request_timing
 
 load_dotenv()
 
 socketio = SocketIO()
 
 def init_socketio(app):
-    socketio.init_app(app, cors_allowed_origins="*")
+    # With several gunicorn workers, a message queue lets any worker emit to any client
+    socketio.init_app(app, cors_allowed_origins="*", message_queue=SOCKETIO_MESSAGE_QUEUE)
 
 class NotificationService:
     @staticmethod
@@ -23,20 +26,21 @@ class NotificationService:
             user = User.find_by_id(member['user_id'])
             if user and 'notification_token' in user:
                 # Send push notification (example using Firebase)
-                requests.post(
-                    'https://fcm.googleapis.com/fcm/send',
-                    headers={
-                        'Authorization': f'key={os.getenv("FIREBASE_KEY")}',
-                        'Content-Type': 'application/json'
-                    },
-                    json={
-                        'to': user['notification_token'],
-                        'notification': {
-                            'title': title,
-                            'body': message
+                with request_timing.phase('notify'):
+                    requests.post(
+                        'https://fcm.googleapis.com/fcm/send',
+                        headers={
+                            'Authorization': f'key={os.getenv("FIREBASE_KEY")}',
+                            'Content-Type': 'application/json'
+                        },
+                        json={
+                            'to': user['notification_token'],
+                            'notification': {
+                                'title': title,
+                                'body': message
+                            }
                         }
-                    }
-                )
+                    )
         return True
 
     @staticmethod
@@ -1,6 +1,8 @@
 from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT, GEOSPHERE
 from datetime import datetime
-from config import MONGODB_URI, DB_NAME, COLLECTIONS
+from config import MONGODB_URI, DB_NAME, COLLECTIONS, LOCATION_SETTINGS, FITNESS_SETTINGS, SESSION_STORE_SETTINGS, JOB_SETTINGS
+
+DAY_SECONDS = 24 * 3600
 
 def setup_database():
     """Set up all collections and indexes in MongoDB Atlas"""
@@ -59,7 +61,81 @@ def setup_database():
         fitness_data.create_index([("user_id", ASCENDING)])
         fitness_data.create_index([("date", DESCENDING)])
         fitness_data.create_index([("type", ASCENDING)])
+        # Used by archive_history.py to find cold documents; fitness data is archived, not TTL-expired
+        fitness_data.create_index([("created_at", ASCENDING)])
         print("✓ Fitness Data collection setup complete")
+
+        # 6. Exercise Index Collection
+        print("\n6. Setting up Exercise Index Collection...")
+        exercise_index = db[COLLECTIONS['exercise_index']]
+        exercise_index.create_index([("user_id", ASCENDING), ("date", DESCENDING)])
+        exercise_index.create_index(
+            [("date", ASCENDING)],
+            name="date_ttl",
+            expireAfterSeconds=FITNESS_SETTINGS['max_history_days'] * DAY_SECONDS
+        )
+        exercise_index.create_index([("exercise", ASCENDING), ("user_id", ASCENDING), ("date", DESCENDING)])
+        exercise_index.create_index([("workout_id", ASCENDING)])
+        print("✓ Exercise Index collection setup complete")
+
+        # 7. Location History Collection
+        print("\n7. Setting up Location History Collection...")
+        location_history = db[COLLECTIONS['location_history']]
+        location_history.create_index([("user_id", ASCENDING), ("recorded_at", DESCENDING)])
+        location_history.create_index(
+            [("recorded_at", ASCENDING)],
+            name="recorded_at_ttl",
+            expireAfterSeconds=LOCATION_SETTINGS['max_history_days'] * DAY_SECONDS
+        )
+        print("✓ Location History collection setup complete")
+
+        # 8. Chat History Collection
+        print("\n8. Setting up Chat History Collection...")
+        chat_history = db[COLLECTIONS['chat_history']]
+        chat_history.create_index(
+            [("updated_at", ASCENDING)],
+            name="updated_at_ttl",
+            expireAfterSeconds=SESSION_STORE_SETTINGS['spill_ttl_days'] * DAY_SECONDS
+        )
+        print("✓ Chat History collection setup complete")
+
+        # 9. LLM Response Cache Collection
+        print("\n9. Setting up LLM Cache Collection...")
+        llm_cache = db[COLLECTIONS['llm_cache']]
+        llm_cache.create_index([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+        print("✓ LLM Cache collection setup complete")
+
+        # 10. Jobs Collection
+        print("\n10. Setting up Jobs Collection...")
+        jobs = db[COLLECTIONS['jobs']]
+        jobs.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+        jobs.create_index([("status", ASCENDING), ("lease_until", ASCENDING)])
+        jobs.create_index([("owner_id", ASCENDING), ("created_at", DESCENDING)])
+        jobs.create_index(
+            [("created_at", ASCENDING)],
+            name="created_at_ttl",
+            expireAfterSeconds=JOB_SETTINGS['ttl_days'] * DAY_SECONDS
+        )
+        print("✓ Jobs collection setup complete")
+
+        # 11. In-flight Requests Collection (single-flight leases)
+        print("\n11. Setting up In-flight Requests Collection...")
+        inflight_requests = db[COLLECTIONS['inflight_requests']]
+        inflight_requests.create_index(
+            [("created_at", ASCENDING)],
+            name="created_at_ttl",
+            expireAfterSeconds=3600
+        )
+        print("✓ In-flight Requests collection setup complete")
+
+        # 12. Saved Sessions Collections (metadata + compressed message chunks)
+        print("\n12. Setting up Saved Sessions Collections...")
+        saved_sessions = db[COLLECTIONS['saved_sessions']]
+        saved_sessions.create_index([("saved_at", DESCENDING)])
+        saved_sessions.create_index([("owner_key", ASCENDING), ("saved_at", DESCENDING)])
+        saved_session_chunks = db[COLLECTIONS['saved_session_chunks']]
+        saved_session_chunks.create_index([("session_id", ASCENDING), ("seq", ASCENDING)], unique=True)
+        print("✓ Saved Sessions collections setup complete")
         
         
         # Print collection statistics
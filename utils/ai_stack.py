@@ -0,0 +1,136 @@
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Modules that pull in LangChain, Chroma, sentence-transformers and torch when imported
+TRAINER_MODULE = 'models.fitness_trainer'
+MODEL_LOADER_MODULE = 'utils.model_loader'
+
+_modules: Dict[str, Any] = {}
+_import_seconds: Dict[str, float] = {}
+# Held for the whole (possibly tens of seconds) import; _lock only guards the state below
+_import_lock = threading.Lock()
+_lock = threading.Lock()
+_warmup: Dict[str, Any] = {'pid': None, 'state': 'idle', 'error': None, 'seconds': None}
+
+
+def _load(name: str):
+    """Import a heavy module on first use and remember how long it took"""
+    module = _modules.get(name)
+    if module is None:
+        with _import_lock:
+            module = _modules.get(name)
+            if module is None:
+                started = time.perf_counter()
+                module = importlib.import_module(name)
+                seconds = time.perf_counter() - started
+                logger.info(f"Loaded {name} in {seconds:.2f}s")
+                with _lock:
+                    _import_seconds[name] = seconds
+                    _modules[name] = module
+    return module
+
+
+def trainer_class():
+    return _load(TRAINER_MODULE).FitnessAITrainer
+
+
+def create_trainer(memory_key: str):
+    """New FitnessAITrainer with its memory manager set up"""
+    trainer = trainer_class()(memory_key=memory_key)
+    trainer.create_memory_manager()
+    return trainer
+
+
+def trainer_from_snapshot(snapshot: Dict[str, Any], memory_key: str):
+    return trainer_class().from_snapshot(snapshot, memory_key=memory_key)
+
+
+def model_loader():
+    return _load(MODEL_LOADER_MODULE).ModelLoader()
+
+
+def local_embedder():
+    """In-process embedding model with embed_documents/embed_query.
+
+    The ONNX engine is used without importing the LangChain stack; otherwise
+    this falls back to sentence-transformers embeddings.
+    """
+    from utils import embedding_engine
+    if embedding_engine.is_available():
+        return embedding_engine.EmbeddingEngine.get_instance()
+    return model_loader().load_local_embeddings()
+
+
+def embedder():
+    """The embedding sidecar's client when it is running, else the in-process model,
+    behind the shared on-disk embedding cache"""
+    from utils import embedding_cache, embedding_service
+    if embedding_service.is_enabled():
+        return embedding_cache.cached(embedding_service.EmbeddingClient.get_instance())
+    return embedding_cache.cached(local_embedder())
+
+
+def _warm_up():
+    started = time.perf_counter()
+    try:
+        trainer_class()
+        model_loader().warm_up()
+    except Exception as e:
+        logger.error(f"AI stack warmup failed: {str(e)}")
+        _warmup.update(state='failed', error=str(e))
+        return
+    _warmup.update(state='ready', seconds=round(time.perf_counter() - started, 3))
+    logger.info(f"AI stack warmed up in {_warmup['seconds']}s")
+
+
+def ensure_warmup():
+    """Start loading the stack and embedding model in a background thread, once per process"""
+    if _warmup['pid'] == os.getpid():
+        return
+    with _lock:
+        if _warmup['pid'] == os.getpid():
+            return
+        # Threads don't survive a fork, so each gunicorn worker starts its own
+        _warmup.update(pid=os.getpid(), state='warming', error=None, seconds=None)
+        threading.Thread(target=_warm_up, name='ai-stack-warmup', daemon=True).start()
+
+
+def get_warmup_status() -> Dict[str, Any]:
+    if _warmup['pid'] != os.getpid():
+        return {'state': 'idle', 'error': None, 'seconds': None}
+    return {'state': _warmup['state'], 'error': _warmup['error'], 'seconds': _warmup['seconds']}
+
+
+def _embedding_metrics() -> Optional[Dict[str, Any]]:
+    for module_name, class_name in (('utils.embedding_service', 'EmbeddingClient'),
+                                    ('utils.embedding_engine', 'EmbeddingEngine')):
+        module = sys.modules.get(module_name)
+        cls = getattr(module, class_name, None)
+        if cls is not None and cls._instance is not None and cls._instance_pid == os.getpid():
+            return {'source': class_name, **cls._instance.get_metrics()}
+    return None
+
+
+def _embedding_cache_metrics() -> Optional[Dict[str, Any]]:
+    cls = getattr(sys.modules.get('utils.embedding_cache'), 'EmbeddingCache', None)
+    if cls is not None and cls._instance is not None and cls._instance_pid == os.getpid():
+        return cls._instance.get_metrics()
+    return None
+
+
+def get_status() -> Dict[str, Any]:
+    with _lock:
+        return {
+            'loaded': sorted(_modules),
+            'import_seconds': {name: round(seconds, 3) for name, seconds in _import_seconds.items()},
+            'warmup': get_warmup_status(),
+            'embedding': _embedding_metrics(),
+            'embedding_cache': _embedding_cache_metrics()
+        }
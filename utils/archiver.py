@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+import gzip
+import logging
+import os
+import time
+from typing import Dict, Any, List
+from bson import json_util
+from config import RETENTION_SETTINGS
+from utils.db import DatabaseConnection
+
+try:
+    import zstandard
+except ImportError:  # Fall back to gzip when zstandard is not installed
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveWriter:
+    """Appends JSON lines to date-partitioned compressed files.
+
+    Every flush writes one self-contained compressed frame (zstd) or member
+    (gzip); concatenated frames decompress as a single JSONL stream, so a
+    partition can grow across batches and runs without rewriting it.
+    """
+
+    def __init__(self, base_dir: str, collection_name: str):
+        self.base_dir = os.path.join(base_dir, collection_name)
+        self.extension = '.jsonl.zst' if zstandard else '.jsonl.gz'
+        self._compressor = zstandard.ZstdCompressor(level=10) if zstandard else None
+
+    def partition_path(self, day: datetime) -> str:
+        return os.path.join(self.base_dir, day.strftime('%Y'), day.strftime('%m'),
+                            day.strftime('%d') + self.extension)
+
+    def _compress(self, payload: bytes) -> bytes:
+        if self._compressor:
+            return self._compressor.compress(payload)
+        return gzip.compress(payload)
+
+    def write(self, day: datetime, documents: List[Dict[str, Any]]) -> str:
+        path = self.partition_path(day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = ''.join(json_util.dumps(doc) + '\n' for doc in documents).encode('utf-8')
+        with open(path, 'ab') as f:
+            f.write(self._compress(payload))
+            f.flush()
+            os.fsync(f.fileno())
+        return path
+
+
+def archive_collection(collection_name: str, date_field: str, max_history_days: int,
+                       archive_dir: str = None, batch_size: int = None,
+                       batch_pause: float = None, dry_run: bool = False) -> Dict[str, int]:
+    """Move documents older than max_history_days into archive files, batch by batch.
+
+    Each batch is a fresh, short query resuming after the last archived _id,
+    so no cursor or lock is held across the run. Documents are only deleted
+    once their batch has been fsynced to disk; a crash between the two steps
+    can at worst archive a batch twice, never lose it.
+    """
+    archive_dir = archive_dir or RETENTION_SETTINGS['archive_dir']
+    batch_size = batch_size or RETENTION_SETTINGS['batch_size']
+    batch_pause = RETENTION_SETTINGS['batch_pause'] if batch_pause is None else batch_pause
+
+    db = DatabaseConnection.get_instance()
+    collection = db.get_collection(collection_name)
+    writer = ArchiveWriter(archive_dir, collection_name)
+    cutoff = datetime.utcnow() - timedelta(days=max_history_days)
+    stats = {'archived': 0, 'deleted': 0, 'batches': 0}
+    last_id = None
+
+    logger.info(f"Archiving {collection_name} documents with {date_field} before {cutoff.isoformat()}")
+    while True:
+        query = {date_field: {"$lt": cutoff}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(collection.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        partitions: Dict[datetime, List[Dict[str, Any]]] = {}
+        for doc in batch:
+            stamp = doc.get(date_field)
+            day = stamp if isinstance(stamp, datetime) else doc["_id"].generation_time
+            partitions.setdefault(datetime(day.year, day.month, day.day), []).append(doc)
+
+        if dry_run:
+            stats['archived'] += len(batch)
+        else:
+            for day, documents in partitions.items():
+                writer.write(day, documents)
+                stats['archived'] += len(documents)
+            result = collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+            stats['deleted'] += result.deleted_count
+
+        stats['batches'] += 1
+        if batch_pause:
+            time.sleep(batch_pause)
+
+    logger.info(f"Archived {stats['archived']} {collection_name} documents in {stats['batches']} batches")
+    return stats
+
+
+def archive_all(dry_run: bool = False) -> Dict[str, Dict[str, int]]:
+    """Run archive_collection for every collection listed in RETENTION_SETTINGS"""
+    results = {}
+    for name, settings in RETENTION_SETTINGS['archived_collections'].items():
+        results[name] = archive_collection(
+            name,
+            settings['date_field'],
+            settings['max_history_days'],
+            dry_run=dry_run
+        )
+    return results
@@ -0,0 +1,108 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from config import SUMMARY_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a client and their AI fitness trainer.
+Update the summary with the new messages. Keep facts the trainer needs later: goals, injuries and
+limitations, preferences, plans given, progress reported and open questions. Drop small talk.
+Write at most {max_words} words of plain prose.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW MESSAGES:
+{messages}
+
+UPDATED SUMMARY:"""
+
+
+def summarize_messages(backend, previous_summary: str, messages: List[str]) -> str:
+    """Fold formatted messages ("User: ..." / "Assistant: ...") into the running summary"""
+    max_tokens = SUMMARY_SETTINGS['max_summary_tokens']
+    prompt = SUMMARY_PROMPT.format(
+        max_words=int(max_tokens * 0.75),
+        summary=previous_summary or "(none yet)",
+        messages="\n".join(messages)
+    )
+    reply = backend.complete(
+        [{"role": "user", "content": prompt}],
+        temperature=0.2,
+        max_tokens=max_tokens
+    )
+    return reply.strip()
+
+
+class ConversationSummarizer:
+    """Runs conversation compaction off the request path.
+
+    One small thread pool per process (re-created after a fork, since
+    gunicorn preloads the app in the master). A conversation is compacted
+    by at most one job at a time per process; across workers the
+    conditional update in MongoChatMessageHistory.compact keeps a stale
+    job from overwriting a newer summary.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or SUMMARY_SETTINGS['workers']
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid = None
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self.metrics = {'scheduled': 0, 'skipped_in_flight': 0, 'completed': 0, 'failed': 0,
+                        'messages_compacted': 0}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Lock held"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='summarizer')
+            self._executor_pid = os.getpid()
+            self._in_flight = set()
+        return self._executor
+
+    def schedule(self, memory_manager) -> bool:
+        """Queue compaction for a conversation unless one is already running"""
+        key = memory_manager.memory_key or id(memory_manager)
+        with self._lock:
+            executor = self._get_executor()
+            if key in self._in_flight:
+                self.metrics['skipped_in_flight'] += 1
+                return False
+            self._in_flight.add(key)
+            self.metrics['scheduled'] += 1
+        executor.submit(self._run, key, memory_manager)
+        return True
+
+    def _run(self, key, memory_manager):
+        try:
+            compacted = memory_manager.compact_history(
+                lambda summary, messages: summarize_messages(memory_manager.backend, summary, messages)
+            )
+            with self._lock:
+                self.metrics['completed'] += 1
+                self.metrics['messages_compacted'] += compacted
+        except Exception as e:
+            with self._lock:
+                self.metrics['failed'] += 1
+            logger.error(f"Conversation summarization failed for {key}: {str(e)}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.metrics, 'in_flight': len(self._in_flight)}
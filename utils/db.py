@@ -2,6 +2,7 @@ from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError, ConfigurationError
 import logging
 from config import MONGODB_CONFIG, MONGODB_URI, DB_NAME, COLLECTIONS
+from utils.request_timing import mongo_event_listeners
 import time
 from typing import Dict, Any
 import gc
@@ -42,8 +43,10 @@ class DatabaseConnection:
                     raise ConfigurationError("MONGODB_URI environment variable is not set")
                 
                 # Use connection pooling and configuration from MONGODB_CONFIG
+                # Command durations feed the mongo phase of request timing
                 self._client = MongoClient(
                     mongodb_uri,
+                    event_listeners=mongo_event_listeners(),
                     **MONGODB_CONFIG
                 )
                 
@@ -108,6 +111,26 @@ class DatabaseConnection:
         """Get chat history collection"""
         return self.get_collection('chat_history')
 
+    def get_exercise_index_collection(self):
+        """Get exercise index collection"""
+        return self.get_collection('exercise_index')
+
+    def get_location_history_collection(self):
+        """Get location history collection"""
+        return self.get_collection('location_history')
+
+    def get_jobs_collection(self):
+        """Get background jobs collection"""
+        return self.get_collection('jobs')
+
+    def get_saved_sessions_collection(self):
+        """Get saved trainer sessions collection"""
+        return self.get_collection('saved_sessions')
+
+    def get_saved_session_chunks_collection(self):
+        """Get saved trainer session message chunks collection"""
+        return self.get_collection('saved_session_chunks')
+
     def close(self):
         """Close the database connection"""
         if self._client:
@@ -0,0 +1,273 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import numpy as np
+from config import EMBEDDING_CACHE_SETTINGS, EMBEDDING_SETTINGS, MODEL_SETTINGS
+from utils import request_timing
+
+logger = logging.getLogger(__name__)
+
+KEY_BYTES = 16
+META_NAME = 'meta.json'
+LOCK_NAME = 'lock'
+
+
+def model_tag() -> str:
+    """Names the vectors this configuration produces (int8 and fp32 weights differ slightly)"""
+    from utils import embedding_engine
+    if embedding_engine.is_available():
+        variant = 'onnx-int8' if EMBEDDING_SETTINGS['quantize'] else 'onnx'
+    else:
+        variant = 'torch'
+    return f"{MODEL_SETTINGS['embedding_model']}:{variant}"
+
+
+def text_key(model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\0{text}".encode('utf-8'), digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding vectors shared by every process on a host.
+
+    The current generation is two append-only files: keys.<gen> holds 16-byte
+    hashes of model + text, and vectors.<gen>.f32 holds the matching float32
+    rows in the same order. meta.json names the generation and dimension.
+    Each process memory-maps the vectors read-only, so workers share the page
+    cache instead of holding copies, and reads only the keys appended since
+    it last looked to extend its offset index. Appends and compaction run
+    under an flock. Compaction writes a new generation that keeps the newest
+    entries, switches meta.json to it atomically and unlinks the old files.
+    Processes still mapping the old files keep reading them until they refresh.
+    """
+    _instance = None
+    _instance_pid = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None or cls._instance_pid != os.getpid():
+            with cls._instance_lock:
+                if cls._instance is None or cls._instance_pid != os.getpid():
+                    cls._instance = cls()
+                    cls._instance_pid = os.getpid()
+        return cls._instance
+
+    def __init__(self, directory: str = None, max_entries: int = None, compact_to: float = None):
+        directory = directory or EMBEDDING_CACHE_SETTINGS['directory'] or \
+            Path(MODEL_SETTINGS['cache_dir']).expanduser() / 'embedding_cache'
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries or EMBEDDING_CACHE_SETTINGS['max_entries']
+        self.keep_entries = max(1, int(self.max_entries * (compact_to or EMBEDDING_CACHE_SETTINGS['compact_to'])))
+        self._lock = threading.RLock()
+        self._meta_stamp = None
+        self.generation: Optional[int] = None
+        self.dim: Optional[int] = None
+        self._index: Dict[bytes, int] = {}
+        self._rows = 0
+        self._vectors: Optional[np.memmap] = None
+        self.metrics = {'hits': 0, 'misses': 0, 'appended': 0, 'compactions': 0, 'errors': 0}
+
+    def _paths(self, generation: int):
+        return self.directory / f"keys.{generation}", self.directory / f"vectors.{generation}.f32"
+
+    def _reset(self, generation: Optional[int], dim: Optional[int]):
+        self.generation, self.dim = generation, dim
+        self._index = {}
+        self._rows = 0
+        self._vectors = None
+
+    def _refresh(self):
+        """Pick up a new generation and any entries other processes appended"""
+        try:
+            stat = os.stat(self.directory / META_NAME)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp != self._meta_stamp:
+            with open(self.directory / META_NAME) as f:
+                meta = json.load(f)
+            self._meta_stamp = stamp
+            if meta['generation'] != self.generation or meta['dim'] != self.dim:
+                self._reset(meta['generation'], meta['dim'])
+
+        keys_path, vectors_path = self._paths(self.generation)
+        try:
+            # Vectors are written before keys, so a key is only indexed once its row is complete
+            rows = min(keys_path.stat().st_size // KEY_BYTES, vectors_path.stat().st_size // (4 * self.dim))
+            if rows <= self._rows:
+                return
+            with open(keys_path, 'rb') as f:
+                f.seek(self._rows * KEY_BYTES)
+                data = f.read((rows - self._rows) * KEY_BYTES)
+        except FileNotFoundError:
+            return  # Compacted meanwhile; the next refresh sees the new meta.json
+        rows = self._rows + len(data) // KEY_BYTES
+        for row in range(self._rows, rows):
+            offset = (row - self._rows) * KEY_BYTES
+            self._index[data[offset:offset + KEY_BYTES]] = row
+        self._rows = rows
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        """Cached vector (a read-only view of the mapped file) per key, None for misses"""
+        with self._lock:
+            rows = [self._index.get(key) for key in keys]
+            if None in rows:
+                try:
+                    self._refresh()
+                except (OSError, ValueError) as e:
+                    self.metrics['errors'] += 1
+                    logger.warning(f"Embedding cache refresh failed: {str(e)}")
+                rows = [self._index.get(key) for key in keys]
+            hits = sum(row is not None for row in rows)
+            self.metrics['hits'] += hits
+            self.metrics['misses'] += len(rows) - hits
+            return [None if row is None else self._vectors[row] for row in rows]
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray):
+        """Append new entries, compacting first when they would exceed max_entries"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not keys or vectors.ndim != 2:
+            return
+        with self._lock, open(self.directory / LOCK_NAME, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if self.generation is None or self.dim != vectors.shape[1]:
+                    if self.dim is not None:
+                        logger.info(f"Embedding dimension changed from {self.dim} to {vectors.shape[1]}, "
+                                    f"starting a new cache generation")
+                    self._rewrite([], np.empty((0, vectors.shape[1]), dtype=np.float32))
+                fresh: Dict[bytes, np.ndarray] = {}
+                for key, vector in zip(keys, vectors):
+                    if key not in self._index and key not in fresh:
+                        fresh[key] = vector
+                if not fresh:
+                    return
+                if self._rows + len(fresh) > self.max_entries:
+                    self._compact(fresh)
+                else:
+                    self._append(fresh)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, fresh: Dict[bytes, np.ndarray]):
+        """Lock held and index current"""
+        keys_path, vectors_path = self._paths(self.generation)
+        # Drop a partial write left by a crashed process so keys and rows stay aligned
+        for path, size in ((keys_path, self._rows * KEY_BYTES), (vectors_path, self._rows * 4 * self.dim)):
+            if path.stat().st_size != size:
+                os.truncate(path, size)
+        with open(vectors_path, 'ab') as f:
+            f.write(np.stack(list(fresh.values())).tobytes())
+        with open(keys_path, 'ab') as f:
+            f.write(b''.join(fresh))
+        self.metrics['appended'] += len(fresh)
+        self._refresh()
+
+    def _compact(self, fresh: Dict[bytes, np.ndarray]):
+        """Lock held and index current. Keeps the newest keep_entries entries, fresh ones included"""
+        keep = max(0, self.keep_entries - len(fresh))
+        kept = sorted((row, key) for key, row in self._index.items() if row >= self._rows - keep)
+        keys = [key for _, key in kept] + list(fresh)
+        parts = [np.asarray(self._vectors[[row for row, _ in kept]])] if kept else []
+        vectors = np.concatenate(parts + [np.stack(list(fresh.values()))])
+        keys, vectors = keys[-self.keep_entries:], vectors[-self.keep_entries:]
+        logger.info(f"Compacting embedding cache from {self._rows} to {len(keys)} entries")
+        self._rewrite(keys, vectors)
+        self.metrics['compactions'] += 1
+        self.metrics['appended'] += len(fresh)
+
+    def _rewrite(self, keys: List[bytes], vectors: np.ndarray):
+        """Lock held. Write a new generation, point meta.json at it and remove older files"""
+        generation = (self.generation or 0) + 1
+        keys_path, vectors_path = self._paths(generation)
+        with open(vectors_path, 'wb') as f:
+            f.write(vectors.tobytes())
+        with open(keys_path, 'wb') as f:
+            f.write(b''.join(keys))
+        tmp_path = self.directory / f".{META_NAME}.{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump({'generation': generation, 'dim': int(vectors.shape[1])}, f)
+        os.replace(tmp_path, self.directory / META_NAME)
+        for path in self.directory.glob('*'):
+            if path.name.startswith(('keys.', 'vectors.')) and path not in (keys_path, vectors_path):
+                path.unlink()
+        self._refresh()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.metrics['hits'] + self.metrics['misses']
+            return {
+                **self.metrics,
+                'hit_rate': round(self.metrics['hits'] / lookups, 3) if lookups else 0.0,
+                'entries': self._rows,
+                'generation': self.generation,
+                'directory': str(self.directory),
+            }
+
+
+class CachedEmbedder:
+    """Embeddings interface over another embedder that answers repeated texts from the EmbeddingCache"""
+
+    def __init__(self, embedder, cache: EmbeddingCache = None, model: str = None):
+        self.embedder = embedder
+        self.cache = cache or EmbeddingCache.get_instance()
+        self.model = model or model_tag()
+
+    def _compute(self, texts: List[str]) -> np.ndarray:
+        if hasattr(self.embedder, 'encode'):
+            return np.asarray(self.embedder.encode(texts), dtype=np.float32)
+        if hasattr(self.embedder, 'embed_documents'):
+            return np.asarray(self.embedder.embed_documents(texts), dtype=np.float32)
+        return np.asarray(self.embedder(texts), dtype=np.float32)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Unit-normalized float32 embeddings, one row per text"""
+        with request_timing.phase('embed'):
+            return self._encode(list(texts))
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return self._compute(texts)
+        keys = [text_key(self.model, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(texts[i], []).append(i)
+        if missing:
+            computed = self._compute(list(missing))
+            for row, positions in enumerate(missing.values()):
+                for i in positions:
+                    vectors[i] = computed[row]
+            try:
+                self.cache.put_many([keys[positions[0]] for positions in missing.values()], computed)
+            except OSError as e:
+                self.cache.metrics['errors'] += 1
+                logger.warning(f"Could not write to the embedding cache: {str(e)}")
+        return np.stack(vectors)
+
+    # LangChain Embeddings interface
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+    # Chroma EmbeddingFunction interface
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.embed_documents(input)
+
+
+def cached(embedder):
+    """Wrap an embedder with the on-disk cache when EMBEDDING_CACHE is on"""
+    if not EMBEDDING_CACHE_SETTINGS['enabled'] or embedder is None or isinstance(embedder, CachedEmbedder):
+        return embedder
+    return CachedEmbedder(embedder)
@@ -0,0 +1,201 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import numpy as np
+from config import EMBEDDING_SETTINGS, MODEL_SETTINGS
+from utils import request_timing
+from utils.model_manifest import ensure_model_dir, write_manifest
+
+try:
+    import onnxruntime as ort
+except ImportError:  # onnxruntime is optional, embeddings use sentence-transformers without it
+    ort = None
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # Needed alongside onnxruntime
+    Tokenizer = None
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL = 'onnx/model.onnx'
+QUANTIZED_MODEL = 'onnx/model_int8.onnx'
+
+
+def is_available() -> bool:
+    """True when EMBEDDING_BACKEND is onnx and its packages are installed"""
+    return EMBEDDING_SETTINGS['backend'] == 'onnx' and ort is not None and Tokenizer is not None
+
+
+def _quantized_model(directory: Path) -> Path:
+    """Dynamic int8 copy of the ONNX model, created once and recorded in the model manifest"""
+    target = directory / QUANTIZED_MODEL
+    if not target.exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info(f"Quantizing {ONNX_MODEL} to int8")
+        tmp_path = target.with_name(f".{target.stem}-{os.getpid()}.onnx")
+        quantize_dynamic(str(directory / ONNX_MODEL), str(tmp_path), weight_type=QuantType.QInt8)
+        os.replace(tmp_path, target)
+        write_manifest(directory, MODEL_SETTINGS['embedding_model'])
+    return target
+
+
+class _Request:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class EmbeddingEngine:
+    """all-MiniLM-L6-v2 sentence embeddings on ONNX Runtime (CPU).
+
+    Mean pooling over the attention mask and L2 normalization, matching
+    sentence-transformers. Concurrent encode() calls are queued and run
+    together: a batcher thread waits up to max_wait_ms for more requests,
+    then encodes everything pending in length-sorted chunks of max_batch
+    texts so padding stays small. One instance per process.
+    """
+    _instance = None
+    _instance_pid = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None or cls._instance_pid != os.getpid():
+            with cls._instance_lock:
+                if cls._instance is None or cls._instance_pid != os.getpid():
+                    cls._instance = cls()
+                    cls._instance_pid = os.getpid()
+        return cls._instance
+
+    def __init__(self, quantize: bool = None, threads: int = None, max_batch: int = None,
+                 max_wait_ms: float = None, max_length: int = None):
+        if ort is None or Tokenizer is None:
+            raise RuntimeError("onnxruntime and tokenizers are required for the ONNX embedding engine")
+        settings = EMBEDDING_SETTINGS
+        self.quantized = settings['quantize'] if quantize is None else quantize
+        self.max_batch = max_batch or settings['max_batch']
+        self.max_wait = (settings['max_wait_ms'] if max_wait_ms is None else max_wait_ms) / 1000
+
+        directory = ensure_model_dir(required=['tokenizer.json', ONNX_MODEL])
+        model_file = _quantized_model(directory) if self.quantized else directory / ONNX_MODEL
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or settings['threads']
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_file), options, providers=['CPUExecutionProvider'])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(str(directory / 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=max_length or settings['max_length'])
+        self.tokenizer.enable_padding()
+
+        self._queue: List[_Request] = []
+        self._cond = threading.Condition()
+        self._batcher: Optional[threading.Thread] = None
+        self.metrics = {'calls': 0, 'texts': 0, 'batches': 0, 'encode_seconds_total': 0.0}
+        self.dimension = self._encode(['warm up']).shape[1]
+        logger.info(f"ONNX embedding engine ready ({model_file.name}, dim {self.dimension})")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self._input_names:
+            feeds['token_type_ids'] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, feeds)[0]
+        weights = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return (pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)).astype(np.float32)
+
+    def _encode_sorted(self, texts: List[str]) -> np.ndarray:
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.max_batch):
+            chunk = order[start:start + self.max_batch]
+            vectors[chunk] = self._encode([texts[i] for i in chunk])
+        return vectors
+
+    def _ensure_batcher(self):
+        """Condition held"""
+        if self._batcher is None or not self._batcher.is_alive():
+            self._batcher = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+            self._batcher.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                # Give concurrent callers a moment to join this batch
+                deadline = time.monotonic() + self.max_wait
+                while sum(len(r.texts) for r in self._queue) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._queue = self._queue, []
+
+            texts = [text for request in batch for text in request.texts]
+            started = time.perf_counter()
+            try:
+                vectors = self._encode_sorted(texts)
+            except Exception as e:
+                logger.error(f"Embedding batch failed: {str(e)}")
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+            with self._cond:
+                self.metrics['batches'] += 1
+                self.metrics['texts'] += len(texts)
+                self.metrics['encode_seconds_total'] += time.perf_counter() - started
+            offset = 0
+            for request in batch:
+                request.result = vectors[offset:offset + len(request.texts)]
+                offset += len(request.texts)
+                request.done.set()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Unit-normalized float32 embeddings, one row per text"""
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        request = _Request(list(texts))
+        with self._cond:
+            self.metrics['calls'] += 1
+            self._ensure_batcher()
+            self._queue.append(request)
+            self._cond.notify()
+        with request_timing.phase('embed'):
+            request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    # LangChain Embeddings interface
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+    # Chroma EmbeddingFunction interface
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.embed_documents(input)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            batches = self.metrics['batches']
+            return {
+                **self.metrics,
+                'avg_batch_texts': round(self.metrics['texts'] / batches, 2) if batches else 0.0,
+                'queued': len(self._queue),
+                'quantized': self.quantized,
+            }
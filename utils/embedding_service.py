@@ -0,0 +1,326 @@
+"""Shared embedding sidecar: one process per host owns the model, workers call it over a Unix socket.
+
+Started and stopped by the gunicorn hooks in gunicorn.conf.py; can also be
+run directly with `python -m utils.embedding_service`.
+
+Wire format, both directions: a 4-byte big-endian header length, a JSON
+header, then (responses only) rows x dim float32 values in native order.
+Requests are {"texts": [...]}; responses {"rows": n, "dim": d} or {"error": "..."}.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from config import EMBEDDING_SERVICE_SETTINGS
+from utils import request_timing
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct('>I')
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+# Set by the gunicorn master once it has started the sidecar; inherited by workers
+MANAGED_ENV = 'EMBEDDING_SERVICE_SOCKET'
+
+
+def _is_managed() -> bool:
+    return os.environ.get(MANAGED_ENV) == EMBEDDING_SERVICE_SETTINGS['socket_path']
+
+
+def is_enabled() -> bool:
+    """True when this process should embed through the sidecar"""
+    if not EMBEDDING_SERVICE_SETTINGS['enabled']:
+        return False
+    return _is_managed() or os.path.exists(EMBEDDING_SERVICE_SETTINGS['socket_path'])
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            raise ConnectionError("Embedding service connection closed")
+        received += count
+    return bytes(buffer)
+
+
+def _recv_header(sock: socket.socket) -> Dict[str, Any]:
+    (length,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"Embedding service frame too large: {length} bytes")
+    return json.loads(_recv_exact(sock, length))
+
+
+def _send(sock: socket.socket, header: Dict[str, Any], payload: bytes = b''):
+    data = json.dumps(header).encode('utf-8')
+    sock.sendall(_LENGTH.pack(len(data)) + data + payload)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # One connection carries many requests from one worker thread
+        while True:
+            try:
+                request = _recv_header(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                vectors = self.server.encode(request['texts'])
+            except Exception as e:
+                logger.error(f"Embedding request failed: {str(e)}")
+                _send(self.request, {'error': str(e)})
+                continue
+            _send(self.request, {'rows': vectors.shape[0], 'dim': vectors.shape[1]}, vectors.tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str):
+        import numpy as np
+        from utils import ai_stack
+
+        self._np = np
+        self.embedder = ai_stack.local_embedder()
+        self.encode([' '])  # Load the model before accepting connections
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+
+    def encode(self, texts: List[str]):
+        if hasattr(self.embedder, 'encode'):
+            # The ONNX engine batches requests arriving on concurrent connections
+            return self.embedder.encode(texts)
+        return self._np.asarray(self.embedder.embed_documents(texts), dtype=self._np.float32)
+
+
+class EmbeddingClient:
+    """Per-process client; each thread keeps its own connection to the sidecar.
+
+    When the sidecar cannot be reached the call is served by the in-process
+    embedder instead (EMBEDDING_SERVICE_SETTINGS['fallback_local']). Only the
+    first connections of a process wait for a starting sidecar; after that a
+    failed connect is retried with exponential backoff, and calls made in
+    between fall back right away.
+    """
+    _instance = None
+    _instance_pid = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None or cls._instance_pid != os.getpid():
+            with cls._instance_lock:
+                if cls._instance is None or cls._instance_pid != os.getpid():
+                    cls._instance = cls()
+                    cls._instance_pid = os.getpid()
+        return cls._instance
+
+    def __init__(self, socket_path: str = None, timeout: float = None):
+        import numpy as np
+
+        self._np = np
+        self.socket_path = socket_path or EMBEDDING_SERVICE_SETTINGS['socket_path']
+        self.timeout = timeout or EMBEDDING_SERVICE_SETTINGS['timeout']
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Startup wait: a sidecar we started may still be loading the model, so the
+        # first connections wait for it (once per process) rather than loading a
+        # second copy in this worker
+        self._startup_deadline = None
+        self._seen_ready = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self.metrics = {'calls': 0, 'texts': 0, 'errors': 0, 'fallbacks': 0}
+
+    def _wait_deadline(self) -> float:
+        with self._lock:
+            if self._seen_ready or not _is_managed():
+                return 0.0
+            if self._startup_deadline is None:
+                self._startup_deadline = time.monotonic() + EMBEDDING_SERVICE_SETTINGS['connect_timeout']
+            return self._startup_deadline
+
+    def _connect(self) -> socket.socket:
+        if time.monotonic() < self._retry_at:
+            raise ConnectionRefusedError("Embedding service unavailable, waiting to retry")
+        deadline = self._wait_deadline()
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() < deadline:
+                    time.sleep(0.2)
+                    continue
+                with self._lock:
+                    self._failures += 1
+                    delay = min(EMBEDDING_SERVICE_SETTINGS['retry_delay'] * 2 ** (self._failures - 1),
+                                EMBEDDING_SERVICE_SETTINGS['max_retry_delay'])
+                    self._retry_at = time.monotonic() + delay
+                raise
+            with self._lock:
+                self._seen_ready = True
+                self._failures = 0
+                self._retry_at = 0.0
+            return sock
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = self._local.sock = self._connect()
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _request(self, texts: List[str]):
+        sock = self._connection()
+        _send(sock, {'texts': texts})
+        header = _recv_header(sock)
+        if 'error' in header:
+            raise RuntimeError(f"Embedding service error: {header['error']}")
+        payload = _recv_exact(sock, header['rows'] * header['dim'] * 4)
+        return self._np.frombuffer(payload, dtype=self._np.float32).reshape(header['rows'], header['dim'])
+
+    def encode(self, texts: List[str]):
+        """Unit-normalized float32 embeddings, one row per text"""
+        with request_timing.phase('embed'):
+            return self._encode(list(texts))
+
+    def _encode(self, texts: List[str]):
+        with self._lock:
+            self.metrics['calls'] += 1
+            self.metrics['texts'] += len(texts)
+        try:
+            try:
+                return self._request(texts)
+            except (ConnectionError, BrokenPipeError):
+                # Stale connection (sidecar restarted): reconnect once
+                self._close()
+                return self._request(texts)
+        except (OSError, ValueError, RuntimeError) as e:
+            self._close()
+            with self._lock:
+                self.metrics['errors'] += 1
+            if not EMBEDDING_SERVICE_SETTINGS['fallback_local']:
+                raise
+            logger.warning(f"Embedding service unavailable, embedding in-process: {str(e)}")
+            with self._lock:
+                self.metrics['fallbacks'] += 1
+            from utils import ai_stack
+            embedder = ai_stack.local_embedder()
+            if hasattr(embedder, 'encode'):
+                return embedder.encode(texts)
+            return self._np.asarray(embedder.embed_documents(texts), dtype=self._np.float32)
+
+    # LangChain Embeddings interface
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+    # Chroma EmbeddingFunction interface
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.embed_documents(input)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.metrics, 'socket_path': self.socket_path, 'connect_failures': self._failures}
+
+
+class EmbeddingSidecar:
+    """Runs the embedding server as a child of the gunicorn master and restarts it if it dies"""
+
+    def __init__(self, socket_path: str = None):
+        self.socket_path = socket_path or EMBEDDING_SERVICE_SETTINGS['socket_path']
+        self.process: Optional[subprocess.Popen] = None
+        self._stopping = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def _spawn(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'utils.embedding_service', '--socket', self.socket_path],
+            cwd=root
+        )
+        logger.info(f"Started embedding service (pid {self.process.pid}) on {self.socket_path}")
+
+    def _watch(self):
+        while not self._stopping.wait(EMBEDDING_SERVICE_SETTINGS['restart_delay']):
+            if self.process is not None and self.process.poll() is not None:
+                logger.warning(f"Embedding service exited with code {self.process.returncode}, restarting")
+                self._spawn()
+
+    def start(self):
+        self._spawn()
+        os.environ[MANAGED_ENV] = self.socket_path
+        self._watchdog = threading.Thread(target=self._watch, name='embedding-sidecar-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Wait until the server accepts connections (it binds after loading the model)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process is not None and self.process.poll() is not None:
+                return False
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(self.socket_path)
+                return True
+            except OSError:
+                time.sleep(0.2)
+        return False
+
+    def stop(self):
+        self._stopping.set()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve embeddings over a Unix socket")
+    parser.add_argument('--socket', default=EMBEDDING_SERVICE_SETTINGS['socket_path'])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s embedding-service %(levelname)s %(message)s')
+
+    server = EmbeddingServer(args.socket)
+    # Unwind through the finally below on terminate() so the socket file is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info(f"Embedding service listening on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List
+from config import JOB_SETTINGS
+from utils.structured_logging import get_request_id, reset_request_id, set_request_id
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already waiting"""
+
+
+class JobQueue:
+    """Mongo-backed job queue with a bounded pool of runner threads per process.
+
+    submit() stores the job and wakes a local runner; running runners also
+    poll the jobs collection, so jobs whose worker was recycled mid-run are
+    picked up again once their lease expires. ensure_started() starts the
+    runners once per process: gunicorn's post_worker_init hook calls it in
+    every worker (the preloading master runs no jobs), and the development
+    server calls it after create_app(). submit() and job polling call it too.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or JOB_SETTINGS['workers']
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._last_expiry_check = 0.0
+        self.metrics = {'submitted': 0, 'rejected': 0, 'succeeded': 0, 'failed': 0, 'retried': 0}
+
+    @property
+    def worker_id(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any]], Any]):
+        """handler(payload) returns the JSON-serializable job result"""
+        self._handlers[kind] = handler
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """listener(job_document) is called whenever a job finishes"""
+        self._listeners.append(listener)
+
+    def _count(self, metric: str):
+        with self._lock:
+            self.metrics[metric] += 1
+
+    def ensure_started(self):
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run_loop, name=f"job-runner-{i}", daemon=True)
+                thread.start()
+            self._started_pid = os.getpid()
+            logger.info(f"Started {self.workers} job runner threads in worker {os.getpid()}")
+
+    def submit(self, kind: str, payload: Dict[str, Any], owner_id: str = None) -> str:
+        from models.job import Job
+
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        if Job.count_queued() >= JOB_SETTINGS['max_queued']:
+            self._count('rejected')
+            raise JobQueueFull("Too many jobs are queued, try again later")
+
+        self.ensure_started()
+        job_id = Job.create_job(kind, payload, owner_id, request_id=get_request_id())
+        self._count('submitted')
+        self._wakeup.set()
+        return job_id
+
+    def _run_loop(self):
+        from models.job import Job
+
+        while True:
+            job = None
+            try:
+                job = Job.claim_next(self.worker_id, self._handlers.keys())
+                if job is None:
+                    self._expire_stale_jobs()
+            except Exception as e:
+                logger.error(f"Failed to claim job: {str(e)}")
+            if job is None:
+                self._wakeup.wait(JOB_SETTINGS['poll_interval'])
+                self._wakeup.clear()
+                continue
+            self._execute(job)
+
+    def _expire_stale_jobs(self):
+        from models.job import Job
+
+        now = time.monotonic()
+        if now - self._last_expiry_check < JOB_SETTINGS['lease_seconds']:
+            return
+        self._last_expiry_check = now
+        Job.fail_exhausted()
+
+    def _execute(self, job: Dict[str, Any]):
+        from models.job import Job
+
+        job_id = str(job['_id'])
+        started = time.perf_counter()
+        # Log under the submitting request's correlation id
+        token = set_request_id(job.get('request_id') or f"job-{job_id}")
+        try:
+            result = self._handlers[job['kind']](job['payload'])
+            finished = Job.complete_job(job_id, self.worker_id, result)
+            self._count('succeeded')
+            logger.info(f"Job {job_id} ({job['kind']}) succeeded in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            retry = job.get('attempts', 1) < JOB_SETTINGS['max_attempts']
+            logger.error(f"Job {job_id} ({job['kind']}) failed: {str(e)}\n{traceback.format_exc()}")
+            try:
+                finished = Job.fail_job(job_id, self.worker_id, str(e), retry=retry)
+            except Exception as store_error:
+                logger.error(f"Failed to record failure of job {job_id}: {str(store_error)}")
+                return
+            self._count('retried' if retry else 'failed')
+            if retry:
+                self._wakeup.set()
+                return
+        finally:
+            reset_request_id(token)
+
+        if finished is not None:
+            self._notify(finished)
+
+    def _notify(self, job: Dict[str, Any]):
+        for listener in self._listeners:
+            try:
+                listener(job)
+            except Exception as e:
+                logger.error(f"Job listener failed for {job['_id']}: {str(e)}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.metrics, 'workers': self.workers, 'running_in_pid': self._started_pid == os.getpid()}
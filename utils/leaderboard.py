@@ -0,0 +1,328 @@
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+import logging
+import re
+import threading
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+from bson import ObjectId
+from config import CACHE_SETTINGS, LEADERBOARD_SETTINGS
+from utils.db import DatabaseConnection
+
+try:
+    import redis
+except ImportError:  # Redis is optional, the local board is used instead
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)')
+
+
+def _week_key(moment: datetime) -> str:
+    """ISO year-week used to bucket leaderboard scores, e.g. 2025-W22"""
+    year, week, _ = moment.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _week_start(moment: datetime) -> datetime:
+    start = moment - timedelta(days=moment.weekday())
+    return start.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _epoch(moment: datetime) -> float:
+    """Seconds since the epoch of a naive UTC datetime"""
+    return (moment - datetime(1970, 1, 1)).total_seconds()
+
+
+def _workout_metrics(workout_data: Dict[str, Any]) -> Dict[str, float]:
+    """Extract leaderboard increments from a fitness_data document"""
+    calories = workout_data.get('calories_burned') or 0
+
+    duration = workout_data.get('duration')
+    if duration is None:
+        duration = workout_data.get('workout', {}).get('plan', {}).get('duration')
+    if isinstance(duration, str):
+        match = _DURATION_RE.search(duration)
+        duration = float(match.group(1)) if match else 0
+    try:
+        calories = float(calories)
+        duration = float(duration or 0)
+    except (TypeError, ValueError):
+        calories, duration = 0.0, 0.0
+
+    return {'calories': calories, 'duration': duration, 'workouts': 1}
+
+
+class LocalSortedBoard:
+    """In-process stand-in for a Redis ZSET.
+
+    Members are kept in a list sorted by (-score, member) next to a score map,
+    so top-N is a slice and rank lookups are a binary search.
+    """
+
+    def __init__(self):
+        self._scores: Dict[str, float] = {}
+        self._ranking: List[Tuple[float, str]] = []
+
+    def __len__(self):
+        return len(self._scores)
+
+    def incr(self, member: str, amount: float) -> float:
+        old = self._scores.get(member)
+        if old is not None:
+            del self._ranking[bisect_left(self._ranking, (-old, member))]
+        new = (old or 0) + amount
+        self._scores[member] = new
+        insort(self._ranking, (-new, member))
+        return new
+
+    def set(self, member: str, score: float):
+        old = self._scores.get(member)
+        if old is not None:
+            self.incr(member, score - old)
+        else:
+            self.incr(member, score)
+
+    def top(self, n: int) -> List[Tuple[str, float]]:
+        return [(member, -score) for score, member in self._ranking[:n]]
+
+    def rank(self, member: str) -> Optional[int]:
+        score = self._scores.get(member)
+        if score is None:
+            return None
+        return bisect_left(self._ranking, (-score, member))
+
+    def score(self, member: str) -> Optional[float]:
+        return self._scores.get(member)
+
+
+class FamilyLeaderboard:
+    """Weekly per-family leaderboards updated incrementally on every workout write"""
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._redis = self._connect_redis()
+        # (family_id, week, metric) -> LocalSortedBoard, only used without Redis
+        self._boards: Dict[Tuple[str, str, str], LocalSortedBoard] = {}
+        # (family_id, week) -> seed cutoff (epoch seconds), only used without Redis
+        self._seeded: Dict[Tuple[str, str], float] = {}
+        self._seeding: Dict[Tuple[str, str], float] = {}
+        self._board_lock = threading.Lock()
+
+    def _connect_redis(self):
+        if LEADERBOARD_SETTINGS['backend'] != 'redis' or redis is None:
+            return None
+        try:
+            client = redis.Redis(
+                host=CACHE_SETTINGS['host'],
+                port=CACHE_SETTINGS['port'],
+                socket_connect_timeout=1,
+                decode_responses=True
+            )
+            client.ping()
+            logger.info("Leaderboard using Redis sorted sets")
+            return client
+        except Exception as e:
+            logger.warning(f"Redis unavailable for leaderboard, using local board: {str(e)}")
+            return None
+
+    @staticmethod
+    def _redis_key(family_id: str, week: str, metric: str) -> str:
+        return f"leaderboard:{family_id}:{week}:{metric}"
+
+    def _ttl_seconds(self) -> int:
+        return LEADERBOARD_SETTINGS['weeks_to_keep'] * 7 * 24 * 3600
+
+    def _is_seeded(self, family_id: str, week: str) -> bool:
+        if self._redis is not None:
+            return bool(self._redis.exists(f"leaderboard:{family_id}:{week}:seeded"))
+        with self._board_lock:
+            return (family_id, week) in self._seeded
+
+    def _seed_cutoff(self, family_id: str, week: str) -> Optional[float]:
+        """Creation time (epoch seconds) from which workouts reach the board by increments.
+
+        None until a seed has started; workouts before the cutoff are counted by
+        the seed's fitness_data read instead.
+        """
+        if self._redis is not None:
+            seeded, seeding = self._redis.mget(f"leaderboard:{family_id}:{week}:seeded",
+                                               f"leaderboard:{family_id}:{week}:seeding")
+            value = seeded or seeding
+            return float(value) if value else None
+        with self._board_lock:
+            return self._seeded.get((family_id, week), self._seeding.get((family_id, week)))
+
+    def _seed(self, family_id: str, week: str, now: datetime):
+        """Build a family's board for the week once, from fitness_data.
+
+        Runs on the first read of a (family, week) pair. A reservation records
+        a cutoff: the seed sums workouts created before it, and record_workout
+        increments the live board for workouts created from it on, so each
+        workout is counted once even while the board is being built. The totals
+        are summed into the live board (ZUNIONSTORE ... AGGREGATE SUM) and only
+        then is the pair marked seeded; a failed seed drops its reservation so
+        the next read retries.
+        """
+        cutoff = _epoch(now)
+        if self._redis is not None:
+            reservation = f"leaderboard:{family_id}:{week}:seeding"
+            if not self._redis.set(reservation, cutoff, nx=True, ex=LEADERBOARD_SETTINGS['seed_timeout']):
+                return
+        else:
+            with self._board_lock:
+                if (family_id, week) in self._seeded or (family_id, week) in self._seeding:
+                    return
+                self._seeding[(family_id, week)] = cutoff
+
+        try:
+            totals = self._weekly_totals(family_id, now)
+            if self._redis is not None:
+                self._merge_redis(family_id, week, totals)
+                pipe = self._redis.pipeline()
+                pipe.set(f"leaderboard:{family_id}:{week}:seeded", cutoff, ex=self._ttl_seconds())
+                pipe.delete(reservation)
+                pipe.execute()
+            else:
+                with self._board_lock:
+                    for metric in LEADERBOARD_SETTINGS['metrics']:
+                        board = self._boards.setdefault((family_id, week, metric), LocalSortedBoard())
+                        for member, values in totals.items():
+                            board.incr(member, values[metric])
+                    self._seeded[(family_id, week)] = self._seeding.pop((family_id, week))
+        except Exception:
+            if self._redis is not None:
+                self._redis.delete(reservation)
+            else:
+                with self._board_lock:
+                    self._seeding.pop((family_id, week), None)
+            raise
+
+        self._drop_old_weeks(week)
+
+    def _weekly_totals(self, family_id: str, now: datetime) -> Dict[str, Dict[str, float]]:
+        """Per-member metric totals of the family's workouts created this week before now"""
+        db = DatabaseConnection.get_instance()
+        family = db.get_families_collection().find_one(
+            {"_id": ObjectId(family_id)}, {"members.user_id": 1}
+        )
+        member_ids = [m['user_id'] for m in (family or {}).get('members', [])]
+        totals = {str(uid): {metric: 0.0 for metric in LEADERBOARD_SETTINGS['metrics']} for uid in member_ids}
+
+        if member_ids:
+            cursor = db.get_fitness_data_collection().find(
+                {
+                    "user_id": {"$in": member_ids + [str(uid) for uid in member_ids]},
+                    "created_at": {"$gte": _week_start(now), "$lt": now}
+                },
+                {"user_id": 1, "duration": 1, "calories_burned": 1, "workout.plan.duration": 1}
+            )
+            for doc in cursor:
+                for metric, amount in _workout_metrics(doc).items():
+                    totals[str(doc['user_id'])][metric] += amount
+        return totals
+
+    def _merge_redis(self, family_id: str, week: str, totals: Dict[str, Dict[str, float]]):
+        """Add seeded totals to the live boards, keeping increments that already landed there"""
+        pipe = self._redis.pipeline()
+        for metric in LEADERBOARD_SETTINGS['metrics']:
+            key = self._redis_key(family_id, week, metric)
+            if totals:
+                temp_key = f"{key}:seed:{uuid.uuid4().hex}"
+                pipe.zadd(temp_key, {member: values[metric] for member, values in totals.items()})
+                pipe.zunionstore(key, [key, temp_key], aggregate='SUM')
+                pipe.delete(temp_key)
+            pipe.expire(key, self._ttl_seconds())
+        pipe.execute()
+
+    def _drop_old_weeks(self, current_week: str):
+        if self._redis is not None:
+            return  # Redis keys expire on their own
+        with self._board_lock:
+            weeks = sorted({key[1] for key in self._boards} | {current_week})
+            keep = set(weeks[-LEADERBOARD_SETTINGS['weeks_to_keep']:])
+            for key in [k for k in self._boards if k[1] not in keep]:
+                del self._boards[key]
+            self._seeded = {k: v for k, v in self._seeded.items() if k[1] in keep}
+
+    def record_workout(self, workout_data: Dict[str, Any]):
+        """Increment the weekly boards of every family the user belongs to"""
+        user_id = workout_data.get('user_id')
+        if not user_id:
+            return
+
+        from models.family import Family
+        now = workout_data.get('created_at') or datetime.utcnow()
+        week = _week_key(now)
+        increments = _workout_metrics(workout_data)
+        member = str(user_id)
+
+        for family in Family.get_user_families(member):
+            family_id = str(family['_id'])
+            # Boards not seeded yet, and workouts before the seed cutoff, are counted by the seed
+            cutoff = self._seed_cutoff(family_id, week)
+            if cutoff is None or _epoch(now) < cutoff:
+                continue
+            for metric, amount in increments.items():
+                if self._redis is not None:
+                    key = self._redis_key(family_id, week, metric)
+                    self._redis.zincrby(key, amount, member)
+                    self._redis.expire(key, self._ttl_seconds())
+                else:
+                    with self._board_lock:
+                        board = self._boards.setdefault((family_id, week, metric), LocalSortedBoard())
+                        board.incr(member, amount)
+
+    def get_leaderboard(self, family_id: str, metric: str = 'calories',
+                        limit: int = None, user_id: str = None) -> Dict[str, Any]:
+        """Return the top entries of this week's board plus the caller's rank"""
+        if metric not in LEADERBOARD_SETTINGS['metrics']:
+            raise ValueError(f"Unknown leaderboard metric: {metric}")
+        if not ObjectId.is_valid(str(family_id)):
+            raise ValueError(f"Invalid family id: {family_id}")
+        limit = limit or LEADERBOARD_SETTINGS['default_limit']
+        now = datetime.utcnow()
+        week = _week_key(now)
+        family_id = str(family_id)
+
+        if not self._is_seeded(family_id, week):
+            self._seed(family_id, week, now)
+
+        if self._redis is not None:
+            key = self._redis_key(family_id, week, metric)
+            top = self._redis.zrevrange(key, 0, limit - 1, withscores=True)
+            rank = self._redis.zrevrank(key, user_id) if user_id else None
+            score = self._redis.zscore(key, user_id) if user_id else None
+        else:
+            with self._board_lock:
+                board = self._boards.get((family_id, week, metric), LocalSortedBoard())
+                top = board.top(limit)
+                rank = board.rank(user_id) if user_id else None
+                score = board.score(user_id) if user_id else None
+
+        result = {
+            'family_id': family_id,
+            'week': week,
+            'metric': metric,
+            'entries': [
+                {'rank': i + 1, 'user_id': member, 'score': value}
+                for i, (member, value) in enumerate(top)
+            ]
+        }
+        if user_id:
+            result['user'] = {
+                'user_id': user_id,
+                'rank': rank + 1 if rank is not None else None,
+                'score': score or 0
+            }
+        return result
@@ -0,0 +1,358 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+from config import LLM_SETTINGS, FAKE_LLM_SETTINGS, LLM_LIMIT_SETTINGS
+from utils import request_timing
+from utils.llm_limiter import LLMLimiter, LLMUnavailableError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPLY = (
+    "Great question! Start with a 5 minute warm-up, then do 3 sets of 12 squats, "
+    "3 sets of 10 push-ups and a 30 second plank. Finish with 5 minutes of stretching."
+)
+
+# Returned for plan prompts so the workout parser sees a realistic plan under load tests
+PLAN_REPLY = """PLAN TITLE: Balanced Strength Plan
+DURATION: 30 minutes
+INTENSITY: moderate
+
+DAY 1 - Upper Body:
+• Warm-up: 5 minutes arm circles
+• Push-ups: 3 sets x 10 reps
+• Dumbbell rows: 3 sets x 12 reps
+• Shoulder press: 3 sets x 10 reps
+• Cool-down: 5 minutes stretching
+
+DAY 2 - Lower Body:
+• Warm-up: 5 minutes light cardio
+• Squats: 3 sets x 12 reps
+• Lunges: 3 sets x 10 reps per leg
+• Glute bridges: 3 sets x 15 reps
+• Cool-down: 5 minutes stretching
+
+DAY 3 - Core:
+• Warm-up: 5 minutes brisk walk
+• Plank: 3 sets x 30 seconds
+• Dead bugs: 3 sets x 12 reps
+• Bicycle crunches: 3 sets x 20 reps
+• Cool-down: 5 minutes stretching"""
+
+# The same plan for JSON-mode requests (response_format={"type": "json_object"})
+PLAN_JSON_REPLY = json.dumps({
+    'title': 'Balanced Strength Plan',
+    'duration': '30 minutes',
+    'intensity': 'moderate',
+    'days': [{'title': block.splitlines()[0].rstrip(':'),
+              'exercises': [line.lstrip('• ') for line in block.splitlines()[1:]]}
+             for block in PLAN_REPLY.split('\n\n')[1:]]
+})
+
+_request_timing = threading.local()
+
+_DURATION_PART_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse Groq reset hints like '7.66s', '2m59.56s' or '250ms' into seconds"""
+    parts = _DURATION_PART_RE.findall(str(value))
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _retry_after_from_headers(headers) -> Optional[float]:
+    """Seconds to wait according to retry-after or the x-ratelimit-reset-* headers"""
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    resets = [_parse_duration(headers.get(name, '')) for name in
+              ('x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens')]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+
+class LLMRateLimitError(LLMUnavailableError):
+    """The model provider rejected the request with HTTP 429"""
+
+    def __init__(self, message: str = "Rate limit exceeded", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def reset_request_llm_seconds():
+    _request_timing.seconds = 0.0
+
+
+def get_request_llm_seconds() -> float:
+    """Seconds this thread spent waiting on the model since the last reset"""
+    return getattr(_request_timing, 'seconds', 0.0)
+
+
+class LLMBackend:
+    """Chat-completion interface used by the trainer, summarizer and plan generation.
+
+    complete() returns the whole reply and stream() yields text chunks. Every
+    call holds a slot from the process-wide LLMLimiter and is retried with
+    jittered backoff on 429s (honouring the provider's retry hints), as long
+    as the wait fits the retry budget. Both record time spent inside the
+    model call, process-wide and per thread, so load tests can separate our
+    overhead from the model's.
+    """
+    name = 'base'
+
+    def __init__(self, limiter: LLMLimiter = None):
+        self.limiter = limiter or LLMLimiter.get_instance()
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self.metrics = {'calls': 0, 'stream_calls': 0, 'errors': 0, 'rate_limited': 0, 'retries': 0,
+                        'model_seconds_total': 0.0, 'model_seconds_max': 0.0}
+
+    def _complete(self, messages: List[Dict[str, str]], **params) -> str:
+        raise NotImplementedError
+
+    def _stream(self, messages: List[Dict[str, str]], **params) -> Iterator[str]:
+        raise NotImplementedError
+
+    def _record(self, elapsed: float, error: Exception = None):
+        _request_timing.seconds = get_request_llm_seconds() + elapsed
+        request_timing.record('llm', elapsed)
+        with self._lock:
+            self.metrics['model_seconds_total'] += elapsed
+            self.metrics['model_seconds_max'] = max(self.metrics['model_seconds_max'], elapsed)
+            if isinstance(error, LLMRateLimitError):
+                self.metrics['rate_limited'] += 1
+            elif error is not None:
+                self.metrics['errors'] += 1
+
+    def _params(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {'model': LLM_SETTINGS['model'], 'temperature': 0.7, 'max_tokens': 1500, 'top_p': 1, **params}
+
+    def _retry_delay(self, error: LLMRateLimitError, attempt: int, started: float) -> Optional[float]:
+        """Seconds to wait before retrying a 429, or None to give up"""
+        if attempt >= LLM_LIMIT_SETTINGS['max_retries']:
+            return None
+        if error.retry_after is not None:
+            # Provider hint plus up to 25% jitter so waiting callers don't retry in lockstep
+            delay = error.retry_after * self._random.uniform(1.0, 1.25)
+        else:
+            backoff = min(LLM_LIMIT_SETTINGS['backoff_max'], LLM_LIMIT_SETTINGS['backoff_base'] * 2 ** attempt)
+            delay = self._random.uniform(backoff / 2, backoff)
+        if time.monotonic() - started + delay > LLM_LIMIT_SETTINGS['retry_budget']:
+            return None
+        with self._lock:
+            self.metrics['retries'] += 1
+        return delay
+
+    def complete(self, messages: List[Dict[str, str]], **params) -> str:
+        with self._lock:
+            self.metrics['calls'] += 1
+        params = self._params(params)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                with self.limiter.slot():
+                    call_started = time.perf_counter()
+                    try:
+                        reply = self._complete(messages, **params)
+                    except Exception as e:
+                        self._record(time.perf_counter() - call_started, e)
+                        raise
+                    self._record(time.perf_counter() - call_started)
+                    return reply
+            except LLMRateLimitError as e:
+                delay = self._retry_delay(e, attempt, started)
+                if delay is None:
+                    raise
+                logger.warning(f"LLM rate limited, retrying in {delay:.2f}s (attempt {attempt + 1})")
+                time.sleep(delay)
+                attempt += 1
+
+    def stream(self, messages: List[Dict[str, str]], **params) -> Iterator[str]:
+        """Yield reply chunks; a 429 is retried only before the first chunk is sent"""
+        with self._lock:
+            self.metrics['stream_calls'] += 1
+        params = self._params(params)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            sent_any = False
+            try:
+                with self.limiter.slot():
+                    for chunk in self._timed_stream(messages, params):
+                        sent_any = True
+                        yield chunk
+                return
+            except LLMRateLimitError as e:
+                delay = None if sent_any else self._retry_delay(e, attempt, started)
+                if delay is None:
+                    raise
+                logger.warning(f"LLM rate limited, retrying stream in {delay:.2f}s (attempt {attempt + 1})")
+                time.sleep(delay)
+                attempt += 1
+
+    def _timed_stream(self, messages: List[Dict[str, str]], params: Dict[str, Any]) -> Iterator[str]:
+        """Only time spent waiting for the model is recorded, not time the consumer holds a chunk"""
+        elapsed = 0.0
+        error = None
+        try:
+            call_started = time.perf_counter()
+            chunks = self._stream(messages, **params)
+            while True:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - call_started
+                yield chunk
+                call_started = time.perf_counter()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._record(elapsed, error)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = self.metrics['calls'] + self.metrics['stream_calls']
+            metrics = {
+                **self.metrics,
+                'backend': self.name,
+                'model_seconds_avg': self.metrics['model_seconds_total'] / calls if calls else 0.0,
+            }
+        metrics['limiter'] = self.limiter.get_metrics()
+        return metrics
+
+
+class GroqBackend(LLMBackend):
+    """Groq chat completions over the process-wide pooled client"""
+    name = 'groq'
+
+    def __init__(self, client, limiter: LLMLimiter = None):
+        super().__init__(limiter)
+        self.client = client
+
+    @classmethod
+    def _translate(cls, error: Exception) -> Exception:
+        if type(error).__name__ == 'RateLimitError' or getattr(error, 'status_code', None) == 429:
+            headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+            return LLMRateLimitError(str(error), _retry_after_from_headers(headers))
+        return error
+
+    def _complete(self, messages, **params) -> str:
+        try:
+            response = self.client.chat.completions.create(messages=messages, stream=False, **params)
+        except Exception as e:
+            raise self._translate(e) from e
+        return response.choices[0].message.content
+
+    def _stream(self, messages, **params) -> Iterator[str]:
+        try:
+            stream = self.client.chat.completions.create(messages=messages, stream=True, **params)
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception as e:
+            raise self._translate(e) from e
+
+
+class FakeBackend(LLMBackend):
+    """Local stand-in for the model with configurable latency, streaming and 429s.
+
+    Time to first token is drawn from latency_distribution ('fixed',
+    'uniform', 'lognormal' or 'exponential') around latency_ms; each further
+    word takes token_ms. rate_limit_rate is the share of calls rejected with
+    LLMRateLimitError before any latency is spent.
+    """
+    name = 'fake'
+
+    def __init__(self, reply: str = None, latency_ms: float = None, latency_distribution: str = None,
+                 token_ms: float = None, rate_limit_rate: float = None, seed: int = None,
+                 limiter: LLMLimiter = None):
+        super().__init__(limiter)
+        settings = FAKE_LLM_SETTINGS
+        self.reply = reply
+        self.latency_ms = settings['latency_ms'] if latency_ms is None else latency_ms
+        self.latency_distribution = latency_distribution or settings['latency_distribution']
+        self.token_ms = settings['token_ms'] if token_ms is None else token_ms
+        self.rate_limit_rate = settings['rate_limit_rate'] if rate_limit_rate is None else rate_limit_rate
+        self._random = random.Random(settings['seed'] if seed is None else seed)
+
+    def _sample_latency(self) -> float:
+        with self._lock:
+            if self.latency_distribution == 'uniform':
+                ms = self._random.uniform(0.5 * self.latency_ms, 1.5 * self.latency_ms)
+            elif self.latency_distribution == 'lognormal':
+                # median latency_ms with a long tail
+                ms = self.latency_ms * self._random.lognormvariate(0, 0.5)
+            elif self.latency_distribution == 'exponential':
+                ms = self._random.expovariate(1 / self.latency_ms) if self.latency_ms else 0
+            else:
+                ms = self.latency_ms
+            rate_limited = self._random.random() < self.rate_limit_rate
+        if rate_limited:
+            raise LLMRateLimitError("Rate limit exceeded (fake backend)", retry_after=1.0)
+        return ms / 1000
+
+    def _reply_for(self, messages, params) -> str:
+        if self.reply is not None:
+            return self.reply
+        prompt = messages[-1]['content'].lower() if messages else ''
+        if 'workout plan' not in prompt:
+            return DEFAULT_REPLY
+        return PLAN_JSON_REPLY if params.get('response_format') else PLAN_REPLY
+
+    @staticmethod
+    def _tokens(reply: str) -> List[str]:
+        words = reply.split(' ')
+        return [w if i == 0 else ' ' + w for i, w in enumerate(words)]
+
+    def _complete(self, messages, **params) -> str:
+        reply = self._reply_for(messages, params)
+        time.sleep(self._sample_latency() + len(self._tokens(reply)) * self.token_ms / 1000)
+        return reply
+
+    def _stream(self, messages, **params) -> Iterator[str]:
+        reply = self._reply_for(messages, params)
+        time.sleep(self._sample_latency())
+        for i, token in enumerate(self._tokens(reply)):
+            if i and self.token_ms:
+                time.sleep(self.token_ms / 1000)
+            yield token
+
+
+_backend: Optional[LLMBackend] = None
+_backend_pid = None
+_backend_lock = threading.Lock()
+
+
+def get_backend(api_key: Optional[str] = None) -> LLMBackend:
+    """Return this process's LLM backend, selected by LLM_BACKEND (groq or fake)"""
+    global _backend, _backend_pid
+    if _backend is not None and _backend_pid == os.getpid():
+        return _backend
+
+    with _backend_lock:
+        if _backend is None or _backend_pid != os.getpid():
+            if LLM_SETTINGS['backend'] == 'fake':
+                logger.info("Using local fake LLM backend (LLM_BACKEND=fake)")
+                _backend = FakeBackend()
+            else:
+                from utils.llm_client import get_shared_client
+                _backend = GroqBackend(get_shared_client(api_key))
+            _backend_pid = os.getpid()
+    return _backend
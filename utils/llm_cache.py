@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+from config import LLM_CACHE_SETTINGS
+from utils.db import DatabaseConnection
+
+logger = logging.getLogger(__name__)
+
+# Profile fields that change what a plan prompt should produce; cached plans are generated
+# from a system prompt holding only these (prompt_builder.render_plan_system_prompt)
+CACHE_PROFILE_FIELDS = ('fitness_goal', 'experience', 'equipment', 'limitations')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _normalize_text(value: Any) -> str:
+    return _WHITESPACE_RE.sub(' ', str(value or '')).strip().lower()
+
+
+def _normalize_field(value: Any) -> Any:
+    """'Dumbbells, bands' and ['bands', 'dumbbells'] normalize to the same value"""
+    if isinstance(value, (list, tuple)):
+        items = value
+    elif isinstance(value, str) and ',' in value:
+        items = value.split(',')
+    else:
+        return _normalize_text(value)
+    return sorted(_normalize_text(item) for item in items if _normalize_text(item))
+
+
+def make_cache_key(model: str, template_version: str, profile: Dict[str, Any], message: str) -> str:
+    """Canonical hash of everything that determines a cacheable completion"""
+    payload = {
+        'model': model,
+        'template_version': template_version,
+        'profile': {field: _normalize_field(profile.get(field)) for field in CACHE_PROFILE_FIELDS},
+        'message': _normalize_text(message),
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-tier completion cache: an in-process LRU in front of the llm_cache collection.
+
+    Entries expire after ttl seconds in both tiers (Mongo through a TTL index
+    on expires_at). Responses larger than max_response_bytes are not stored.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.enabled = LLM_CACHE_SETTINGS['enabled']
+        self.ttl = LLM_CACHE_SETTINGS['ttl']
+        self.max_local_entries = LLM_CACHE_SETTINGS['max_local_entries']
+        self.max_response_bytes = LLM_CACHE_SETTINGS['max_response_bytes']
+        self._local: 'OrderedDict[str, tuple]' = OrderedDict()  # key -> (response, expires_at)
+        self._lock = threading.Lock()
+        self.metrics = {'local_hits': 0, 'persistent_hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}
+
+    def _count(self, metric: str):
+        with self._lock:
+            self.metrics[metric] += 1
+
+    def _collection(self):
+        return DatabaseConnection.get_instance().get_collection('llm_cache')
+
+    def _remember(self, key: str, response: str, expires_at: float):
+        with self._lock:
+            self._local[key] = (response, expires_at)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                if entry[1] > time.time():
+                    self._local.move_to_end(key)
+                    self.metrics['local_hits'] += 1
+                    return entry[0]
+                del self._local[key]
+
+        try:
+            doc = self._collection().find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}})
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"LLM cache lookup failed: {str(e)}")
+            doc = None
+        if doc is None:
+            self._count('misses')
+            return None
+
+        self._count('persistent_hits')
+        remaining = (doc['expires_at'] - datetime.utcnow()).total_seconds()
+        self._remember(key, doc['response'], time.time() + remaining)
+        return doc['response']
+
+    def set(self, key: str, response: str, metadata: Dict[str, Any] = None):
+        if len(response.encode('utf-8')) > self.max_response_bytes:
+            return
+        self._remember(key, response, time.time() + self.ttl)
+        try:
+            now = datetime.utcnow()
+            self._collection().update_one(
+                {'_id': key},
+                {'$set': {
+                    'response': response,
+                    'metadata': metadata or {},
+                    'created_at': now,
+                    'expires_at': now + timedelta(seconds=self.ttl)
+                }},
+                upsert=True
+            )
+            self._count('stores')
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"LLM cache store failed: {str(e)}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.metrics['local_hits'] + self.metrics['persistent_hits']
+            lookups = hits + self.metrics['misses']
+            return {
+                **self.metrics,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'local_entries': len(self._local),
+                'enabled': self.enabled,
+            }
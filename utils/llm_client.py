@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+from config import LLM_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_key_validated = False
+
+
+def _use_fake_backend() -> bool:
+    return LLM_SETTINGS['backend'] == 'fake'
+
+
+def _build_groq_client(api_key: str):
+    import httpx
+    from groq import Groq
+
+    http_client = httpx.Client(
+        timeout=LLM_SETTINGS['timeout'],
+        limits=httpx.Limits(
+            max_connections=LLM_SETTINGS['max_connections'],
+            max_keepalive_connections=LLM_SETTINGS['max_keepalive_connections'],
+            keepalive_expiry=LLM_SETTINGS['keepalive_expiry']
+        )
+    )
+    # Retries are handled by utils.llm_backend so they count against the LLM limiter
+    return Groq(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+def _resolve_api_key(api_key: Optional[str]) -> str:
+    api_key = (api_key or os.getenv('GROQ_API_KEY') or '').strip()
+    if not api_key:
+        raise ValueError("GROQ_API_KEY not found in environment variables")
+    return api_key
+
+
+def get_shared_client(api_key: Optional[str] = None):
+    """Return this process's Groq client, shared through utils.llm_backend.GroqBackend.
+
+    The client owns one keep-alive connection pool. It is created lazily and
+    re-created after a fork (gunicorn preloads the app in the master), so
+    workers never share sockets with their parent.
+    """
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = _build_groq_client(_resolve_api_key(api_key))
+            _client_pid = os.getpid()
+    return _client
+
+
+def validate_api_key(api_key: Optional[str] = None) -> bool:
+    """Check GROQ_API_KEY once per process by listing models (no completion).
+
+    Called from create_app(); with preload_app the result is inherited by
+    every forked worker, so trainer creation never pays an LLM round-trip.
+    """
+    global _key_validated
+    if _key_validated or _use_fake_backend():
+        _key_validated = True
+        return True
+
+    api_key = _resolve_api_key(api_key)
+    client = _build_groq_client(api_key)
+    try:
+        client.models.list()
+    except Exception as e:
+        error_msg = str(e)
+        if "invalid_api_key" in error_msg.lower():
+            raise ValueError("Invalid Groq API key. Please check your API key in the .env file.")
+        elif "authentication" in error_msg.lower():
+            raise ValueError("Authentication failed. Please check your API key in the .env file.")
+        raise ValueError(f"Failed to validate Groq API key: {error_msg}")
+    finally:
+        client.close()
+
+    _key_validated = True
+    logger.info("Groq API key validated")
+    return True
+
+
+def is_api_key_validated() -> bool:
+    return _key_validated
+
+
+_reachable_at = 0.0
+
+
+def check_backend_reachable() -> bool:
+    """Readiness check for the LLM backend; raises when Groq cannot be reached.
+
+    The fake backend always passes. For Groq the model list is fetched with a
+    short timeout, and a success is reused for LLM_SETTINGS['ready_check_interval'].
+    """
+    global _reachable_at
+    if _use_fake_backend():
+        return True
+    if time.monotonic() - _reachable_at < LLM_SETTINGS['ready_check_interval']:
+        return True
+    get_shared_client().with_options(timeout=5).models.list()
+    _reachable_at = time.monotonic()
+    return True
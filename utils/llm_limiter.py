@@ -0,0 +1,182 @@
+from contextlib import contextmanager
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+from config import LLM_LIMIT_SETTINGS, CACHE_SETTINGS
+
+try:
+    import redis
+except ImportError:  # Redis is optional, only the per-process limits apply without it
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """An LLM call could not be made or completed in time; the caller should back off"""
+
+
+class LLMQueueTimeout(LLMUnavailableError):
+    """Waiting for a free LLM slot would exceed the queue deadline"""
+
+
+class LLMLimiter:
+    """Bounds LLM calls with a semaphore (concurrency) and a token bucket (rate).
+
+    Both are per process. With cluster_rate_per_second set and Redis
+    reachable, a per-second counter in Redis also caps the rate across all
+    workers. Callers that would wait longer than queue_timeout are rejected:
+    immediately when the expected wait (queue length x average call time)
+    is already over the deadline, otherwise once the deadline passes.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, max_concurrent: int = None, rate_per_second: float = None, burst: int = None,
+                 queue_timeout: float = None, cluster_rate_per_second: float = None):
+        settings = LLM_LIMIT_SETTINGS
+        self.max_concurrent = max_concurrent or settings['max_concurrent']
+        self.rate_per_second = rate_per_second or settings['rate_per_second']
+        self.burst = burst or settings['burst']
+        self.queue_timeout = queue_timeout or settings['queue_timeout']
+        self.cluster_rate_per_second = cluster_rate_per_second if cluster_rate_per_second is not None \
+            else settings['cluster_rate_per_second']
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrent)
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._bucket_lock = threading.Lock()
+        self._redis = self._connect_redis() if self.cluster_rate_per_second else None
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        self._avg_call_seconds = 0.0
+        self.metrics = {'acquired': 0, 'rejected_fast': 0, 'timed_out': 0,
+                        'queue_seconds_total': 0.0, 'queue_seconds_max': 0.0}
+
+    def _connect_redis(self):
+        if redis is None:
+            logger.warning("redis package not installed, LLM rate limit is per process only")
+            return None
+        try:
+            client = redis.Redis(
+                host=CACHE_SETTINGS['host'],
+                port=CACHE_SETTINGS['port'],
+                socket_connect_timeout=1,
+                socket_timeout=1
+            )
+            client.ping()
+            logger.info("LLM limiter using Redis for the cluster-wide rate")
+            return client
+        except Exception as e:
+            logger.warning(f"Redis unavailable for LLM limiter, rate limit is per process only: {str(e)}")
+            return None
+
+    def _expected_wait(self) -> float:
+        """Lock held"""
+        if self._in_flight < self.max_concurrent:
+            return 0.0
+        return (self._waiting // self.max_concurrent + 1) * self._avg_call_seconds
+
+    def _take_local_token(self, deadline: float):
+        while True:
+            with self._bucket_lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate_per_second)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate_per_second
+            if now + wait > deadline:
+                raise LLMQueueTimeout("LLM rate limit queue deadline exceeded")
+            time.sleep(wait)
+
+    def _take_cluster_token(self, deadline: float):
+        if self._redis is None:
+            return
+        while True:
+            now = time.time()
+            key = f"llm:rate:{int(now)}"
+            try:
+                pipe = self._redis.pipeline()
+                pipe.incr(key)
+                pipe.expire(key, 2)
+                count = pipe.execute()[0]
+            except Exception as e:
+                logger.warning(f"Redis LLM rate check failed, skipping: {str(e)}")
+                return
+            if count <= self.cluster_rate_per_second:
+                return
+            wait = int(now) + 1 - now
+            if time.monotonic() + wait > deadline:
+                raise LLMQueueTimeout("Cluster LLM rate limit queue deadline exceeded")
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator[float]:
+        """Hold one LLM slot for the duration of a call; yields the seconds spent queued"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._lock:
+            if self._expected_wait() > timeout:
+                self.metrics['rejected_fast'] += 1
+                raise LLMQueueTimeout("LLM queue is full, expected wait exceeds the deadline")
+            self._waiting += 1
+        try:
+            if not self._semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                raise LLMQueueTimeout("Timed out waiting for a free LLM slot")
+            try:
+                self._take_local_token(deadline)
+                self._take_cluster_token(deadline)
+            except Exception:
+                self._semaphore.release()
+                raise
+        except LLMQueueTimeout:
+            with self._lock:
+                self.metrics['timed_out'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        queued = time.monotonic() - started
+        with self._lock:
+            self._in_flight += 1
+            self.metrics['acquired'] += 1
+            self.metrics['queue_seconds_total'] += queued
+            self.metrics['queue_seconds_max'] = max(self.metrics['queue_seconds_max'], queued)
+        call_started = time.monotonic()
+        try:
+            yield queued
+        finally:
+            elapsed = time.monotonic() - call_started
+            with self._lock:
+                self._in_flight -= 1
+                # Exponentially weighted average call time, for the fail-fast estimate
+                self._avg_call_seconds = elapsed if not self._avg_call_seconds else \
+                    0.8 * self._avg_call_seconds + 0.2 * elapsed
+            self._semaphore.release()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            acquired = self.metrics['acquired']
+            return {
+                **self.metrics,
+                'queue_seconds_avg': self.metrics['queue_seconds_total'] / acquired if acquired else 0.0,
+                'waiting': self._waiting,
+                'in_flight': self._in_flight,
+                'avg_call_seconds': round(self._avg_call_seconds, 3),
+                'max_concurrent': self.max_concurrent,
+                'rate_per_second': self.rate_per_second,
+                'cluster_rate_per_second': self.cluster_rate_per_second if self._redis is not None else None,
+            }
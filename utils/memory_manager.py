@@ -2,55 +2,198 @@ from datetime import datetime
 import os
 import gc
 import tempfile
-import logging
 import traceback
 import json
+import threading
 from langchain.memory import ConversationBufferMemory
-from langchain.schema import HumanMessage, AIMessage
-from typing import Dict, Any
+from langchain.schema import HumanMessage, AIMessage, BaseChatMessageHistory
+from typing import Callable, Dict, Any, List, Optional
+from config import CHAT_MEMORY_SETTINGS, VECTOR_MEMORY_SETTINGS, SUMMARY_SETTINGS
+from utils.db import DatabaseConnection
+from utils.vector_memory import VectorMemory
+from utils.conversation_summarizer import ConversationSummarizer
+from utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+def format_message(message) -> str:
+    if isinstance(message, HumanMessage):
+        return f"User: {message.content}"
+    return f"Assistant: {message.content}"
+
+
+class MongoChatMessageHistory(BaseChatMessageHistory):
+    """Chat history kept in one chat_history document per conversation.
+
+    Messages are appended with $push/$slice so the document holds a capped
+    window of the latest max_messages. Any worker can serve the next turn:
+    refresh() re-reads the window in a single find_one at the start of a turn,
+    and the rest of the turn works from that copy plus its own writes.
+    Older messages are folded into the document's running summary by compact().
+    """
+
+    def __init__(self, key: str, max_messages: int = None):
+        self.key = str(key)
+        self.max_messages = max_messages or CHAT_MEMORY_SETTINGS['max_messages']
+        self._messages: Optional[List] = None
+        self.summary = ''
+
+    def _collection(self):
+        return DatabaseConnection.get_instance().get_chat_history_collection()
+
+    @staticmethod
+    def _to_document(message) -> Dict[str, Any]:
+        return {
+            'type': 'human' if isinstance(message, HumanMessage) else 'ai',
+            'content': message.content,
+            'at': datetime.utcnow()
+        }
+
+    @staticmethod
+    def _from_document(doc: Dict[str, Any]):
+        if doc.get('type') == 'human':
+            return HumanMessage(content=doc['content'])
+        return AIMessage(content=doc['content'])
+
+    def refresh(self) -> List:
+        doc = self._collection().find_one({'_id': self.key}, {'messages': 1, 'summary': 1})
+        self._messages = [self._from_document(m) for m in (doc or {}).get('messages', [])]
+        self.summary = (doc or {}).get('summary', '')
+        return self._messages
+
+    @property
+    def messages(self) -> List:
+        if self._messages is None:
+            return self.refresh()
+        return self._messages
+
+    def add_messages(self, messages) -> None:
+        messages = list(messages)
+        self._collection().update_one(
+            {'_id': self.key},
+            {
+                '$push': {'messages': {
+                    '$each': [self._to_document(m) for m in messages],
+                    '$slice': -self.max_messages
+                }},
+                '$set': {'updated_at': datetime.utcnow()}
+            },
+            upsert=True
+        )
+        if self._messages is not None:
+            self._messages = (self._messages + messages)[-self.max_messages:]
+
+    def add_message(self, message) -> None:
+        self.add_messages([message])
+
+    def clear(self) -> None:
+        self._collection().update_one(
+            {'_id': self.key},
+            {
+                '$set': {'messages': [], 'summary': '', 'updated_at': datetime.utcnow()},
+                '$unset': {'summary_until': ''}
+            }
+        )
+        self._messages = []
+        self.summary = ''
+
+    def set_summary(self, summary: str) -> None:
+        self._collection().update_one(
+            {'_id': self.key},
+            {'$set': {'summary': summary or '', 'updated_at': datetime.utcnow()}},
+            upsert=True
+        )
+        self.summary = summary or ''
+
+    def compact(self, summarize: Callable[[str, List[str]], str], keep_recent: int) -> int:
+        """Fold all but the latest keep_recent messages into the summary.
+
+        summarize() runs between the read and the write, so messages pushed in
+        the meantime are kept: only messages up to the last summarized 'at' are
+        pulled. The write is conditional on summary_until being unchanged, so a
+        concurrent compaction in another worker makes this one a no-op.
+        Returns the number of messages compacted.
+        """
+        doc = self._collection().find_one({'_id': self.key}, {'messages': 1, 'summary': 1, 'summary_until': 1})
+        messages = (doc or {}).get('messages', [])
+        if len(messages) <= keep_recent:
+            return 0
+
+        old = messages[:-keep_recent]
+        summary = summarize(doc.get('summary', ''), [format_message(self._from_document(m)) for m in old])
+        cutoff = old[-1]['at']
+        result = self._collection().update_one(
+            {'_id': self.key, 'summary_until': doc.get('summary_until')},
+            {
+                '$set': {'summary': summary, 'summary_until': cutoff},
+                '$pull': {'messages': {'at': {'$lte': cutoff}}}
+            }
+        )
+        if result.modified_count == 0:
+            return 0
+        self.summary = summary
+        return len(old)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 
 class FitnessMemoryManager:
-    def __init__(self, client, user_profile):
-        """Initialize memory manager with Groq client and user profile"""
-        print("\n=== Initializing FitnessMemoryManager ===")
+    def __init__(self, backend, user_profile, memory_key: str = None):
+        """Initialize memory manager with the LLM backend and user profile.
+
+        With a memory_key (session or user id) the conversation is stored in
+        MongoDB and shared by all workers; without one it stays in-process.
+        """
+        logger.debug("Initializing FitnessMemoryManager")
         try:
-            self.client = client
+            self.backend = backend
             self.user_profile = user_profile
+            self.memory_key = memory_key
             self.initialized = False
+            self.summary = ''
+            self._lock = threading.Lock()
             
-            print("Creating cache directories...")
+            logger.debug("Creating cache directories...")
             # Create cache directories in user's temp directory
             self.model_cache_dir = os.path.join(tempfile.gettempdir(), 'fitness_model_cache')
             self.chroma_db_dir = os.path.join(tempfile.gettempdir(), 'fitness_chroma_db')
             
             os.makedirs(self.model_cache_dir, exist_ok=True)
             os.makedirs(self.chroma_db_dir, exist_ok=True)
-            print(f"Cache directories created at {self.model_cache_dir} and {self.chroma_db_dir}")
+            logger.debug("Cache directories created at %s and %s", self.model_cache_dir, self.chroma_db_dir)
             
-            print("Initializing conversation memory...")
+            logger.debug("Initializing conversation memory...")
             # Initialize conversation memory
-            self.conversation_memory = ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True
-            )
-            print("Conversation memory initialized")
+            self.persistent = bool(memory_key) and CHAT_MEMORY_SETTINGS['backend'] == 'mongo'
+            if self.persistent:
+                self.conversation_memory = ConversationBufferMemory(
+                    chat_memory=MongoChatMessageHistory(memory_key),
+                    memory_key="chat_history",
+                    return_messages=True
+                )
+            else:
+                self.conversation_memory = ConversationBufferMemory(
+                    memory_key="chat_history",
+                    return_messages=True
+                )
+            logger.debug("Conversation memory initialized")
             
-            print("Initializing memory retriever...")
-            # Initialize memory retriever
-            self.memory_retriever = None
-            print("Memory retriever initialized")
+            logger.debug("Initializing memory retriever...")
+            # Semantic retrieval over this conversation's past turns
+            if memory_key and VECTOR_MEMORY_SETTINGS['enabled']:
+                self.memory_retriever = VectorMemory.get_instance()
+            else:
+                self.memory_retriever = None
+            logger.debug("Memory retriever initialized")
+            
+            # Older turns are compacted into a running summary in the background
+            self.summarizer = ConversationSummarizer.get_instance() if SUMMARY_SETTINGS['enabled'] else None
             
             # Mark as initialized
             self.initialized = True
-            print("FitnessMemoryManager initialized successfully")
+            logger.debug("FitnessMemoryManager initialized successfully")
             
         except Exception as e:
-            print(f"Error initializing FitnessMemoryManager: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error initializing FitnessMemoryManager: %s", e)
             self.initialized = False
             raise
 
@@ -58,61 +201,136 @@ class FitnessMemoryManager:
         """Check if memory manager is properly initialized"""
         return hasattr(self, 'initialized') and self.initialized
 
-    def get_relevant_context(self, query: str) -> str:
-        """Get relevant context from memory"""
+    def approx_size(self) -> int:
+        """Approximate bytes held by the conversation buffer"""
+        if not self.is_initialized() or self.persistent:
+            # Persistent conversations live in MongoDB, not in this process
+            return 0
+        # ~200 bytes of per-message object overhead on top of the text itself
+        return len(self.summary) + sum(len(m.content) + 200 for m in self.conversation_memory.chat_memory.messages)
+
+    def get_summary(self) -> str:
+        """Running summary of turns compacted out of the conversation buffer"""
+        if self.persistent:
+            return self.conversation_memory.chat_memory.summary
+        return self.summary
+
+    def set_summary(self, summary: str):
+        if self.persistent:
+            self.conversation_memory.chat_memory.set_summary(summary)
+        else:
+            self.summary = summary or ''
+
+    def compact_history(self, summarize: Callable[[str, List[str]], str]) -> int:
+        """Fold older turns into the running summary; called from the background summarizer"""
+        keep_recent = SUMMARY_SETTINGS['keep_recent_messages']
+        chat_memory = self.conversation_memory.chat_memory
+        if self.persistent:
+            return chat_memory.compact(summarize, keep_recent)
+
+        with self._lock:
+            old = list(chat_memory.messages[:-keep_recent]) if len(chat_memory.messages) > keep_recent else []
+        if not old:
+            return 0
+        summary = summarize(self.summary, [format_message(m) for m in old])
+        with self._lock:
+            # Turns added while summarizing were appended; drop only the summarized prefix
+            if all(a is b for a, b in zip(chat_memory.messages, old)):
+                del chat_memory.messages[:len(old)]
+                self.summary = summary
+                return len(old)
+        return 0
+
+    def get_context_sections(self, query: str) -> Dict[str, List[str]]:
+        """Recent messages (oldest first) and relevant past turns (best first) for a query"""
+        sections = {'summary': '', 'recent': [], 'relevant': []}
         try:
-            print("\n=== Getting Relevant Context ===")
+            logger.debug("Getting Relevant Context")
             if not self.is_initialized():
-                print("Memory manager not initialized")
-                return ""
+                logger.warning("Memory manager not initialized")
+                return sections
             
-            # Get recent conversation history
-            print("Getting recent conversation history...")
+            # Get recent conversation history (one read for persistent memory)
+            logger.debug("Getting recent conversation history...")
+            if self.persistent:
+                self.conversation_memory.chat_memory.refresh()
             recent_history = self.conversation_memory.load_memory_variables({})
             chat_history = recent_history.get("chat_history", [])
             
             # Format conversation history
-            formatted_history = []
-            for message in chat_history:
-                if isinstance(message, HumanMessage):
-                    formatted_history.append(f"User: {message.content}")
-                elif isinstance(message, AIMessage):
-                    formatted_history.append(f"Assistant: {message.content}")
+            formatted_history = [format_message(message) for message in chat_history]
+            recent = formatted_history[-VECTOR_MEMORY_SETTINGS['recent_messages']:]
+            sections['recent'] = recent
+            sections['summary'] = self.get_summary()
+            logger.debug("Retrieved %s recent messages", len(formatted_history))
             
-            # Combine into context
-            context = "\n".join(formatted_history[-5:]) if formatted_history else ""
-            print(f"Retrieved {len(formatted_history)} recent messages")
+            # Add semantically relevant older turns that are not already in the recent window
+            if self.memory_retriever is not None:
+                recent_turns = {f"{a}\n{b}" for a, b in zip(recent, recent[1:])}
+                try:
+                    relevant = self.memory_retriever.search(self.memory_key, query, exclude=recent_turns)
+                    sections['relevant'] = [r['text'] for r in relevant]
+                except Exception as e:
+                    logger.warning("Vector memory search failed: %s", e)
+                logger.debug("Retrieved %s relevant past turns", len(sections['relevant']))
             
-            return context
+            return sections
             
         except Exception as e:
-            print(f"Error getting relevant context: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
-            return ""
+            logger.exception("Error getting relevant context: %s", e)
+            return sections
+
+    def get_relevant_context(self, query: str) -> str:
+        """Get relevant context from memory"""
+        sections = self.get_context_sections(query)
+        parts = []
+        if sections['summary']:
+            parts.append("CONVERSATION SUMMARY:\n" + sections['summary'])
+        if sections['relevant']:
+            parts.append("RELEVANT PAST CONVERSATIONS:\n" + "\n---\n".join(sections['relevant']))
+        if sections['recent']:
+            parts.append("RECENT CONVERSATION:\n" + "\n".join(sections['recent']))
+        return "\n\n".join(parts)
 
     def add_conversation_turn(self, user_message: str, ai_response: str):
         """Add a conversation turn to memory"""
         try:
-            print("\n=== Adding Conversation Turn ===")
+            logger.debug("Adding Conversation Turn")
             if not self.is_initialized():
-                print("Memory manager not initialized")
+                logger.warning("Memory manager not initialized")
                 return
             
-            print("Adding messages to conversation memory...")
-            self.conversation_memory.chat_memory.add_user_message(user_message)
-            self.conversation_memory.chat_memory.add_ai_message(ai_response)
-            print("Messages added successfully")
+            logger.debug("Adding messages to conversation memory...")
+            # Both messages of a turn go out in a single write
+            chat_memory = self.conversation_memory.chat_memory
+            with self._lock:
+                chat_memory.add_messages([
+                    HumanMessage(content=user_message),
+                    AIMessage(content=ai_response)
+                ])
+                message_count = len(chat_memory.messages)
+            if self.summarizer is not None and message_count >= SUMMARY_SETTINGS['trigger_messages']:
+                self.summarizer.schedule(self)
+            if self.memory_retriever is not None:
+                try:
+                    self.memory_retriever.add(
+                        self.memory_key,
+                        f"User: {user_message}\nAssistant: {ai_response}",
+                        {'at': datetime.utcnow().isoformat()}
+                    )
+                except Exception as e:
+                    logger.warning("Failed to index turn in vector memory: %s", e)
+            logger.debug("Messages added successfully")
             
         except Exception as e:
-            print(f"Error adding conversation turn: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error adding conversation turn: %s", e)
 
     def get_memory_summary(self) -> Dict[str, Any]:
         """Get summary of memory contents"""
         try:
-            print("\n=== Getting Memory Summary ===")
+            logger.debug("Getting Memory Summary")
             if not self.is_initialized():
-                print("Memory manager not initialized")
+                logger.warning("Memory manager not initialized")
                 return {
                     'total_conversation_messages': 0,
                     'stored_important_memories': 0,
@@ -126,17 +344,16 @@ class FitnessMemoryManager:
             
             summary = {
                 'total_conversation_messages': len(chat_history),
-                'stored_important_memories': 0,
-                'buffer_summary_length': 0,
+                'stored_important_memories': self.memory_retriever.count(self.memory_key) if self.memory_retriever else 0,
+                'buffer_summary_length': len(self.get_summary()),
                 'user_profile': self.user_profile
             }
             
-            print(f"Memory summary: {summary}")
+            logger.debug("Memory summary: %s", summary)
             return summary
             
         except Exception as e:
-            print(f"Error getting memory summary: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error getting memory summary: %s", e)
             return {
                 'total_conversation_messages': 0,
                 'stored_important_memories': 0,
@@ -147,25 +364,24 @@ class FitnessMemoryManager:
     def clear_session_memory(self):
         """Clear session memory"""
         try:
-            print("\n=== Clearing Session Memory ===")
+            logger.debug("Clearing Session Memory")
             if not self.is_initialized():
-                print("Memory manager not initialized")
+                logger.warning("Memory manager not initialized")
                 return
             
-            print("Clearing conversation memory...")
+            logger.debug("Clearing conversation memory...")
             self.conversation_memory.clear()
-            print("Session memory cleared successfully")
+            logger.debug("Session memory cleared successfully")
             
         except Exception as e:
-            print(f"Error clearing session memory: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error clearing session memory: %s", e)
 
     def export_memories(self) -> Dict[str, Any]:
         """Export memories for saving"""
         try:
-            print("\n=== Exporting Memories ===")
+            logger.debug("Exporting Memories")
             if not self.is_initialized():
-                print("Memory manager not initialized")
+                logger.warning("Memory manager not initialized")
                 return {}
             
             # Get conversation history
@@ -188,15 +404,15 @@ class FitnessMemoryManager:
             
             memories = {
                 'conversation_messages': conversation_messages,
+                'summary': self.get_summary(),
                 'vector_memories': []
             }
             
-            print(f"Exported {len(conversation_messages)} conversation messages")
+            logger.debug("Exported %s conversation messages", len(conversation_messages))
             return memories
             
         except Exception as e:
-            print(f"Error exporting memories: {str(e)}")
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.exception("Error exporting memories: %s", e)
             return {}
     
     def cleanup(self):
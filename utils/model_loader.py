@@ -1,19 +1,17 @@
 from langchain.embeddings import HuggingFaceEmbeddings
 import logging
-from config import LOGGING
+from config import MODEL_SETTINGS
 import os
 from pathlib import Path
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
-import huggingface_hub
+from utils.model_manifest import ensure_model_dir
+from utils.structured_logging import configure_logging
+from utils import embedding_cache, embedding_engine, embedding_service
 
 # Configure logging
-logging.basicConfig(
-    level=LOGGING['level'],
-    format=LOGGING['format'],
-    filename=LOGGING['file']
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 class ModelLoader:
@@ -31,7 +29,7 @@ class ModelLoader:
             ModelLoader._initialized = True
     
     def _initialize(self):
-        """Initialize the model loader and pre-download required models"""
+        """Initialize the model loader; the embedding model is fetched by ensure_model()"""
         try:
             logger.info("Initializing ModelLoader...")
             
@@ -40,10 +38,9 @@ class ModelLoader:
                 persist_directory="chroma_db",
                 anonymized_telemetry=False
             ))
-            
-            # Pre-download the embedding model
-            logger.info("Pre-downloading ChromaDB embedding model...")
-            self._pre_download_embedding_model()
+            self.model_path = None
+            self._embeddings = None
+            self._embedding_function = None
             
             logger.info("ModelLoader initialization complete")
             
@@ -51,59 +48,63 @@ class ModelLoader:
             logger.error(f"Error initializing ModelLoader: {str(e)}")
             raise
     
-    def _pre_download_embedding_model(self):
-        """Pre-download only the essential model files"""
-        try:
-            # The model used by ChromaDB's default embedding function
-            model_name = "sentence-transformers/all-MiniLM-L6-v2"
-            
-            # Create cache directory if it doesn't exist
-            cache_dir = Path.home() / ".cache" / "chroma" / "onnx_models" / "all-MiniLM-L6-v2"
-            cache_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Only download essential files
-            logger.info(f"Downloading essential model files for {model_name}")
-            huggingface_hub.snapshot_download(
-                repo_id=model_name,
-                cache_dir=cache_dir,
-                local_files_only=False,
-                resume_download=True,
-                allow_patterns=[
-                    "config.json",
-                    "tokenizer.json",
-                    "tokenizer_config.json",
-                    "special_tokens_map.json",
-                    "vocab.txt",
-                    "model.safetensors"  # Only download the main model file
-                ]
-            )
-            
-            logger.info("Essential model files download complete")
-            
-        except Exception as e:
-            logger.error(f"Error pre-downloading embedding model: {str(e)}")
-            raise
+    def ensure_model(self) -> Path:
+        """Local directory with a verified copy of the embedding model (see utils.model_manifest)"""
+        if self.model_path is None:
+            self.model_path = ensure_model_dir()
+        return self.model_path
+    
+    def warm_up(self):
+        """Make sure the model is on disk, load it and run one embedding"""
+        embeddings = self.get_embeddings()
+        if embeddings is None:
+            raise RuntimeError("Embedding model failed to load")
+        embeddings.embed_query("warm up")
     
     def get_chroma_client(self):
         """Get the ChromaDB client instance"""
         return self.chroma_client
     
     def get_embedding_function(self):
-        """Get the default embedding function"""
-        return embedding_functions.SentenceTransformerEmbeddingFunction()
+        """Get the shared Chroma embedding function (the embedding service or ONNX engine when available), cached on disk"""
+        if self._embedding_function is None:
+            if embedding_service.is_enabled():
+                self._embedding_function = embedding_service.EmbeddingClient.get_instance()
+            elif embedding_engine.is_available():
+                self._embedding_function = embedding_engine.EmbeddingEngine.get_instance()
+            else:
+                self._embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
+                    model_name=str(self.ensure_model())
+                )
+            self._embedding_function = embedding_cache.cached(self._embedding_function)
+        return self._embedding_function
+
+    def load_local_embeddings(self):
+        """In-process embeddings: the ONNX engine when available, else sentence-transformers"""
+        if embedding_engine.is_available():
+            logger.info("Initializing ONNX Runtime embeddings...")
+            return embedding_engine.EmbeddingEngine.get_instance()
+        if getattr(self, '_local_embeddings', None) is None:
+            logger.info("Initializing HuggingFace embeddings...")
+            self._local_embeddings = HuggingFaceEmbeddings(
+                model_name=str(self.ensure_model()),
+                model_kwargs={'device': 'cpu'},
+                encode_kwargs={'normalize_embeddings': True}
+            )
+        return self._local_embeddings
 
     def initialize_models(self):
         """Initialize and pre-download all required models"""
         try:
             logger.info("Starting model initialization...")
             
-            # Initialize embeddings
-            logger.info("Initializing HuggingFace embeddings...")
-            self._embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True}
-            )
+            # Initialize embeddings, through the shared embedding service when it runs
+            if embedding_service.is_enabled():
+                logger.info("Using the embedding service")
+                self._embeddings = embedding_service.EmbeddingClient.get_instance()
+            else:
+                self._embeddings = self.load_local_embeddings()
+            self._embeddings = embedding_cache.cached(self._embeddings)
             
             logger.info("Model initialization completed successfully")
             return True
@@ -114,6 +115,6 @@ class ModelLoader:
 
     def get_embeddings(self):
         """Get the initialized embeddings model"""
-        if self._embeddings is None:
+        if getattr(self, '_embeddings', None) is None:
             self.initialize_models()
         return self._embeddings 
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+from config import MODEL_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+_download_lock = threading.Lock()
+
+
+def model_dir(repo_id: str = None) -> Path:
+    """Local directory holding one model: <cache_dir>/<org>--<name>"""
+    repo_id = repo_id or MODEL_SETTINGS['embedding_model']
+    return Path(MODEL_SETTINGS['cache_dir']).expanduser() / repo_id.replace('/', '--')
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read(directory: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(directory / MANIFEST_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(directory: Path, manifest: Dict[str, Any]):
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.manifest-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, directory / MANIFEST_NAME)
+
+
+def write_manifest(directory: Path, repo_id: str, files: Iterable[str] = None) -> Dict[str, Any]:
+    """Hash every model file under directory (or just files) and record them in manifest.json"""
+    if files is None:
+        files = [str(p.relative_to(directory)) for p in directory.rglob('*')
+                 if p.is_file() and p.name != MANIFEST_NAME and not p.name.startswith('.')
+                 and '.cache' not in p.parts]
+    entries = {}
+    for name in sorted(files):
+        path = directory / name
+        stat = path.stat()
+        entries[name] = {'sha256': _sha256(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    manifest = {'repo_id': repo_id, 'files': entries}
+    _write(directory, manifest)
+    logger.info(f"Wrote model manifest for {repo_id} ({len(entries)} files)")
+    return manifest
+
+
+def verify_manifest(directory: Path, required: Iterable[str] = ()) -> bool:
+    """True when every manifest file is present with its recorded content hash.
+
+    Files whose size and mtime still match the manifest were hashed when it
+    was written or last verified and are not re-read; changed files are
+    re-hashed, and the manifest is updated when they still match.
+    """
+    manifest = _read(directory)
+    if not manifest or not manifest.get('files'):
+        return False
+    entries = manifest['files']
+    if any(name not in entries for name in required):
+        return False
+
+    refreshed = False
+    for name, entry in entries.items():
+        path = directory / name
+        try:
+            stat = path.stat()
+        except OSError:
+            logger.warning(f"Model file missing: {path}")
+            return False
+        if stat.st_size != entry['size']:
+            logger.warning(f"Model file size mismatch: {path}")
+            return False
+        if stat.st_mtime_ns == entry.get('mtime_ns'):
+            continue
+        if _sha256(path) != entry['sha256']:
+            logger.warning(f"Model file hash mismatch: {path}")
+            return False
+        entry['mtime_ns'] = stat.st_mtime_ns
+        refreshed = True
+
+    if refreshed:
+        try:
+            _write(directory, manifest)
+        except OSError as e:
+            logger.warning(f"Could not update model manifest: {str(e)}")
+    return True
+
+
+def ensure_model_dir(required: Iterable[str] = None) -> Path:
+    """Directory with a verified copy of the embedding model, downloading it only when incomplete.
+
+    A copy matching its manifest (and containing every required file) is used
+    as is, with no network access. Otherwise the model files are downloaded,
+    unless MODEL_OFFLINE is set, and the manifest is rewritten.
+    """
+    required = list(required or MODEL_SETTINGS['required_files'])
+    directory = model_dir()
+    if verify_manifest(directory, required):
+        return directory
+    with _download_lock:
+        if verify_manifest(directory, required):
+            return directory
+        if MODEL_SETTINGS['offline']:
+            raise RuntimeError(f"Embedding model cache at {directory} is incomplete and MODEL_OFFLINE is set")
+        import huggingface_hub
+
+        repo_id = MODEL_SETTINGS['embedding_model']
+        directory.mkdir(parents=True, exist_ok=True)
+        # Only download essential files
+        logger.info(f"Downloading essential model files for {repo_id}")
+        huggingface_hub.snapshot_download(
+            repo_id=repo_id,
+            local_dir=directory,
+            allow_patterns=MODEL_SETTINGS['files']
+        )
+        logger.info("Essential model files download complete")
+        write_manifest(directory, repo_id)
+    return directory
@@ -0,0 +1,200 @@
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from config import PROMPT_SETTINGS
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional, a character heuristic is used instead
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+PROMPT_HEADER = "You are an expert AI fitness trainer and nutritionist with advanced memory capabilities powered by LangChain."
+
+PROMPT_GUIDELINES = """GUIDELINES:
+1. Use the memory context to maintain continuity and build on previous conversations
+2. Reference relevant past conversations when they apply to current discussion
+3. Track progress and adapt recommendations based on historical context
+4. Build progressively on workout plans and advice from memory
+5. Remember preferences, struggles, and successes from past sessions
+6. Maintain consistency with previous recommendations
+7. Acknowledge improvements and changes mentioned in memory context
+8. Always recommend consulting healthcare professionals for medical concerns
+
+Remember: You have access to both recent conversation history and semantically relevant past conversations through advanced vector-based memory retrieval."""
+
+_TRUNCATION_MARKER = " …"
+
+SUMMARY_LABEL = "CONVERSATION SUMMARY:\n"
+RECENT_LABEL = "RECENT CONVERSATION:\n"
+RELEVANT_LABEL = "RELEVANT PAST CONVERSATIONS:\n"
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    _encoding = tiktoken.get_encoding(PROMPT_SETTINGS['tokenizer'])
+                except Exception as e:
+                    logger.warning(f"Tokenizer unavailable, using character heuristic: {str(e)}")
+                    _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with the local tokenizer, or ~4 characters per token without it"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens - 1]) + _TRUNCATION_MARKER
+    return text[:max(0, (max_tokens - 1) * 4)] + _TRUNCATION_MARKER
+
+
+def bmi_category(bmi: float) -> str:
+    if bmi < 18.5:
+        return "underweight"
+    elif bmi < 25:
+        return "normal weight"
+    elif bmi < 30:
+        return "overweight"
+    return "obese"
+
+
+PLAN_PROMPT_HEADER = "You are an expert AI fitness trainer. You write workout plans from the client profile below."
+
+PLAN_GUIDELINES = """GUIDELINES:
+1. Fit every exercise to the client's goal, experience level and available equipment
+2. Work around the physical limitations, and suggest a safer alternative where an exercise would aggravate them
+3. Always recommend consulting healthcare professionals for medical concerns"""
+
+
+def render_plan_system_prompt(profile: Dict[str, Any]) -> str:
+    """System prompt for plan completions shared through the LLM response cache.
+
+    It holds only the profile fields in the cache key (utils.llm_cache.CACHE_PROFILE_FIELDS):
+    no name, age, body measurements, memory or chat context, so a cached plan carries
+    nothing about the user it was first generated for.
+    """
+    return f"""{PLAN_PROMPT_HEADER}
+
+CLIENT PROFILE:
+Primary Goal: {profile['fitness_goal']}
+Experience Level: {profile['experience']}
+Available Equipment: {profile['equipment']}
+Physical Limitations: {profile['limitations'] if profile['limitations'] else 'None reported'}
+
+{PLAN_GUIDELINES}"""
+
+
+def render_profile_section(profile: Dict[str, Any]) -> str:
+    return f"""CLIENT PROFILE:
+Name: {profile['name']}
+Age: {profile['age']} years old
+Weight: {profile['weight']} kg
+Height: {profile['height']} cm
+BMI: {profile['bmi']} ({bmi_category(profile['bmi'])})
+Primary Goal: {profile['fitness_goal']}
+Experience Level: {profile['experience']}
+Available Equipment: {profile['equipment']}
+Physical Limitations: {profile['limitations'] if profile['limitations'] else 'None reported'}"""
+
+
+class PromptBuilder:
+    """Assembles the trainer system prompt within a token budget.
+
+    The header and guidelines are rendered and counted once per process; the
+    profile section is cached per trainer until the profile changes. Context
+    is added in priority order (the running conversation summary, newest
+    recent messages, then relevant past turns by score) until
+    max_prompt_tokens is used up.
+    """
+    _static_tokens: Optional[int] = None
+
+    def __init__(self, max_prompt_tokens: int = None):
+        self.max_prompt_tokens = max_prompt_tokens or PROMPT_SETTINGS['max_prompt_tokens']
+        self._profile_cache: Optional[Tuple[str, str, int]] = None  # (fingerprint, text, tokens)
+        self.last_stats: Dict[str, Any] = {}
+        if PromptBuilder._static_tokens is None:
+            # Header, guidelines, both context labels and the blank lines between sections
+            PromptBuilder._static_tokens = sum(
+                count_tokens(text) for text in (PROMPT_HEADER, PROMPT_GUIDELINES, SUMMARY_LABEL, RECENT_LABEL, RELEVANT_LABEL)
+            ) + 6 * count_tokens("\n\n")
+
+    def invalidate_profile(self):
+        self._profile_cache = None
+
+    def profile_section(self, profile: Dict[str, Any]) -> Tuple[str, int]:
+        fingerprint = json.dumps(profile, sort_keys=True, default=str)
+        if self._profile_cache is None or self._profile_cache[0] != fingerprint:
+            text = render_profile_section(profile)
+            self._profile_cache = (fingerprint, text, count_tokens(text))
+        return self._profile_cache[1], self._profile_cache[2]
+
+    def _fit(self, items: List[str], budget: int, separator: str) -> Tuple[List[str], int, int]:
+        """Keep items in order until the budget runs out; the first item may be truncated"""
+        kept, used, separator_tokens = [], 0, count_tokens(separator)
+        for item in items:
+            cost = count_tokens(item) + (separator_tokens if kept else 0)
+            if used + cost > budget:
+                if not kept:
+                    item = truncate_to_tokens(item, budget)
+                    if item:
+                        kept.append(item)
+                        used = count_tokens(item)
+                break
+            kept.append(item)
+            used += cost
+        return kept, used, len(items) - len(kept)
+
+    def build(self, profile: Dict[str, Any], session_info: str, summary: str = None, recent: List[str] = None,
+              relevant: List[str] = None, reserved_tokens: int = 0) -> str:
+        """Render the system prompt; reserved_tokens covers the user message sent with it"""
+        profile_text, profile_tokens = self.profile_section(profile)
+        fixed_tokens = self._static_tokens + profile_tokens + count_tokens(session_info)
+        budget = max(0, self.max_prompt_tokens - reserved_tokens - fixed_tokens)
+
+        summary_kept, summary_tokens, _ = self._fit([summary] if summary else [], budget, "")
+        budget -= summary_tokens
+
+        # Newest messages first so the oldest ones are dropped, then restore chronological order
+        recent_kept, recent_tokens, recent_dropped = self._fit(list(reversed(recent or [])), budget, "\n")
+        recent_kept.reverse()
+        budget -= recent_tokens
+        relevant_kept, relevant_tokens, relevant_dropped = self._fit(relevant or [], budget, "\n---\n")
+
+        sections = [PROMPT_HEADER, profile_text, session_info]
+        if summary_kept:
+            sections.append(SUMMARY_LABEL + summary_kept[0])
+        if relevant_kept:
+            sections.append(RELEVANT_LABEL + "\n---\n".join(relevant_kept))
+        if recent_kept:
+            sections.append(RECENT_LABEL + "\n".join(recent_kept))
+        sections.append(PROMPT_GUIDELINES)
+
+        self.last_stats = {
+            'prompt_tokens': fixed_tokens + summary_tokens + recent_tokens + relevant_tokens,
+            'budget': self.max_prompt_tokens,
+            'reserved_tokens': reserved_tokens,
+            'recent_dropped': recent_dropped,
+            'relevant_dropped': relevant_dropped,
+        }
+        return "\n\n".join(sections)
@@ -0,0 +1,295 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+from config import REQUEST_TIMING_SETTINGS
+
+# Phase name -> [seconds, count] for the request running in this context
+_phases = contextvars.ContextVar('request_phases', default=None)
+_active = contextvars.ContextVar('request_active_phases', default=frozenset())
+
+
+def record(name: str, seconds: float):
+    """Add time spent in a phase to the current request (no-op outside requests)"""
+    phases = _phases.get()
+    if phases is None:
+        return
+    entry = phases.get(name)
+    if entry is None:
+        phases[name] = [seconds, 1]
+    else:
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block as one phase of the current request. Nested blocks of the same phase count once"""
+    if _phases.get() is None or name in _active.get():
+        yield
+        return
+    token = _active.set(_active.get() | {name})
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+        _active.reset(token)
+
+
+def current_phases() -> Dict[str, float]:
+    phases = _phases.get() or {}
+    return {name: entry[0] for name, entry in phases.items()}
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; percentiles are interpolated within a bucket"""
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.bounds[-1]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean_ms': round(self.sum / self.count * 1000, 2) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.50) * 1000, 2),
+            'p95_ms': round(self.percentile(0.95) * 1000, 2),
+            'p99_ms': round(self.percentile(0.99) * 1000, 2),
+        }
+
+
+class RequestTimingRegistry:
+    """Per-endpoint histograms of total request time and of each phase, one registry per worker"""
+    _instance = None
+    _instance_pid = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None or cls._instance_pid != os.getpid():
+            with cls._instance_lock:
+                if cls._instance is None or cls._instance_pid != os.getpid():
+                    cls._instance = cls()
+                    cls._instance_pid = os.getpid()
+        return cls._instance
+
+    def __init__(self, bounds: List[float] = None):
+        self.bounds = sorted(bounds or REQUEST_TIMING_SETTINGS['buckets'])
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, LatencyHistogram]] = {}
+
+    def observe(self, endpoint: str, total: float, phases: Dict[str, float]):
+        with self._lock:
+            histograms = self._endpoints.get(endpoint)
+            if histograms is None:
+                histograms = self._endpoints[endpoint] = {}
+            for name, seconds in (('total', total), *phases.items()):
+                histogram = histograms.get(name)
+                if histogram is None:
+                    histogram = histograms[name] = LatencyHistogram(self.bounds)
+                histogram.observe(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                endpoint: {
+                    **histograms['total'].summary(),
+                    'phases': {name: h.summary() for name, h in histograms.items() if name != 'total'}
+                }
+                for endpoint, histograms in sorted(self._endpoints.items())
+            }
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition of every histogram, labelled with this worker's pid"""
+        pid = os.getpid()
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by endpoint',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        phase_lines = [
+            '# HELP http_request_phase_seconds Time per request spent in each phase, by endpoint',
+            '# TYPE http_request_phase_seconds histogram',
+        ]
+        with self._lock:
+            for endpoint, histograms in sorted(self._endpoints.items()):
+                for name, histogram in sorted(histograms.items()):
+                    if name == 'total':
+                        metric, labels, out = 'http_request_duration_seconds', f'endpoint="{endpoint}",pid="{pid}"', lines
+                    else:
+                        metric, labels, out = ('http_request_phase_seconds',
+                                               f'endpoint="{endpoint}",phase="{name}",pid="{pid}"', phase_lines)
+                    cumulative = 0
+                    for bound, bucket_count in zip(self.bounds + [float('inf')], histogram.counts):
+                        cumulative += bucket_count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        out.append(f'{metric}_bucket{{{labels},le="{le}"}} {cumulative}')
+                    out.append(f'{metric}_sum{{{labels}}} {histogram.sum:.6f}')
+                    out.append(f'{metric}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines + phase_lines) + '\n'
+
+
+def _server_timing(phases: Dict[str, List[float]], total: float) -> str:
+    parts = [f'{name};dur={entry[0] * 1000:.1f}' for name, entry in phases.items()]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+class _TimedBody:
+    """Response body wrapper that closes the request's timing once the body is fully sent"""
+
+    def __init__(self, body, finish):
+        self._body = body
+        self._finish = finish
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            self._finish()
+
+
+class RequestTimingMiddleware:
+    """WSGI middleware timing each request from before the session is opened until its body is sent.
+
+    The Server-Timing header carries the phases completed when the response
+    starts; the histograms get the final figures, so streamed replies include
+    the model time spent while streaming.
+    """
+
+    def __init__(self, wsgi_app, registry: RequestTimingRegistry = None):
+        self.wsgi_app = wsgi_app
+        self.registry = registry or RequestTimingRegistry.get_instance()
+
+    def __call__(self, environ, start_response):
+        phases: Dict[str, List[float]] = {}
+        token = _phases.set(phases)
+        started = time.perf_counter()
+        finished = []
+
+        def finish():
+            if finished:
+                return
+            finished.append(True)
+            endpoint = environ.get('request_timing.endpoint')
+            if endpoint:
+                self.registry.observe(endpoint, time.perf_counter() - started,
+                                      {name: entry[0] for name, entry in phases.items()})
+            try:
+                _phases.reset(token)
+            except ValueError:
+                _phases.set(None)  # Body closed from another context; just detach this request
+
+        def timed_start_response(status, headers, exc_info=None):
+            if REQUEST_TIMING_SETTINGS['server_timing_header']:
+                headers = list(headers) + [('Server-Timing', _server_timing(phases, time.perf_counter() - started))]
+            return start_response(status, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, timed_start_response)
+        except BaseException:
+            finish()
+            raise
+        return _TimedBody(body, finish)
+
+
+class TimedSessionInterface:
+    """Wraps the app's session interface so loading and saving the session count as the session phase"""
+
+    def __init__(self, interface):
+        self._interface = interface
+
+    def __getattr__(self, name):
+        return getattr(self._interface, name)
+
+    def open_session(self, app, request):
+        with phase('session'):
+            return self._interface.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with phase('session'):
+            return self._interface.save_session(app, session, response)
+
+
+def _mongo_listener():
+    from pymongo import monitoring
+
+    class MongoTimingListener(monitoring.CommandListener):
+        """Adds each MongoDB command's duration to the mongo phase of the request that ran it"""
+
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            record('mongo', event.duration_micros / 1e6)
+
+        def failed(self, event):
+            record('mongo', event.duration_micros / 1e6)
+
+    return MongoTimingListener()
+
+
+def mongo_event_listeners() -> List[Any]:
+    """event_listeners for MongoClient when request timing is on"""
+    return [_mongo_listener()] if REQUEST_TIMING_SETTINGS['enabled'] else []
+
+
+def _timed_json_provider(base):
+    class TimedJSONProvider(base):
+        def dumps(self, obj, **kwargs):
+            with phase('serialize'):
+                return super().dumps(obj, **kwargs)
+
+    return TimedJSONProvider
+
+
+def init_app(app):
+    """Install the timing middleware, session and JSON hooks; call after extensions wrap wsgi_app"""
+    if not REQUEST_TIMING_SETTINGS['enabled']:
+        return
+    from flask import request
+
+    app.session_interface = TimedSessionInterface(app.session_interface)
+    app.json = _timed_json_provider(type(app.json))(app)
+    app.wsgi_app = RequestTimingMiddleware(app.wsgi_app)
+
+    @app.before_request
+    def _label_endpoint():
+        # Histograms are keyed by route pattern, not by raw path, to bound their number
+        if request.url_rule is not None:
+            request.environ['request_timing.endpoint'] = f"{request.method} {request.url_rule.rule}"
+
+
+def get_summary() -> Dict[str, Any]:
+    return RequestTimingRegistry.get_instance().summary()
+
+
+def get_prometheus_text() -> str:
+    return RequestTimingRegistry.get_instance().prometheus()
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from pymongo.errors import DuplicateKeyError
+from config import SINGLE_FLIGHT_SETTINGS
+from utils.db import DatabaseConnection
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlightTimeout(Exception):
+    """Gave up waiting for another caller's in-flight result"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    Within a process, followers wait on the leader's call. Across workers,
+    the leader holds a lease document in the inflight_requests collection;
+    callers in other workers poll it and take the stored result, or take
+    over once the lease expires. A finished result is also shared with
+    duplicates that arrive within share_window seconds (double taps and
+    client retries that land just after the first call returned).
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.cluster = SINGLE_FLIGHT_SETTINGS['cluster']
+        self.lease_seconds = SINGLE_FLIGHT_SETTINGS['lease_seconds']
+        self.poll_interval = SINGLE_FLIGHT_SETTINGS['poll_interval']
+        self.share_window = SINGLE_FLIGHT_SETTINGS['share_window']
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.metrics = {'executed': 0, 'shared_local': 0, 'shared_remote': 0, 'takeovers': 0, 'lease_errors': 0}
+
+    @property
+    def owner_id(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    def _count(self, metric: str):
+        with self._lock:
+            self.metrics[metric] += 1
+
+    def _collection(self):
+        return DatabaseConnection.get_instance().get_collection('inflight_requests')
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run fn() once for all concurrent callers with this key and return its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(self.lease_seconds):
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight request {key}")
+            self._count('shared_local')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_cluster(key, fn) if self.cluster else self._execute(fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _execute(self, fn: Callable[[], Any]) -> Any:
+        self._count('executed')
+        return fn()
+
+    def _claim(self, key: str, owner: str) -> Optional[Dict[str, Any]]:
+        """Take the lease for key, or return the current lease holder's document"""
+        now = datetime.utcnow()
+        lease = {
+            'owner': owner,
+            'status': 'running',
+            'lease_until': now + timedelta(seconds=self.lease_seconds),
+            'created_at': now
+        }
+        try:
+            self._collection().insert_one({'_id': key, **lease})
+            return None
+        except DuplicateKeyError:
+            pass
+        # Take over an expired lease or a result too old to share
+        taken = self._collection().find_one_and_update(
+            {'_id': key, '$or': [
+                {'status': 'running', 'lease_until': {'$lt': now}},
+                {'status': 'done', 'finished_at': {'$lt': now - timedelta(seconds=self.share_window)}}
+            ]},
+            {'$set': lease, '$unset': {'result': '', 'finished_at': ''}}
+        )
+        if taken is not None:
+            if taken.get('status') == 'running':
+                self._count('takeovers')
+            return None
+        return self._collection().find_one({'_id': key}) or {'status': 'gone'}
+
+    def _run_cluster(self, key: str, fn: Callable[[], Any]) -> Any:
+        owner = self.owner_id
+        deadline = time.monotonic() + self.lease_seconds
+        while True:
+            try:
+                holder = self._claim(key, owner)
+            except Exception as e:
+                # Never fail the request because the lease store is unavailable
+                self._count('lease_errors')
+                logger.warning(f"Single-flight lease unavailable for {key}, running without it: {str(e)}")
+                return self._execute(fn)
+
+            if holder is None:
+                break
+            if holder['status'] == 'done':
+                self._count('shared_remote')
+                return holder['result']
+            if time.monotonic() > deadline:
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight request {key}")
+            # Running elsewhere (or the lease was just released): check again shortly
+            time.sleep(self.poll_interval)
+
+        try:
+            result = self._execute(fn)
+        except BaseException:
+            # Let the next caller retry instead of waiting out the lease
+            try:
+                self._collection().delete_one({'_id': key, 'owner': owner})
+            except Exception as e:
+                logger.warning(f"Failed to release single-flight lease {key}: {str(e)}")
+            raise
+
+        try:
+            self._collection().update_one(
+                {'_id': key, 'owner': owner},
+                {'$set': {'status': 'done', 'result': result, 'finished_at': datetime.utcnow()},
+                 '$unset': {'lease_until': ''}}
+            )
+        except Exception as e:
+            logger.warning(f"Failed to publish single-flight result {key}: {str(e)}")
+        return result
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.metrics, 'in_flight': len(self._calls), 'cluster': self.cluster}
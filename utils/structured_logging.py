@@ -0,0 +1,152 @@
+import contextvars
+import json
+import logging
+import random
+import re
+import uuid
+import zlib
+from typing import Any, Dict, Optional
+from config import LOGGING
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+_configured = False
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def set_request_id(request_id: str = None) -> contextvars.Token:
+    """Bind a correlation id to the current context (request thread, job run); returns a reset token"""
+    return _request_id.set(request_id or uuid.uuid4().hex)
+
+
+def reset_request_id(token: contextvars.Token):
+    _request_id.reset(token)
+
+
+def debug_sampled() -> bool:
+    """Whether DEBUG events are kept for the current request.
+
+    The decision hashes the correlation id, so a sampled request keeps all
+    of its debug events and an unsampled one drops them all.
+    """
+    rate = LOGGING['debug_sample_rate']
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    request_id = _request_id.get()
+    if request_id is None:
+        return random.random() < rate
+    return zlib.crc32(request_id.encode('utf-8')) % 10000 < rate * 10000
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Logger taking %-style arguments (formatted only if the event is emitted) and keyword fields.
+
+        logger.debug("Found user %s", user_id, family_id=family_id)
+
+    DEBUG events are sampled per request (LOG_DEBUG_SAMPLE_RATE) before a
+    record is created.
+    """
+
+    def isEnabledFor(self, level: int) -> bool:
+        if not self.logger.isEnabledFor(level):
+            return False
+        return level > logging.DEBUG or debug_sampled()
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs)
+                  if key not in ('exc_info', 'stack_info', 'stacklevel', 'extra')}
+        if fields or self.extra:
+            kwargs['extra'] = {**kwargs.get('extra', {}), 'fields': {**self.extra, **fields}}
+        return msg, kwargs
+
+    def bind(self, **fields) -> 'StructuredLogger':
+        """Logger that adds fields to every event"""
+        return StructuredLogger(self.logger, {**self.extra, **fields})
+
+
+def get_logger(name: str) -> StructuredLogger:
+    return StructuredLogger(logging.getLogger(name), {})
+
+
+def _prepare(record: logging.LogRecord):
+    if not hasattr(record, 'request_id'):
+        record.request_id = _request_id.get() or '-'
+
+
+class TextFormatter(logging.Formatter):
+    """LOGGING['format'] followed by key=value fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        _prepare(record)
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        _prepare(record)
+        event: Dict[str, Any] = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': record.request_id,
+        }
+        event.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            event['exc'] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str)
+
+
+def configure_logging():
+    """Install the root handler once per process (LOG_LEVEL, LOG_FILE, LOG_JSON, LOG_LEVELS)"""
+    global _configured
+    # Like logging.basicConfig, leave a root logger someone else configured alone
+    if _configured or logging.getLogger().handlers:
+        return
+    _configured = True
+    handler = logging.FileHandler(LOGGING['file']) if LOGGING['file'] else logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if LOGGING['json'] else TextFormatter(LOGGING['format']))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(LOGGING['level'])
+    for name, level in LOGGING['levels'].items():
+        logging.getLogger(name).setLevel(level)
+
+
+def init_app(app):
+    """Give every Flask request a correlation id, taken from the request header when valid"""
+    from flask import g, request
+
+    header = LOGGING['request_id_header']
+
+    @app.before_request
+    def _bind_request_id():
+        incoming = request.headers.get(header, '')
+        g.request_id_token = set_request_id(incoming if _VALID_REQUEST_ID.match(incoming) else None)
+
+    @app.after_request
+    def _return_request_id(response):
+        request_id = _request_id.get()
+        if request_id:
+            response.headers[header] = request_id
+        return response
+
+    @app.teardown_request
+    def _reset_request_id(exc):
+        token = g.pop('request_id_token', None)
+        if token is not None:
+            try:
+                reset_request_id(token)
+            except ValueError:
+                pass  # Torn down in a different context than the request started in
@@ -0,0 +1,202 @@
+from collections import OrderedDict
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TrainerRegistry:
+    """Thread-safe, bounded map from session or user id to that user's trainer state.
+
+    Entries are kept in LRU order and evicted when the store exceeds
+    max_entries or max_bytes (as reported by size_of), or when they sit idle
+    longer than idle_ttl seconds. Evicted trainers are handed to spill() so
+    they can be persisted; a miss calls load() to rehydrate them on demand.
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, idle_ttl: float = None,
+                 size_of: Callable[[Any], int] = None,
+                 spill: Callable[[str, Any], None] = None,
+                 load: Callable[[str], Optional[Any]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._size_of = size_of or (lambda trainer: 0)
+        self._spill = spill
+        self._load = load
+        # key -> (trainer, last_access, size), least recently used first
+        self._trainers: 'OrderedDict[str, Tuple[Any, float, int]]' = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        # key -> event set once the thread creating that key's trainer is done
+        self._creating: Dict[str, threading.Event] = {}
+        self.metrics = {
+            'hits': 0,
+            'misses': 0,
+            'rehydrations': 0,
+            'evictions_lru': 0,
+            'evictions_bytes': 0,
+            'evictions_ttl': 0,
+            'spills': 0,
+            'spill_failures': 0,
+        }
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._trainers
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._trainers)
+
+    def _count(self, metric: str):
+        with self._lock:
+            self.metrics[metric] += 1
+
+    def _store(self, key: str, trainer: Any):
+        """Insert or refresh an entry as most recently used (lock held)"""
+        old = self._trainers.pop(key, None)
+        if old is not None:
+            self._total_bytes -= old[2]
+        size = self._size_of(trainer)
+        self._trainers[key] = (trainer, time.monotonic(), size)
+        self._total_bytes += size
+
+    def _collect_evictions(self, protect: str = None) -> List[Tuple[str, Any]]:
+        """Pop entries that are idle or over the bounds, oldest first (lock held)"""
+        evicted = []
+        now = time.monotonic()
+        for key in list(self._trainers):
+            if key == protect:
+                continue
+            trainer, last_access, size = self._trainers[key]
+            if self.idle_ttl and now - last_access > self.idle_ttl:
+                reason = 'evictions_ttl'
+            elif self.max_entries and len(self._trainers) > self.max_entries:
+                reason = 'evictions_lru'
+            elif self.max_bytes and self._total_bytes > self.max_bytes:
+                reason = 'evictions_bytes'
+            else:
+                break
+            del self._trainers[key]
+            self._total_bytes -= size
+            self.metrics[reason] += 1
+            evicted.append((key, trainer))
+        return evicted
+
+    def _spill_all(self, evicted: List[Tuple[str, Any]]):
+        """Persist evicted trainers outside the lock"""
+        if not self._spill:
+            return
+        for key, trainer in evicted:
+            try:
+                self._spill(key, trainer)
+                self._count('spills')
+            except Exception as e:
+                self._count('spill_failures')
+                logger.error(f"Failed to spill trainer session {key}: {str(e)}")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the trainer for key, rehydrating it from the spill tier if needed"""
+        with self._lock:
+            entry = self._trainers.get(key)
+            if entry is not None and not (self.idle_ttl and time.monotonic() - entry[1] > self.idle_ttl):
+                self.metrics['hits'] += 1
+                self._store(key, entry[0])
+                evicted = self._collect_evictions(protect=key)
+                trainer = entry[0]
+            else:
+                trainer = None
+                evicted = self._collect_evictions()
+        self._spill_all(evicted)
+        if trainer is not None:
+            return trainer
+
+        self._count('misses')
+        if not self._load:
+            return None
+        trainer = self._load(key)
+        if trainer is not None:
+            self._count('rehydrations')
+            self.put(key, trainer)
+        return trainer
+
+    def put(self, key: str, trainer: Any):
+        with self._lock:
+            self._store(key, trainer)
+            evicted = self._collect_evictions(protect=key)
+        self._spill_all(evicted)
+
+    def get_or_create(self, key: str, factory: Callable[[], Any]) -> Any:
+        """Return the trainer for key, rehydrating or creating it with factory().
+
+        factory() can take tens of seconds (first import of the AI stack), so it
+        runs outside the lock; concurrent callers for the same key wait for the
+        first one instead of building their own.
+        """
+        while True:
+            trainer = self.get(key)
+            if trainer is not None:
+                return trainer
+            with self._lock:
+                entry = self._trainers.get(key)
+                if entry is not None:
+                    return entry[0]
+                creating = self._creating.get(key)
+                if creating is None:
+                    creating = self._creating[key] = threading.Event()
+                    break
+            creating.wait()
+
+        try:
+            trainer = factory()
+            with self._lock:
+                entry = self._trainers.get(key)
+                if entry is not None:
+                    # Stored meanwhile (e.g. put() by a rehydration); keep that one
+                    return entry[0]
+                self._store(key, trainer)
+                evicted = self._collect_evictions(protect=key)
+        finally:
+            with self._lock:
+                del self._creating[key]
+            creating.set()
+        self._spill_all(evicted)
+        return trainer
+
+    def touch(self, key: str):
+        """Re-measure an entry after its trainer grew (e.g. a new chat turn)"""
+        with self._lock:
+            entry = self._trainers.get(key)
+            if entry is None:
+                return
+            self._store(key, entry[0])
+            evicted = self._collect_evictions(protect=key)
+        self._spill_all(evicted)
+
+    def remove(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._trainers.pop(key, None)
+            if entry is None:
+                return None
+            self._total_bytes -= entry[2]
+            return entry[0]
+
+    def sweep(self):
+        """Evict idle entries without waiting for the next access"""
+        with self._lock:
+            evicted = self._collect_evictions()
+        self._spill_all(evicted)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.metrics,
+                'entries': len(self._trainers),
+                'approx_bytes': self._total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'idle_ttl': self.idle_ttl,
+            }
@@ -0,0 +1,268 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from config import VECTOR_MEMORY_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+
+def _default_embed(texts: List[str]) -> List[List[float]]:
+    from utils import ai_stack
+    return ai_stack.embedder().embed_documents(texts)
+
+
+class _UserIndex:
+    """One user's vectors (unit-normalized float32 rows) and the texts they embed"""
+
+    def __init__(self, vectors: np.ndarray, texts: List[Dict[str, Any]], mtime: float):
+        self.vectors = vectors
+        self.texts = texts
+        self.mtime = mtime
+        self.pending: List[Dict[str, Any]] = []
+
+
+class VectorMemory:
+    """Per-user embeddings of past conversation turns in a local persistent index.
+
+    Each user has <base_dir>/<hash>.npy (vectors) and <hash>.json (texts).
+    New turns are buffered and embedded in batches; search() flushes the
+    buffer, then ranks the user's turns by cosine similarity to the query.
+    Embedding runs outside the process lock, which only guards the cached
+    indexes and file updates, so one turn's model call does not hold up the
+    others. Files are rewritten atomically under an flock, so workers on one
+    host can share the index and pick up each other's writes by mtime.
+    delete() removes a session's files; files untouched for max_age_days
+    are swept every sweep_interval seconds.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, base_dir: str = None, embed_fn: Callable[[List[str]], List[List[float]]] = None,
+                 batch_size: int = None, max_entries: int = None):
+        self.base_dir = base_dir or VECTOR_MEMORY_SETTINGS['index_dir'] or \
+            os.path.join(tempfile.gettempdir(), 'fitness_vector_memory')
+        self.embed_fn = embed_fn or _default_embed
+        self.batch_size = batch_size or VECTOR_MEMORY_SETTINGS['batch_size']
+        self.max_entries = max_entries or VECTOR_MEMORY_SETTINGS['max_entries_per_user']
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._indexes: Dict[str, _UserIndex] = {}
+        self._lock = threading.RLock()
+        self._last_sweep = time.time()
+        self.metrics = {'searches': 0, 'search_seconds_total': 0.0, 'search_seconds_max': 0.0,
+                        'embedded_texts': 0, 'embed_batches': 0}
+
+    def _paths(self, user_key: str):
+        name = hashlib.sha1(str(user_key).encode('utf-8')).hexdigest()
+        base = os.path.join(self.base_dir, name)
+        return base + '.npy', base + '.json', base + '.lock'
+
+    def _read(self, user_key: str) -> _UserIndex:
+        vec_path, text_path, _ = self._paths(user_key)
+        if not os.path.exists(text_path):
+            return _UserIndex(np.zeros((0, 0), dtype=np.float32), [], 0.0)
+        with open(text_path, 'r') as f:
+            texts = json.load(f)
+        vectors = np.load(vec_path) if texts else np.zeros((0, 0), dtype=np.float32)
+        return _UserIndex(vectors, texts, os.path.getmtime(text_path))
+
+    def _index(self, user_key: str) -> _UserIndex:
+        """Cached index for a user, reloaded when another worker rewrote it"""
+        _, text_path, _ = self._paths(user_key)
+        index = self._indexes.get(user_key)
+        disk_mtime = os.path.getmtime(text_path) if os.path.exists(text_path) else 0.0
+        if index is None or disk_mtime > index.mtime:
+            pending = index.pending if index else []
+            index = self._read(user_key)
+            index.pending = pending
+            self._indexes[user_key] = index
+        return index
+
+    def add(self, user_key: str, text: str, metadata: Dict[str, Any] = None):
+        """Buffer a turn; it is embedded with the next full batch or search"""
+        with self._lock:
+            index = self._index(user_key)
+            index.pending.append({'text': text, 'metadata': metadata or {}})
+            full = len(index.pending) >= self.batch_size
+        if full:
+            self.flush(user_key)
+
+    def add_many(self, user_key: str, texts: List[str], metadatas: List[Dict[str, Any]] = None):
+        with self._lock:
+            index = self._index(user_key)
+            for i, text in enumerate(texts):
+                index.pending.append({'text': text, 'metadata': (metadatas or [{}] * len(texts))[i]})
+        self.flush(user_key)
+
+    def flush(self, user_key: str):
+        """Embed buffered turns in one batch and persist the user's index"""
+        with self._lock:
+            index = self._index(user_key)
+            if not index.pending:
+                return
+            pending, index.pending = index.pending, []
+
+        try:
+            new_vectors = np.asarray(self.embed_fn([p['text'] for p in pending]), dtype=np.float32)
+        except Exception:
+            with self._lock:
+                # Keep the turns for the next attempt
+                index = self._index(user_key)
+                index.pending[:0] = pending
+            raise
+        norms = np.linalg.norm(new_vectors, axis=1, keepdims=True)
+        new_vectors /= np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            self.metrics['embedded_texts'] += len(pending)
+            self.metrics['embed_batches'] += 1
+
+            vec_path, text_path, lock_path = self._paths(user_key)
+            with open(lock_path, 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                current = self._read(user_key)
+                texts = current.texts + pending
+                vectors = new_vectors if current.vectors.size == 0 else np.vstack([current.vectors, new_vectors])
+                if len(texts) > self.max_entries:
+                    texts = texts[-self.max_entries:]
+                    vectors = vectors[-self.max_entries:]
+                self._write_atomic(vec_path, lambda f: np.save(f, vectors))
+                self._write_atomic(text_path, lambda f: f.write(json.dumps(texts).encode('utf-8')))
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+            index = _UserIndex(vectors, texts, os.path.getmtime(text_path))
+            # Turns buffered while this batch was being embedded stay pending
+            index.pending = self._indexes[user_key].pending if user_key in self._indexes else []
+            self._indexes[user_key] = index
+        self._maybe_sweep()
+
+    @staticmethod
+    def _write_atomic(path: str, write: Callable):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def search(self, user_key: str, query: str, k: int = None,
+               exclude: Optional[set] = None) -> List[Dict[str, Any]]:
+        """Top-k past turns by cosine similarity to the query"""
+        k = k or VECTOR_MEMORY_SETTINGS['top_k']
+        started = time.perf_counter()
+        self.flush(user_key)
+        with self._lock:
+            if not self._index(user_key).texts:
+                return []
+        query_vector = np.asarray(self.embed_fn([query])[0], dtype=np.float32)
+        query_vector /= (np.linalg.norm(query_vector) or 1)
+        with self._lock:
+            index = self._index(user_key)
+            if not index.texts:
+                return []
+            scores = index.vectors @ query_vector
+            # Over-fetch so excluded (already in the prompt) turns don't starve the result
+            fetch = min(len(scores), k + len(exclude or ()))
+            top = np.argpartition(-scores, fetch - 1)[:fetch]
+            results = []
+            for i in top[np.argsort(-scores[top])]:
+                if exclude and index.texts[i]['text'] in exclude:
+                    continue
+                results.append({**index.texts[i], 'score': float(scores[i])})
+                if len(results) == k:
+                    break
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.metrics['searches'] += 1
+            self.metrics['search_seconds_total'] += elapsed
+            self.metrics['search_seconds_max'] = max(self.metrics['search_seconds_max'], elapsed)
+        return results
+
+    def delete(self, user_key: str):
+        """Remove a user's index files and cached copy, e.g. when the session ends"""
+        with self._lock:
+            self._indexes.pop(user_key, None)
+            self._remove_files(*self._paths(user_key))
+
+    def _remove_files(self, vec_path: str, text_path: str, lock_path: str, older_than: float = None) -> bool:
+        """Delete one index under its flock; with older_than, only if it was not written since"""
+        try:
+            lock_file = open(lock_path, 'r+')
+        except FileNotFoundError:
+            lock_file = None
+        try:
+            if lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if older_than is not None:
+                try:
+                    if os.path.getmtime(text_path) >= older_than:
+                        return False
+                except FileNotFoundError:
+                    pass
+            # Texts first: readers treat an index without its .json file as empty
+            for path in (text_path, vec_path, lock_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            return True
+        finally:
+            if lock_file:
+                lock_file.close()
+
+    def _maybe_sweep(self):
+        if time.time() - self._last_sweep < VECTOR_MEMORY_SETTINGS['sweep_interval']:
+            return
+        self._last_sweep = time.time()
+        try:
+            self.sweep()
+        except OSError as e:
+            logger.warning(f"Vector memory sweep failed: {str(e)}")
+
+    def sweep(self, max_age_days: float = None) -> int:
+        """Delete indexes not written for max_age_days (sessions that ended or expired without delete())"""
+        cutoff = time.time() - (max_age_days or VECTOR_MEMORY_SETTINGS['max_age_days']) * 86400
+        removed = 0
+        for name in os.listdir(self.base_dir):
+            if not name.endswith('.json'):
+                continue
+            base = os.path.join(self.base_dir, name[:-len('.json')])
+            try:
+                stale = os.path.getmtime(base + '.json') < cutoff
+            except FileNotFoundError:
+                continue
+            if stale and self._remove_files(base + '.npy', base + '.json', base + '.lock', older_than=cutoff):
+                removed += 1
+        with self._lock:
+            for user_key in [key for key, index in self._indexes.items()
+                             if index.mtime < cutoff and not index.pending]:
+                del self._indexes[user_key]
+        if removed:
+            logger.info(f"Removed {removed} vector memory indexes older than the age limit")
+        return removed
+
+    def count(self, user_key: str) -> int:
+        with self._lock:
+            index = self._index(user_key)
+            return len(index.texts) + len(index.pending)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            searches = self.metrics['searches']
+            return {
+                **self.metrics,
+                'search_seconds_avg': self.metrics['search_seconds_total'] / searches if searches else 0.0,
+            }
@@ -0,0 +1,162 @@
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    import jsonschema
+except ImportError:  # jsonschema is optional, a built-in structural check is used without it
+    jsonschema = None
+
+logger = logging.getLogger(__name__)
+
+# Shape the model is asked to return in JSON mode
+WORKOUT_PLAN_SCHEMA = {
+    'type': 'object',
+    'required': ['days'],
+    'properties': {
+        'title': {'type': 'string'},
+        'duration': {'type': ['string', 'integer']},
+        'intensity': {'type': 'string'},
+        'days': {
+            'type': 'array',
+            'minItems': 1,
+            'items': {
+                'type': 'object',
+                'required': ['title', 'exercises'],
+                'properties': {
+                    'title': {'type': 'string', 'minLength': 1},
+                    'exercises': {
+                        'type': 'array',
+                        'minItems': 1,
+                        'items': {'type': 'string', 'minLength': 1}
+                    }
+                }
+            }
+        }
+    }
+}
+
+JSON_PLAN_INSTRUCTIONS = """\nRespond with a JSON object only, no other text, in this format:\n{"title": "[Workout Plan Title]", "duration": "[Duration in minutes]", "intensity": "[Intensity level]", "days": [{"title": "Day 1 - [Day Title]", "exercises": ["[Exercise 1]: [sets] sets x [reps] reps", "..."]}]}\n\nInclude warm-up and cool-down entries in each day's exercises. Provide 3-4 days of workouts based on the user's fitness goal and experience level."""
+
+# Compiled once; validating is then a tree walk with no per-call schema processing
+_validator = jsonschema.Draft7Validator(WORKOUT_PLAN_SCHEMA) if jsonschema is not None else None
+
+# One pass per line: optional markdown/bullets, then either a day header or an exercise line
+_LINE_RE = re.compile(r'^[ \t*#]*(?:(?P<day>DAY\s*\d+\s*-\s*.*?)|(?P<text>.*?))[ \t*\r]*$', re.IGNORECASE | re.MULTILINE)
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+
+class PlanParseError(ValueError):
+    """The model's reply contained no usable workout plan"""
+
+
+class _ParseMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'json': 0, 'fallback': 0, 'failed': 0}
+        self.invalid_json = 0
+        self.seconds_total = 0.0
+        self.seconds_max = 0.0
+
+    def record(self, path: str, elapsed: float, invalid_json: bool = False):
+        with self._lock:
+            self.counts[path] += 1
+            self.invalid_json += invalid_json
+            self.seconds_total += elapsed
+            self.seconds_max = max(self.seconds_max, elapsed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                **self.counts,
+                'invalid_json': self.invalid_json,
+                'fallback_rate': round(self.counts['fallback'] / total, 4) if total else 0.0,
+                'failure_rate': round(self.counts['failed'] / total, 4) if total else 0.0,
+                'parse_ms_avg': round(self.seconds_total / total * 1000, 3) if total else 0.0,
+                'parse_ms_max': round(self.seconds_max * 1000, 3),
+            }
+
+
+_metrics = _ParseMetrics()
+
+
+def get_parse_metrics() -> Dict[str, Any]:
+    return _metrics.snapshot()
+
+
+def _is_valid(data: Any) -> bool:
+    if _validator is not None:
+        return _validator.is_valid(data)
+    # Same constraints as WORKOUT_PLAN_SCHEMA
+    days = data.get('days') if isinstance(data, dict) else None
+    return isinstance(days, list) and bool(days) and all(
+        isinstance(day, dict) and isinstance(day.get('title'), str) and day['title']
+        and isinstance(day.get('exercises'), list) and day['exercises']
+        and all(isinstance(e, str) and e for e in day['exercises'])
+        for day in days
+    )
+
+
+def _parse_json(ai_response: str) -> Optional[List[Dict[str, Any]]]:
+    match = _JSON_OBJECT_RE.search(ai_response)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not _is_valid(data):
+        return None
+    return [{'title': day['title'].strip(), 'exercises': [e.strip() for e in day['exercises']]}
+            for day in data['days']]
+
+
+def _parse_text(ai_response: str) -> List[Dict[str, Any]]:
+    """Free-text fallback: 'DAY n - Title' headers followed by one exercise per line"""
+    days = []
+    current = None
+    for match in _LINE_RE.finditer(ai_response):
+        if match.group('day'):
+            current = {'title': match.group('day'), 'exercises': []}
+            days.append(current)
+        elif current is not None and match.group('text'):
+            current['exercises'].append(match.group('text'))
+    return [day for day in days if day['exercises']]
+
+
+def parse_workout_plan(ai_response: str, intensity: str, workout_type: str, duration: int) -> Dict[str, Any]:
+    """Parse a plan reply (JSON, or free text as a fallback) into {"plan": {...}}.
+
+    Raises PlanParseError when neither yields any days.
+    """
+    started = time.perf_counter()
+    days = _parse_json(ai_response)
+    path = 'json'
+    if days is None:
+        invalid_json = ai_response.lstrip().startswith(('{', '```'))
+        days = _parse_text(ai_response)
+        path = 'fallback' if days else 'failed'
+        _metrics.record(path, time.perf_counter() - started, invalid_json)
+    else:
+        _metrics.record(path, time.perf_counter() - started)
+
+    if not days:
+        logger.warning("No workout plan found in the model's reply")
+        raise PlanParseError("No workout plan found in the model's reply")
+    if path == 'fallback':
+        logger.info("Workout plan parsed from free text")
+
+    return {
+        "plan": {
+            "title": f"{intensity.title()} {workout_type.title()} Workout Plan",
+            "duration": f"{duration} minutes",
+            "intensity": intensity,
+            "details": {
+                "days": days
+            }
+        }
+    }
@@ -1,5 +1,6 @@
 import os
 from app import create_app
+from utils.job_queue import JobQueue
 
 # Set environment variables for production
 os.environ['FLASK_ENV'] = 'production'
@@ -12,4 +13,6 @@ os.environ['CORS_ORIGINS'] = os.getenv('CORS_ORIGINS', '*')
 app = create_app()
 
 if __name__ == '__main__':
+    # Under gunicorn the post_worker_init hook starts the job runners in each worker
+    JobQueue.get_instance().ensure_started()
     app.run(debug=True) 